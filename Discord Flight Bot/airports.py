@@ -0,0 +1,189 @@
+import bisect
+import csv
+import difflib
+import logging
+import os
+import time
+from array import array
+from string import ascii_uppercase
+from typing import NamedTuple
+
+from discord import app_commands
+from discord.ext import commands
+
+log = logging.getLogger(__name__)
+
+# IATA airports generated from the airportsdata project (MIT, see data/airports.LICENSE)
+AIRPORTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "airports.csv")
+# Discord shows at most 25 autocomplete choices
+AUTOCOMPLETE_LIMIT = 25
+
+
+class Airport(NamedTuple):
+    iata: str
+    name: str
+    city: str
+    country: str
+    lat: float
+    lon: float
+
+    def label(self) -> str:
+        place = ", ".join(part for part in (self.city, self.country) if part)
+        return f"{self.iata} · {self.name} ({place})"[:100]
+
+'''
+Read-only index over the bundled airport list. Everything lives in parallel tuples/arrays
+sorted by IATA code, so a code lookup is a bisect (O(log n)) and no per-airport objects
+are kept around. Name and city words sit in one more sorted list of (word, row) pairs so
+prefix autocomplete is a bisect plus a short scan. The file is read on the first lookup,
+not at import, so processes that never validate a code never pay for it.
+'''
+class AirportIndex:
+    def __init__(self, path: str = AIRPORTS_PATH):
+        self.path = path
+        self.codes = None
+
+    def _load(self):
+        started = time.perf_counter()
+        codes, names, cities, countries = [], [], [], []
+        lats, lons = array("d"), array("d")
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                codes.append(row["iata"])
+                names.append(row["name"])
+                cities.append(row["city"])
+                countries.append(row["country"])
+                lats.append(float(row["lat"]))
+                lons.append(float(row["lon"]))
+
+        # The file is sorted already, but don't rely on it for bisect
+        order = sorted(range(len(codes)), key=codes.__getitem__)
+        self.codes = tuple(codes[i] for i in order)
+        self.names = tuple(names[i] for i in order)
+        self.cities = tuple(cities[i] for i in order)
+        self.countries = tuple(countries[i] for i in order)
+        self.lats = array("d", (lats[i] for i in order))
+        self.lons = array("d", (lons[i] for i in order))
+
+        words = set()
+        for i, (name, city) in enumerate(zip(self.names, self.cities)):
+            for word in f"{city} {name}".lower().replace("-", " ").split():
+                words.add((word, i))
+        self._words = sorted(words)
+        log.info("airports loaded count=%d ms=%.1f", len(self.codes), (time.perf_counter() - started) * 1000)
+
+    def _ready(self):
+        if self.codes is None:
+            self._load()
+
+    def __len__(self) -> int:
+        self._ready()
+        return len(self.codes)
+
+    def _index(self, code: str) -> int | None:
+        i = bisect.bisect_left(self.codes, code)
+        return i if i < len(self.codes) and self.codes[i] == code else None
+
+    def _airport(self, i: int) -> Airport:
+        return Airport(self.codes[i], self.names[i], self.cities[i], self.countries[i], self.lats[i], self.lons[i])
+
+    def is_valid(self, code: str) -> bool:
+        self._ready()
+        return self._index(code.strip().upper()) is not None
+
+    def get(self, code: str) -> Airport | None:
+        self._ready()
+        i = self._index(code.strip().upper())
+        return None if i is None else self._airport(i)
+
+    def _code_prefix(self, prefix: str) -> range:
+        lo = bisect.bisect_left(self.codes, prefix)
+        hi = bisect.bisect_left(self.codes, prefix + "\x7f")
+        return range(lo, hi)
+
+    def _word_prefix(self, prefix: str) -> list[int]:
+        lo = bisect.bisect_left(self._words, (prefix,))
+        hi = bisect.bisect_left(self._words, (prefix + "\x7f",))
+        return [i for _, i in self._words[lo:hi]]
+
+    def close_codes(self, code: str, n: int = 3) -> list[str]:
+        # Codes one typo away: a swapped pair of letters or one wrong letter
+        self._ready()
+        code = code.strip().upper()
+        if len(code) != 3:
+            return []
+        candidates = [code[1] + code[0] + code[2], code[0] + code[2] + code[1]]
+        for pos in range(3):
+            candidates += [code[:pos] + letter + code[pos + 1:] for letter in ascii_uppercase if letter != code[pos]]
+        found = []
+        for candidate in candidates:
+            if candidate != code and candidate not in found and self._index(candidate) is not None:
+                found.append(candidate)
+        return found[:n]
+
+    def search(self, text: str, limit: int = AUTOCOMPLETE_LIMIT) -> list[Airport]:
+        # Exact code, then code prefix, then name/city word prefix, then near misses
+        text = text.strip()
+        if not text:
+            return []
+        self._ready()
+        hits, seen = [], set()
+
+        def take(indexes):
+            for i in indexes:
+                if len(hits) >= limit:
+                    return
+                if i is not None and i not in seen:
+                    seen.add(i)
+                    hits.append(i)
+
+        upper = text.upper()
+        if len(upper) <= 3 and upper.isalpha():
+            take(self._code_prefix(upper))
+
+        # A single letter matches thousands of words, codes are enough there.
+        # Text that is only separators ("--") has no words and, not being letters, no code either
+        words = text.lower().replace("-", " ").split()
+        if not words:
+            return []
+        if len(text) > 1:
+            matches = set(self._word_prefix(words[-1]))
+            for word in words[:-1]:
+                matches &= set(self._word_prefix(word))
+            # City matches first, then real airports: the dataset also has heliports and strips
+            lowered = text.lower()
+            take(sorted(matches, key=lambda i: (
+                not self.cities[i].lower().startswith(lowered),
+                "international" not in self.names[i].lower(),
+                self.cities[i],
+                self.codes[i]
+            )))
+
+        if len(upper) == 3 and self._index(upper) is None:
+            take(self._index(code) for code in self.close_codes(upper))
+        if not hits and len(words) == 1:
+            first = words[0][:1]
+            pool = sorted({word for word, _ in self._words[bisect.bisect_left(self._words, (first,)):bisect.bisect_left(self._words, (first + "\x7f",))]})
+            for word in difflib.get_close_matches(words[0], pool, n=3, cutoff=0.75):
+                take(self._word_prefix(word))
+        return [self._airport(i) for i in hits]
+
+
+airports = AirportIndex()
+
+'''
+Command argument type for IATA codes. Unknown codes are rejected here, before the command
+runs, so a typo never costs a SerpAPI call or ends up saved in the database
+'''
+class AirportCode(commands.Converter):
+    async def convert(self, ctx, argument: str) -> str:
+        code = argument.strip().upper()
+        if airports.is_valid(code):
+            return code
+        close = airports.close_codes(code)
+        hint = f" Did you mean {', '.join(f'`{c}`' for c in close)}?" if close else ""
+        raise commands.BadArgument(f"`{argument}` isn't an airport code I know.{hint}")
+
+
+async def airport_autocomplete(interaction, current: str) -> list[app_commands.Choice[str]]:
+    return [app_commands.Choice(name=airport.label(), value=airport.iata) for airport in airports.search(current)]
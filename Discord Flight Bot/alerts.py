@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, UTC
+
+import db
+import history
+import metrics
+from batching import writes
+from config import env_flag, env_int
+from fingerprints import fingerprints
+from quota import BACKGROUND
+from tracking_index import route_key, tracking
+from utils import fetch_flights, roundtrip_params
+
+log = logging.getLogger(__name__)
+
+# How many unique routes we search at the same time during an alert run
+ALERT_CONCURRENCY = env_int("ALERT_CONCURRENCY", 4, minimum=1)
+# Skip the per-user work on routes whose offers haven't changed since the last check
+# (see fingerprints.py). ALERT_INCREMENTAL=0 evaluates every row every time
+ALERT_INCREMENTAL = env_flag("ALERT_INCREMENTAL", True)
+
+
+def route_params(departure_id: str, arrival_id: str, length_of_vacation: int) -> dict:
+    # Re-search starting today with the same trip length the user originally picked
+    todays_date = date.today()
+    new_return_date = todays_date + timedelta(days=length_of_vacation)
+
+    return roundtrip_params(
+        departure_id,
+        arrival_id,
+        todays_date.strftime("%Y-%m-%d"),
+        new_return_date.strftime("%Y-%m-%d")
+    )
+
+
+async def fetch_routes(route_keys, concurrency: int = ALERT_CONCURRENCY) -> dict:
+    # One search per unique route, at most `concurrency` in flight at once
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def fetch_one(key):
+        async with semaphore:
+            try:
+                results[key] = await fetch_flights(route_params(*key), max_price=None, priority=BACKGROUND, feature="alerts")
+            except Exception as e:
+                log.error("alert search failed route=%s-%s length=%s error=%s", key[0], key[1], key[2], e)
+
+    await asyncio.gather(*(fetch_one(key) for key in route_keys))
+    return results
+
+'''
+Checks the given FlightTracking rows. Rows are grouped by route_key so each unique
+route is searched once, then the results are fanned out to every user on that route.
+`notify(row, route_key, matching_flights, g_url)` is called for each row that has
+flights under its max price, and `notify(..., drop=reason)` with the cheapest flights
+when the route's price falls well under its recent history (see history.detect_drop)
+even if it is still above max_price. Rows already checked against the same offers
+(unchanged route fingerprint, same max_price) are only marked checked, their answer
+can't have changed. The row dicts are updated in place (last_checked, last_price,
+alert_sent) and a small stats dict for the run is returned. alert_sent is only set in
+memory here, and the tracking index holds the row out (even from a sync) while its alert
+is queued; notify's side stores it once the alert is delivered and reopens the row if
+delivery fails.
+'''
+async def check_rows(rows: list[dict], notify) -> dict:
+    started = time.perf_counter()
+    started_at = datetime.now(UTC).isoformat()
+
+    by_route = defaultdict(list)
+    for row in rows:
+        by_route[route_key(row)].append(row)
+
+    route_results = await fetch_routes(by_route.keys())
+
+    alerts_sent = 0
+    drops_sent = 0
+    routes_unchanged = 0
+    rows_skipped = 0
+    history_skipped = 0
+    for key, route_rows in by_route.items():
+        if key not in route_results:
+            # Search failed, leave last_checked alone so these rows get picked up next run
+            continue
+
+        matching_flights, offers, g_url = route_results[key]
+        fingerprint, changed = fingerprints.observe(key, offers)
+        last_price = fingerprint.min_price
+        checked_at = datetime.now(UTC).isoformat()
+
+        to_check = route_rows
+        if not changed and ALERT_INCREMENTAL:
+            routes_unchanged += 1
+            to_check = [row for row in route_rows if fingerprint.evaluated.get(row["id"]) != row["max_price"]]
+            rows_skipped += len(route_rows) - len(to_check)
+
+        for row in route_rows:
+            writes.mark_checked(row["id"], last_price=last_price)
+            row["last_checked"] = checked_at
+            row["last_price"] = last_price
+
+        drop = None
+        if not to_check:
+            # Same offers as last time, the history lookup would only find the same drop again
+            if last_price is not None:
+                history_skipped += 1
+        elif last_price is not None:
+            try:
+                earlier = await history.route_history(key[0], key[1], trip_length=key[2], before=started_at)
+                drop = history.detect_drop(earlier, last_price)
+            except Exception as e:
+                log.warning("price history lookup failed route=%s-%s error=%s", key[0], key[1], e)
+
+        for row in to_check:
+            max_price = row["max_price"]
+            matching_flights_for_user = [offer for offer in matching_flights if offer.under(max_price)]
+
+            # Nothing under price yet, but tell them if the price just fell a lot
+            if not matching_flights_for_user:
+                fingerprint.evaluated[row["id"]] = max_price
+                if drop:
+                    cheapest = sorted((o for o in offers if o.price is not None), key=lambda o: o.price)
+                    await notify(row, key, cheapest, g_url, drop=drop)
+                    drops_sent += 1
+                continue
+
+            await notify(row, key, matching_flights_for_user, g_url)
+            row["alert_sent"] = True
+            tracking.alerting(row["id"])
+            alerts_sent += 1
+
+    # Make sure last_checked / last_price are stored before the run is reported as done
+    await writes.flush()
+
+    metrics.incr("alerts.routes_unchanged", routes_unchanged)
+    metrics.incr("alerts.rows_skipped", rows_skipped)
+    metrics.incr("alerts.db_requests_avoided", history_skipped)
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "rows": len(rows),
+        "routes": len(by_route),
+        "api_calls": len(by_route),
+        "alerts_sent": alerts_sent,
+        "drops_sent": drops_sent,
+        "routes_unchanged": routes_unchanged,
+        "rows_skipped": rows_skipped,
+        "db_requests_avoided": history_skipped,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(len(rows) / elapsed, 1) if elapsed else 0.0,
+        "api_calls_per_row": round(len(by_route) / len(rows), 3) if rows else 0.0
+    }
+    log.debug("checked rows %s", " ".join(f"{k}={v}" for k, v in stats.items()))
+    return stats
+
+
+async def run_alert_check(notify) -> dict:
+    # One pass over every pending row, handy for a manual or one-off full sweep
+    rows = tracking.pending() if tracking.loaded else await db.list_pending_alerts()
+    stats = await check_rows(rows, notify)
+    log.info("alert run finished %s", " ".join(f"{k}={v}" for k, v in stats.items()))
+    return stats
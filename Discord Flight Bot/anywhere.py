@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+from cache import cached_search, fare_cache
+from config import env_float, env_int
+from models import Offer
+from quota import quota
+from utils import oneway_params, roundtrip_params
+
+log = logging.getLogger(__name__)
+
+# How many destinations of a group we search at the same time
+ANYWHERE_CONCURRENCY = env_int("ANYWHERE_CONCURRENCY", 4, minimum=1)
+# Stop once this many destinations have a price, searches still queued or running are cancelled
+ANYWHERE_ENOUGH = env_int("ANYWHERE_ENOUGH", 8, minimum=1)
+# Hard cap on how long one !anywhere waits for upstream searches
+ANYWHERE_TIMEOUT = env_float("ANYWHERE_TIMEOUT", 45, minimum=0)
+
+
+class Fare(NamedTuple):
+    price: int
+    destination: str
+    offer: Offer
+    google_flights_url: str
+
+
+@dataclass(slots=True)
+class AnywhereResult:
+    origin: str
+    group: str
+    outbound_date: str
+    return_date: str | None
+    fares: list = field(default_factory=list)    # Fare, cheapest first once the search is done
+    searched: int = 0
+    cached: int = 0
+    cancelled: int = 0
+    failed: int = 0
+    stale: int = 0
+
+    def add(self, destination: str, result):
+        self.stale += result.stale
+        offers = result.cheapest(1)
+        if offers and offers[0].price is not None:
+            self.fares.append(Fare(offers[0].price, destination, offers[0], result.google_flights_url))
+
+'''
+Cheapest trip from one airport to every destination in a group (a region from
+data/regions.json or a list of codes). Destinations already in the fare cache are priced
+for free; the rest fan out ANYWHERE_CONCURRENCY at a time in the group's order (most
+popular first). Once ANYWHERE_ENOUGH destinations have a price, or ANYWHERE_TIMEOUT runs
+out, everything still pending is cancelled, which also pulls it out of the quota queue.
+The user's rate limit is charged once for the whole command, not once per destination.
+'''
+async def search_anywhere(origin: str, group: str, destinations: list[str], outbound_date: str,
+                          return_date: str | None = None, user_id: str | None = None,
+                          enough: int = ANYWHERE_ENOUGH) -> AnywhereResult:
+    origin = origin.upper()
+    result = AnywhereResult(origin, group, outbound_date, return_date)
+    query_type = "roundtrip" if return_date else "oneway"
+    semaphore = asyncio.Semaphore(ANYWHERE_CONCURRENCY)
+
+    async def search_one(destination, params):
+        async with semaphore:
+            result.searched += 1
+            return destination, await cached_search(params, query_type, feature="anywhere")
+
+    pending = []
+    for destination in dict.fromkeys(d.upper() for d in destinations):
+        if destination == origin:
+            continue
+        if return_date:
+            params = roundtrip_params(origin, destination, outbound_date, return_date)
+        else:
+            params = oneway_params(origin, destination, outbound_date)
+        cached = fare_cache.peek(params, feature="anywhere")
+        if cached is not None:
+            result.cached += 1
+            result.add(destination, cached)
+        else:
+            pending.append((destination, params))
+
+    tasks = set()
+    if len(result.fares) < enough:
+        if pending and user_id is not None:
+            await quota.charge_user(user_id)
+        tasks = {asyncio.ensure_future(search_one(destination, params)) for destination, params in pending}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + ANYWHERE_TIMEOUT
+    remaining = set(tasks)
+    try:
+        while remaining and len(result.fares) < enough:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                log.info("anywhere search timed out origin=%s group=%s", origin, group)
+                break
+            done, remaining = await asyncio.wait(remaining, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    result.failed += 1
+                    log.warning("anywhere search failed origin=%s error=%s", origin, task.exception())
+                else:
+                    result.add(*task.result())
+    finally:
+        # Enough results (or out of time): nobody is waiting for the rest
+        for task in remaining:
+            task.cancel()
+        result.cancelled = len(pending) - len(tasks) + len(remaining)
+        await asyncio.gather(*remaining, return_exceptions=True)
+
+    result.fares.sort(key=lambda fare: fare.price)
+    log.info(
+        "anywhere search origin=%s group=%s destinations=%d priced=%d searched=%d cached=%d cancelled=%d",
+        origin, group, len(pending) + result.cached, len(result.fares), result.searched, result.cached, result.cancelled
+    )
+    return result
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, UTC
+
+import db
+from config import env_float, env_int
+
+log = logging.getLogger(__name__)
+
+# Flush once this many writes are pending, or every BATCH_FLUSH_SECONDS, whichever comes first
+BATCH_FLUSH_SIZE = env_int("BATCH_FLUSH_SIZE", 500, minimum=1)
+BATCH_FLUSH_SECONDS = env_float("BATCH_FLUSH_SECONDS", 10, minimum=0)
+
+'''
+Write-behind buffer for alert bookkeeping. last_checked / alert_sent changes are merged
+per row and written as a handful of bulk `update ... where id in (...)` calls (one per
+distinct set of values), and TodaysDeals / PriceHistory / AlertDelivery rows go out as one bulk insert
+each, so a run costs O(1) round trips per batch instead of one or two per row.
+'''
+class WriteBehind:
+    def __init__(self, flush_size: int = BATCH_FLUSH_SIZE, flush_seconds: float = BATCH_FLUSH_SECONDS):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._tracking = {}     # row id -> fields to set
+        self._deals = []
+        self._prices = []
+        self._deliveries = []
+        self._lock = asyncio.Lock()
+        self._timer = None
+        self._flush_task = None
+        self.round_trips = 0
+
+    def pending(self) -> int:
+        return len(self._tracking) + len(self._deals) + len(self._prices) + len(self._deliveries)
+
+    def _changed(self):
+        if self.pending() >= self.flush_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._arm_timer()
+
+    def _arm_timer(self):
+        self._timer = asyncio.get_running_loop().call_later(self.flush_seconds, self._start_flush)
+
+    def _start_flush(self):
+        # At most one background flush at a time, writes made while it runs go in the next one
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_in_background())
+
+    async def _flush_in_background(self):
+        # Writes that piled up past flush_size during a flush go out right after it,
+        # unless it failed, then its retry timer takes over
+        while await self.flush() and self.pending() >= self.flush_size:
+            pass
+
+    def mark_checked(self, row_id, checked_at: str | None = None, last_price: int | None = None):
+        # Without an explicit time every row in the batch gets the flush time, so they share one update
+        fields = self._tracking.setdefault(row_id, {})
+        fields["last_checked"] = checked_at
+        if last_price is not None:
+            fields["last_price"] = last_price
+        self._changed()
+
+    def mark_alerted(self, row_id):
+        self._tracking.setdefault(row_id, {})["alert_sent"] = True
+        self._changed()
+
+    def release(self, row_id, next_check_at: float):
+        # Hand a claimed row back (worker mode). Due times are rounded up to 5 minutes so rows
+        # released in the same batch mostly share one update
+        due = datetime.fromtimestamp(-(-next_check_at // 300) * 300, UTC).isoformat()
+        fields = self._tracking.setdefault(row_id, {})
+        fields.update(next_check_at=due, claimed_by=None, claimed_until=None)
+        self._changed()
+
+    def add_deals(self, rows: list[dict]):
+        self._deals.extend(rows)
+        self._changed()
+
+    def add_price_observation(self, row: dict):
+        self._prices.append(row)
+        self._changed()
+
+    def add_delivery(self, row: dict):
+        self._deliveries.append(row)
+        self._changed()
+
+    async def flush(self) -> bool:
+        # False if the write failed and everything was put back for a retry
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            tracking, self._tracking = self._tracking, {}
+            deals, self._deals = self._deals, []
+            prices, self._prices = self._prices, []
+            deliveries, self._deliveries = self._deliveries, []
+            if not tracking and not deals and not prices and not deliveries:
+                return True
+
+            now = datetime.now(UTC).isoformat()
+            groups = defaultdict(list)
+            for row_id, fields in tracking.items():
+                if "last_checked" in fields and fields["last_checked"] is None:
+                    fields["last_checked"] = now
+                groups[tuple(sorted(fields.items()))].append(row_id)
+
+            try:
+                for fields, ids in groups.items():
+                    await db.update_tracking_many(ids, dict(fields))
+                    self.round_trips += 1
+                if deals:
+                    await db.insert_deals(deals)
+                    self.round_trips += 1
+                    deals = []
+                if prices:
+                    await db.insert_price_history(prices)
+                    self.round_trips += 1
+                    prices = []
+                if deliveries:
+                    await db.insert_deliveries(deliveries)
+                    self.round_trips += 1
+                    deliveries = []
+            except Exception as e:
+                # Put everything back so the next flush retries it
+                for row_id, fields in tracking.items():
+                    self._tracking[row_id] = {**fields, **self._tracking.get(row_id, {})}
+                self._deals = deals + self._deals
+                self._prices = prices + self._prices
+                self._deliveries = deliveries + self._deliveries
+                self._arm_timer()
+                log.warning("batched write failed, will retry rows=%d deals=%d prices=%d error=%s", len(tracking), len(deals), len(prices), e)
+                return False
+            return True
+
+
+writes = WriteBehind()
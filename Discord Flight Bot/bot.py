@@ -1,199 +1,193 @@
-import os
+import logging
 import discord
 import random
-from utils import fetch_roundtrip_flight, fetch_cheapest_oneway_flight, add_flight_info_to_supabase, fetch_user_home_airport, pick_random_destination, cached_deal_destination, fetch_flights
+import time
+import db
+from airports import AirportCode, airport_autocomplete, airports
+import anywhere
+import metrics
+from cache import fare_cache
+from batching import writes
+from quota import quota
+import deals
+import history
+import matrix
+import render
+from config import ConfigError, configure_logging, env_int
+from notifications import DELIVERY_CHANNEL, DELIVERY_DM, DELIVERY_HERE, dispatcher
+from scheduler import scheduler
+from tracking_index import TRACKING_SYNC_MINUTES, tracking
+from user_settings import user_settings
+from services import services
+from views import OfferPages, Paginator, TrackingPages
+from utils import find_region, load_regions, fetch_roundtrip_flight, add_flight_info_to_supabase, fetch_user_home_airport, roundtrip_params
 from datetime import date,datetime, timedelta, timezone as tz
+from discord import app_commands
 from discord.ext import commands, tasks
-from dotenv import load_dotenv
-from supabase import create_client
-from serpapi import GoogleSearch
-from collections import defaultdict
 
 
-# Load .env vars
-load_dotenv()
-DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-SERPA_API_KEY = os.getenv("SERPA_AP_KEY")
-ALERTS_CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID"))
+DEALS_PER_REGION = env_int("DEALS_PER_REGION", 3, minimum=1)
 
-# Init Supabase
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+log = logging.getLogger("bot")
 
 # Discord Bot Setup
 intents = discord.Intents.default()
 intents.message_content = True  # Required to read message contents
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+
+class TimedContext(commands.Context):
+    # Every ctx.send in a command shows up under the "send" stage
+    async def send(self, *args, **kwargs):
+        with metrics.timer("send"):
+            return await super().send(*args, **kwargs)
+
+class FlightBot(commands.Bot):
+    async def get_context(self, origin, *, cls=TimedContext):
+        return await super().get_context(origin, cls=cls)
+
+    async def setup_hook(self):
+        # Register the slash versions of the hybrid commands so airport autocomplete shows up
+        synced = await self.tree.sync()
+        log.info("slash commands synced count=%d", len(synced))
+        # Hear about settings changed by other processes so cached ones never go stale
+        await user_settings.listen()
+        # Read the tracked rows once here, sync_tracking only picks up changes after that.
+        # If the database is down, !my_flights reads it directly until the first sync loads it
+        try:
+            await tracking.load()
+        except Exception as e:
+            log.warning("could not load the tracking index, the next sync will error=%s", e)
+
+    async def close(self):
+        # Don't lose queued alerts, buffered bookkeeping writes or usage counters on shutdown
+        await dispatcher.drain()
+        await writes.flush()
+        await quota.flush_usage()
+        await super().close()
+
+bot = FlightBot(command_prefix='!', intents=intents, help_command=None)
 UTC = tz.utc  # if you already have UTC imported, keep yours
 
 # Turning the bot on 
 @bot.event
 async def on_ready():
-    print(f"✅ Bot {bot.user} is now running!")
-    if not run_weekly_alerts.is_running():
-        run_weekly_alerts.start()
+    # BOT_MODE "all" runs the price checks in this process too, "gateway" leaves them to worker.py processes
+    bot_mode = services.settings.bot_mode
+    log.info("bot running user=%s mode=%s", bot.user, bot_mode)
+    dispatcher.start(bot)
+    if not sync_tracking.is_running():
+        sync_tracking.start()
+    if bot_mode == "all" and not run_price_checks.is_running():
+        run_price_checks.start()
+    if not flush_api_usage.is_running():
+        flush_api_usage.start()
+    if not refresh_deals.is_running():
+        await deals.load_deals_board()
+        refresh_deals.start()
 
 '''
-Need to finish this function to send alerts based on if there are flights now in the users picked max price range
+Re-prices the deals board in the background so !todays_deals is a pure read
 '''
-@tasks.loop(hours=168)
-async def run_weekly_alerts():
-    channel = bot.get_channel(ALERTS_CHANNEL_ID)
-    if channel is None:
-        print("⚠️ ALERTS_CHANNEL_ID not found or bot lacks permission.")
-        return
-
-    # Pull all candidates that still need alerts
-    resp = supabase.table("FlightTracking").select("*").eq("alert_sent", False).execute()
-    data = resp.data or []
-    if not data:
-        print("ℹ️ No rows to check this run.")
-        return
+@tasks.loop(hours=deals.DEALS_REFRESH_HOURS)
+async def refresh_deals():
+    with metrics.timer("job.refresh_deals"):
+        await deals.refresh_deals_board()
 
-    # Group by user_id and pick ONE row per user (oldest last_checked, then earliest outbound_date)
-    by_user = defaultdict(list)
-    for r in data:
-        by_user[r["user_id"]].append(r)
-
-    def pick_one(rows):
-        return sorted(
-            rows,
-            key=lambda r: (
-                r.get("last_checked") or "1970-01-01T00:00:00Z",
-                r.get("outbound_date") or "9999-12-31",
-            )
-        )[0]
-
-    rows_one_per_user = [pick_one(rows) for rows in by_user.values()]
-
-    # Build a route cache so we only call SerpAPI once per (dep, arr, trip_length_days)
-    route_cache = {}  # key -> (matching_flights, flights_raw, g_url)
-    rows_one_per_user = rows_one_per_user[:1]
-    for first_row in rows_one_per_user:
-        # --- your original block starts here (kept as intact as possible) ---
-
-        departure_id = first_row["departure_id"]
-        arrival_id = first_row["arrival_id"]
-        max_price = first_row["max_price"]
-
-        outbound = datetime.fromisoformat(first_row["outbound_date"])
-        return_  = datetime.fromisoformat(first_row["return_date"])
-        original_length_of_vacation = (return_ - outbound).days
-
-        # Calculate the new dates for the params we will pass
-        todays_date = date.today()
-        new_return_date = todays_date + timedelta(days=original_length_of_vacation)
-
-        params = {
-            "engine": "google_flights",
-            "departure_id": departure_id,
-            "arrival_id":   arrival_id,
-            "outbound_date": todays_date.strftime("%Y-%m-%d"),
-            "return_date":   new_return_date.strftime("%Y-%m-%d"),
-            "currency": "USD",
-            "hl": "en",
-            "api_key": SERPA_API_KEY
-        }
-
-        # --- end of your param build ---
-
-        # 3a) Dedupe: use a key so multiple users on same route/length reuse one API call
-        route_key = (departure_id, arrival_id, original_length_of_vacation)
-
-        if route_key not in route_cache:
-            # one real API call for this route/length
-            matching_flights, flights_raw, g_url = await fetch_flights(params, max_price=None)
-            route_cache[route_key] = (matching_flights, flights_raw, g_url)
-
-        # Pull cached result and apply the user’s max price filter locally
-        matching_flights, flights_raw, g_url = route_cache[route_key]
-        matching_flights_for_user = [f for f in (matching_flights or []) if f.get("price", 10**9) <= max_price]
-
-        # Always update last_checked
-        supabase.table("FlightTracking").update({
-            "last_checked": datetime.now(UTC).isoformat()
-        }).eq("id", first_row["id"]).execute()
-
-        # If nothing under price for this user, skip sending
-        if not matching_flights_for_user:
-            continue
+'''
+Saves the SerpAPI call / cache hit counters so usage and budgets survive restarts
+'''
+@tasks.loop(minutes=5)
+async def flush_api_usage():
+    with metrics.timer("job.flush_api_usage"):
+        await quota.flush_usage()
 
-        # --- your embed build & send (kept, minimal edits) ---
-        embed = discord.Embed(
-            title=f"🎯 Great news we found flights within your price of ${max_price} from {departure_id} → {arrival_id}",
-            description=f"Found {len(matching_flights_for_user)} flights under your threshold:",
-            color=discord.Color.green()
-        )
+'''
+Picks up FlightTracking rows that other processes added or alerted, reading only what
+changed since the last sync instead of the whole table
+'''
+@tasks.loop(minutes=TRACKING_SYNC_MINUTES)
+async def sync_tracking():
+    with metrics.timer("job.sync_tracking"):
+        try:
+            await scheduler.sync()
+        except Exception as e:
+            log.warning("tracking sync failed, retrying next round error=%s", e)
 
-        for flight_data in matching_flights_for_user[:3]:
-            flight_segments = []
-            for leg in flight_data.get("flights", []):
-                airline = leg.get("airline", "Unknown Airline")
-                flight_number = leg.get("flight_number", "N/A")
-                dep = leg.get("departure_airport", {})
-                arr = leg.get("arrival_airport", {})
-                flight_segments.append(
-                    f"✈️ **{airline} {flight_number}**\n"
-                    f"{dep.get('name')} ({dep.get('id')}) → {arr.get('name')} ({arr.get('id')})\n"
-                    f"🕒 {dep.get('time')} → {arr.get('time')}"
-                )
-
-            segment_text = "\n\n".join(flight_segments)
-            embed.add_field(
-                name=f"💵 ${flight_data.get('price', '?')} | 🧭 Duration: {flight_data.get('total_duration')} min",
-                value=segment_text,
-                inline=False
-            )
-
-        if g_url:
-            embed.add_field(name="🔗 View on Google Flights", value=f"[Open Link]({g_url})", inline=False)
-
-        embed.set_footer(text="Powered by SerpAPI + Google Flights")
-        await channel.send(embed=embed)
-
-        # Optional: mark as alerted so you don’t spam next run
-        supabase.table("FlightTracking").update({
-            "alert_sent": True
-        }).eq("id", first_row["id"]).execute()
+'''
+Continuous price monitoring. Every minute the scheduler checks the most overdue routes,
+so checks are spread over the week instead of all landing in one weekly burst
+'''
+@tasks.loop(minutes=1)
+async def run_price_checks():
+    with metrics.timer("job.run_price_checks"):
+        await scheduler.tick(dispatcher.notify)
 
 '''
 Function to set the default home airport for a specific user
 '''
-@bot.command(name = "set_home")
-async def add_home_airport(ctx, home_airport: str): 
+@bot.hybrid_command(name = "set_home", description="Set your hometown airport")
+@app_commands.autocomplete(home_airport=airport_autocomplete)
+async def add_home_airport(ctx, home_airport: AirportCode): 
     user_id = str(ctx.author.id)
     
     #Adding the home airport into the UserSettings table along with the ability for it to be updated
-    supabase.table("UserSetting").upsert({
-        "user_id": user_id,
-        "home_airport": home_airport.upper()
-    }, on_conflict=["user_id"]).execute()
+    await user_settings.set_home_airport(user_id, home_airport)
 
-    await ctx.send(f"Your hometown airport has been updated to `{home_airport.upper()}`.")
+    await ctx.send(f"Your hometown airport has been updated to `{home_airport}`.")
+
+'''
+Command to pick where price alerts go: the shared alerts channel, a DM, or the channel
+the command is run in
+'''
+@bot.hybrid_command(name = "alerts_to", description="Choose where your price alerts are sent")
+@app_commands.choices(where=[
+    app_commands.Choice(name="The shared alerts channel", value=DELIVERY_CHANNEL),
+    app_commands.Choice(name="Direct message", value=DELIVERY_DM),
+    app_commands.Choice(name="This channel", value=DELIVERY_HERE),
+])
+async def alerts_to(ctx, where: str):
+    where = where.lower()
+    if where not in (DELIVERY_CHANNEL, DELIVERY_DM, DELIVERY_HERE):
+        await ctx.send("⚠️ Pick `channel`, `dm` or `here`.")
+        return
+
+    channel_id = str(ctx.channel.id) if where == DELIVERY_HERE else None
+    await user_settings.set_alert_delivery(str(ctx.author.id), where, channel_id)
+    destination = {
+        DELIVERY_CHANNEL: "the shared alerts channel",
+        DELIVERY_DM: "your DMs",
+        DELIVERY_HERE: "this channel"
+    }[where]
+    await ctx.send(f"🔔 Your price alerts will now be sent to {destination}.")
 
 '''
 Main function to lookup flights, if a user tries to lookup a flight with a max price and there is nothing
 that meets that criteria at the time then the flight is added to the database and the user is shown the 
-best flights currently available
+best flights currently available.
+If outbound_date is a window like 2026-11-01..2026-11-14 then return_date is read as the trip length
+(7, 5-9 or 5,7,9) and we answer with a price calendar instead
 '''
-@bot.command(name = "lookup_flight")
-async def search_flight(ctx, departure_id: str, arrival_id: str, outbound_date: str, return_date: str, max_price: int):
+@bot.hybrid_command(name = "lookup_flight", description="Look up a round trip and track it until it drops under your price")
+@app_commands.autocomplete(departure_id=airport_autocomplete, arrival_id=airport_autocomplete)
+async def search_flight(ctx, departure_id: AirportCode, arrival_id: AirportCode, outbound_date: str, return_date: str, max_price: int):
+    try:
+        window = matrix.parse_date_window(outbound_date)
+        lengths = matrix.parse_trip_lengths(return_date) if window else None
+    except matrix.DateWindowError as e:
+        await ctx.send(f"⚠️ {e}")
+        return
+    if window:
+        await search_flight_window(ctx, departure_id, arrival_id, window, lengths, max_price)
+        return
+
     await ctx.send(f"🔍 Searching for flights from `{departure_id}` to `{arrival_id}` under **${max_price}**...")
 
-    params = {
-        "engine": "google_flights",
-        "departure_id": departure_id.upper(),
-        "arrival_id": arrival_id.upper(),
-        "outbound_date": outbound_date,
-        "return_date": return_date,
-        "currency": "USD",
-        "hl": "en",
-        "api_key": SERPA_API_KEY
-    }
+    params = roundtrip_params(departure_id, arrival_id, outbound_date, return_date)
 
     try:
-        matching_flights, flights_raw, flights_url = await fetch_roundtrip_flight(ctx, params, max_price)
+        results = await fetch_roundtrip_flight(ctx, params)
+        if results is None:
+            return
+        matching_flights, flights_raw, flights_url = results.matching(max_price), results.offers, results.google_flights_url
 
         # If no flights match, save to Supabase and show best price
         if not matching_flights:
@@ -202,47 +196,87 @@ async def search_flight(ctx, departure_id: str, arrival_id: str, outbound_date:
             best = flights_raw[0]
             matching_flights = [best]
 
-            embed = discord.Embed(
-                title="💡 No flights under your price range",
-                description="We've saved your search and will check again weekly. Here's the current best flights:",
-                color=discord.Color.orange()
-            )
+            title = "💡 No flights under your price range"
+            description = "We've saved your search and will keep checking the price. Here's the current best flights:"
+            color = discord.Color.orange()
         else:
-            embed = discord.Embed(
-                title=f"🎯 Flights Under ${max_price}",
-                description=f"Found {len(matching_flights)} flights under your threshold:",
-                color=discord.Color.green()
-            )
-
-        # Display up to 3 flights
-        for flight_data in matching_flights[:3]:
-            flight_segments = []
-            for leg in flight_data.get("flights", []):
-                airline = leg.get("airline", "Unknown Airline")
-                flight_number = leg.get("flight_number", "N/A")
-                dep = leg.get("departure_airport", {})
-                arr = leg.get("arrival_airport", {})
-                flight_segments.append(
-                    f"✈️ **{airline} {flight_number}**\n"
-                    f"{dep.get('name')} ({dep.get('id')}) → {arr.get('name')} ({arr.get('id')})\n"
-                    f"🕒 {dep.get('time')} → {arr.get('time')}"
-                )
-
-            segment_text = "\n\n".join(flight_segments)
-            embed.add_field(
-                name=f"💵 ${flight_data.get('price', '?')} | 🧭 Duration: {flight_data.get('total_duration')} min",
-                value=segment_text,
-                inline=False
-            )
-        
-        if flights_url:
-            embed.add_field(name="🔗 View on Google Flights", value=f"[Open Link]({flights_url})", inline=False)
-
-        embed.set_footer(text="Powered by SerpAPI + Google Flights")
-        await ctx.send(embed=embed)
+            title = f"🎯 Flights Under ${max_price}"
+            description = f"Found {len(matching_flights)} flights under your threshold:"
+            color = discord.Color.green()
+
+        # OFFERS_PER_PAGE flights at a time, the rest are formatted only if the user pages to them
+        route = (params["departure_id"], params["arrival_id"], outbound_date, return_date)
+        pages = OfferPages(title, description + render.stale_note(results), color, route, matching_flights, flights_url)
+        await Paginator(pages, ctx.author.id).start(ctx)
 
     except Exception as e:
-        await ctx.send(f"⚠️ API error: {e}")
+        log.error("lookup_flight failed error=%s", e, exc_info=e)
+        await ctx.send("⚠️ Something went wrong while looking up that flight, please try again.")
+
+async def search_flight_window(ctx, departure_id, arrival_id, window, lengths, max_price):
+    start, end = window
+    await ctx.send(f"📅 Searching the cheapest dates from `{departure_id}` to `{arrival_id}` between {start} and {end}...")
+
+    result = await matrix.search_matrix(departure_id, arrival_id, start, end, lengths, user_id=str(ctx.author.id))
+    best = result.best(1)
+    if not best:
+        await ctx.send("❌ No flights found for those dates.")
+        return
+
+    # Nothing under budget yet, track the route at the cheapest trip length. Like every tracked
+    # row, the price checks search it from the current date (see alerts.route_params), not on
+    # the dates picked here
+    outbound, length, price = best[0]
+    await ctx.send(embed=render.matrix_embed(result, max_price))
+    if price > max_price:
+        return_date = (outbound + timedelta(days=length)).isoformat()
+        await add_flight_info_to_supabase(ctx, departure_id, arrival_id, outbound.isoformat(), return_date, max_price)
+        await ctx.send(f"👀 Nothing under **${max_price}** yet. We'll keep checking {length}-day round trips from "
+                       f"`{result.departure_id}` to `{result.arrival_id}`, searched from the day of each check, and alert you when one drops under it.")
+
+async def region_autocomplete(interaction, current: str) -> list[app_commands.Choice[str]]:
+    current = current.strip().lower()
+    return [app_commands.Choice(name=name, value=name) for name in load_regions() if current in name.lower()][:25]
+
+'''
+Finds the cheapest trip from your home airport (or `origin`) to anywhere in a region,
+or to a comma separated list of airports. Leave out return_date for one-way fares
+'''
+@bot.hybrid_command(name = "anywhere", description="Cheapest trip from your home airport to anywhere in a region")
+@app_commands.autocomplete(region=region_autocomplete, origin=airport_autocomplete)
+async def search_anywhere(ctx, region: str, outbound_date: str, return_date: str = None, origin: AirportCode = None):
+    group = find_region(region)
+    if group:
+        destinations = load_regions()[group]
+    else:
+        destinations = [code.strip().upper() for code in region.split(",") if code.strip()]
+        unknown = [code for code in destinations if not airports.is_valid(code)]
+        if unknown or not destinations:
+            await ctx.send(f"⚠️ `{region}` isn't a region or a list of airport codes. Regions: {', '.join(f'`{name}`' for name in load_regions())}")
+            return
+        group = ", ".join(destinations)
+
+    try:
+        outbound = date.fromisoformat(outbound_date)
+        returning = date.fromisoformat(return_date) if return_date else None
+    except ValueError:
+        await ctx.send("⚠️ Dates need to look like `2026-11-01`.")
+        return
+    if outbound < date.today() or (returning and returning <= outbound):
+        await ctx.send("⚠️ The outbound date has to be in the future and before the return date.")
+        return
+
+    if origin is None:
+        origin = await fetch_user_home_airport(ctx, str(ctx.author.id))
+        if origin is None:
+            return
+
+    await ctx.send(f"🌍 Searching {len(destinations)} destinations in **{group}** from `{origin}`...")
+    result = await anywhere.search_anywhere(origin, group, destinations, outbound_date, return_date, user_id=str(ctx.author.id))
+    if not result.fares:
+        await ctx.send("❌ No flights found for those dates.")
+        return
+    await ctx.send(embed=render.anywhere_embed(result))
 
 '''
 Command to show all of the flights that a user has searched that didn't 
@@ -252,126 +286,136 @@ meet their criteria and that they haven't been alerted about
 async def flights_in_database(ctx):
     user_id = str(ctx.author.id)
 
-    results = supabase.table("FlightTracking").select("*").eq("user_id", user_id).execute().data
-
-    if not results: 
+    # Pages are read by keyset as the user clicks through, never the whole list at once
+    if not await Paginator(TrackingPages(user_id), ctx.author.id).start(ctx):
         await ctx.send("The current user doesn't have any saved flight price alerts")
-    
-    embed = discord.Embed(
-        title = " Your Tracked Flight Alerts", 
-        description = "These are the flights that are going to be checked for weekly updates.", 
-        color = discord.Color.blue()
-    )
-
-    for row in results: 
-        route =f"{row['departure_id']} -> {row['arrival_id']}"
-        dates = f"{row['outbound_date']} -> {row['return_date']}"
-        price = f"{row['max_price']}"
-        embed.add_field(name=route, value=f" {dates} \n Max Price: {price}", inline = False)
-    
-    await ctx.send(embed = embed)
 
 '''
-7/24/2025
-This function now works and stores the info into the database but it prints out 3 things instead of just one I need 
-to work on the loop to make sure that it only prints out one. Also take out all of the debugging print statements
+Shows the cheapest one-way deals from the user's home airport for each region. The board
+is precomputed by refresh_deals so this never waits on SerpAPI
 '''
 @bot.command(name="todays_deals")
 async def lookup_todays_flight_deals(ctx):
     user_id = str(ctx.author.id)
 
-    region_name, dest = pick_random_destination()
-
     home_airport = await fetch_user_home_airport(ctx, user_id)
 
     if home_airport is None: 
         return
 
-    await ctx.send(f"🔎 Finding today's best deals from `{home_airport}`...")
+    if not deals.has_deals(home_airport):
+        deals.request_refresh(home_airport)
+        await ctx.send(f"⏳ We're pricing deals from `{home_airport}` right now, check back in a few minutes!")
+        return
 
-    embed = discord.Embed(
-        title="🔥 Best Flight Deals Today",
-        description="Here are some one-way options to popular destinations!",
-        color=discord.Color.blue()
-    )
+    board = deals.top_deals(home_airport, DEALS_PER_REGION)
+    if not any(board.values()):
+        await ctx.send("😔 No flights found right now. Try again later!")
+        return
 
-    # If we already have relevant information used what is cached inside of our database
-    cache_response = cached_deal_destination(region_name, dest)
-    if cache_response.data:
-        cached = cache_response.data[0]
-        embed.add_field(
-            name=f"{region_name} → {dest} | 💵 ${cached['price']}",
-            value=f"📦 Pulled from cache (last 24 hrs)\n🔗 [Google Flights]({cached.get('url', 'https://www.google.com/travel/flights')})",
-            inline=False
-        )
-    else:
-    # 4. Fetch live if not cached
-        top_flights = await fetch_cheapest_oneway_flight(home_airport, dest, 2)
-        if not top_flights:
-            await ctx.send("😔 No flights found right now. Try again later!")
-            return
+    await ctx.send(embed=render.deals_embed(home_airport, board))
 
-        for flight in top_flights:
-            airline = flight.get("airline", "Unknown")
-            flight_number = flight.get("flight_number", "N/A")
-            departure = flight.get("departure", "N/A")
-            arrival = flight.get("arrival", "N/A")
-            departure_time = flight.get("departure_time", "N/A")
-            arrival_time = flight.get("arrival_time", "N/A")
-            price = flight.get("price", "N/A")
-            duration = flight.get("duration", "N/A")
-            url = flight.get("url", "https://www.google.com/travel/flights")
-
-            embed.add_field(
-                name=f"{region_name} → {dest} | 💵 ${price}",
-                value=(
-                    f"**{airline} {flight_number}**\n"
-                    f"{departure} → {arrival}\n"
-                    f"🕒 {departure_time} → {arrival_time} ({duration})\n"
-                    f"🔗 [View on Google Flights]({url})"
-                ),
-                inline=False
-            )
-
-        # Save only the first (top) flight to cache
-        top_flight = top_flights[0]
-        supabase.table("TodaysDeals").insert({
-            "region": region_name,
-            "airport_code": dest,
-            "price": top_flight.get("price"),
-            "flight_url": top_flight.get("url", ""),
-            "created_at": datetime.now(UTC).isoformat()
-        }).execute()
-
-    embed.set_footer(text="Built by Lindzi • Powered by SerpAPI + Google Flights")
-    await ctx.send(embed=embed)
+'''
+Command to show how the cheapest fare on a route has moved over the last month,
+built from every search anyone has run on it
+'''
+@bot.hybrid_command(name = "price_history", description="Show how the cheapest fare on a route has moved")
+@app_commands.autocomplete(departure_id=airport_autocomplete, arrival_id=airport_autocomplete)
+async def price_history(ctx, departure_id: AirportCode, arrival_id: AirportCode):
+    observations = await history.route_history(departure_id, arrival_id)
+
+    if not observations:
+        await ctx.send(f"No prices recorded for `{departure_id} → {arrival_id}` yet. Try `!lookup_flight` first!")
+        return
+
+    await ctx.send(embed=render.history_embed(departure_id, arrival_id, observations, history.HISTORY_WINDOW_DAYS))
 
 '''
 Command to delete all of the flights from a specific user that have specific 
 departure and arrival IATA codes that are saved inside of the database 
 '''
-@bot.command(name = "delete_flight")
-async def delete_flight(ctx, departure_id: str, arrival_id: str): 
+@bot.hybrid_command(name = "delete_flight", description="Stop tracking every flight on a route")
+@app_commands.autocomplete(departure_id=airport_autocomplete, arrival_id=airport_autocomplete)
+async def delete_flight(ctx, departure_id: AirportCode, arrival_id: AirportCode): 
     user_id = str(ctx.author.id)
 
     try: 
-        response = (
-            supabase.table("FlightTracking")
-            .delete()
-            .eq("user_id", user_id)
-            .eq("departure_id", departure_id)
-            .eq("arrival_id", arrival_id)
-            .execute()
-        )
+        deleted = await db.delete_tracking(user_id, departure_id, arrival_id)
+        for row in deleted:
+            tracking.remove(row["id"])
 
-        if response.data:
-            await ctx.send(f"All saved alerts for `{departure_id.upper()} → {arrival_id.upper()}` have been deleted.")
+        if deleted:
+            await ctx.send(f"All saved alerts for `{departure_id} → {arrival_id}` have been deleted.")
         else:
-            await ctx.send(f"No saved alerts found for `{departure_id.upper()} → {arrival_id.upper()}`.")
+            await ctx.send(f"No saved alerts found for `{departure_id} → {arrival_id}`.")
 
     except Exception as e: 
         await ctx.send(f"Error deleting the flight alert: {e}")
 
+'''
+Command to show how many SerpAPI calls each feature made today and this month,
+and how many were saved by the cache
+'''
+@bot.command(name = "api_usage")
+async def api_usage(ctx):
+    await quota.flush_usage()
+    today = datetime.now(UTC).date().isoformat()
+    month = today[:7]
+
+    per_feature = {}
+    for (day, feature), counts in quota.usage.items():
+        if not day.startswith(month):
+            continue
+        totals = per_feature.setdefault(feature, {"today": 0, "month": 0, "saved": 0})
+        totals["month"] += counts["calls"]
+        totals["saved"] += counts["cache_hits"]
+        if day == today:
+            totals["today"] += counts["calls"]
+
+    embed = discord.Embed(
+        title="📈 SerpAPI Usage",
+        description=f"Today: **{quota.calls_today()}** calls • This month: **{quota.calls_this_month()}** calls",
+        color=discord.Color.blue()
+    )
+    for feature, totals in sorted(per_feature.items()):
+        embed.add_field(
+            name=feature,
+            value=f"Today: {totals['today']} • Month: {totals['month']} • Saved by cache: {totals['saved']}",
+            inline=False
+        )
+    await ctx.send(embed=embed)
+
+'''
+Admin command that shows per stage latency (search, db, render, send, each command and job),
+cache hit ratio and error counts since the bot started
+'''
+@bot.command(name = "stats")
+@commands.has_permissions(administrator=True)
+async def stats(ctx):
+    snapshot = metrics.snapshot()
+    lookups = fare_cache.hits + fare_cache.misses
+    hit_ratio = f"{fare_cache.hits / lookups:.0%}" if lookups else "n/a"
+
+    embed = discord.Embed(
+        title="⏱️ Bot Stats",
+        description=f"Fare cache hit ratio: **{hit_ratio}** ({fare_cache.hits} hits / {fare_cache.misses} misses)",
+        color=discord.Color.blue()
+    )
+    for stage, h in list(snapshot["latency"].items())[:20]:
+        embed.add_field(
+            name=stage,
+            value=f"n={h['count']} • mean {h['mean_ms']}ms • p50 ≤{h['p50_ms']:.0f}ms • p99 ≤{h['p99_ms']:.0f}ms • max {h['max_ms']}ms",
+            inline=False
+        )
+    errors = {name: n for name, n in snapshot["counters"].items() if name.startswith("errors.")}
+    if errors:
+        embed.add_field(
+            name="Errors",
+            value="\n".join(f"{name[7:]}: {n}" for name, n in errors.items())[:1024],
+            inline=False
+        )
+    await ctx.send(embed=embed)
+
 '''
 Command to show all of the available commands to a user
 '''
@@ -397,7 +441,10 @@ async def help_command(ctx):
             "• `to` = arrival airport IATA code (e.g., AUS)\n"
             "• `outbound_date` = travel start date (YYYY-MM-DD)\n"
             "• `return_date` = return flight date (YYYY-MM-DD)\n"
-            "• `max_price` = price threshold in USD"
+            "• `max_price` = price threshold in USD\n\n"
+            "**Flexible dates:** use a window and a trip length instead, e.g. "
+            "`!lookup_flight JFK LHR 2026-11-01..2026-11-14 7 600` (lengths can be `5-9` or `5,7,9`)\n\n"
+            "Also available as `/lookup_flight`, which suggests airports as you type a city or code"
         ),
         inline=False
     )   
@@ -408,14 +455,32 @@ async def help_command(ctx):
     )
     embed.add_field(
         name="!todays_deals",
-        value ="This will show you deals that are here today but might be gone tomorrow based on what you have set as your hometown", 
+        value ="Shows the cheapest one-way deals from your hometown airport to popular destinations in each region", 
         inline = False
     )
+    embed.add_field(
+        name="!anywhere <region> <outbound_date> [return_date] [from]",
+        value=(
+            "Cheapest destinations in a region from your home airport, e.g. `!anywhere Europe 2026-11-05 2026-11-12`.\n"
+            f"Regions: {', '.join(load_regions())} (quote names with spaces), or a list like `LHR,CDG,AMS`"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="!price_history <from> <to>",
+        value="Shows how the cheapest fare between two airports has moved over the last month",
+        inline=False
+    )
     embed.add_field(
         name="!delete_flight <from> <to>", 
         value = "This will take out flights that you have routed to certain destinations no matter what the max price range was set at",
         inline = False
     )
+    embed.add_field(
+        name="!alerts_to <channel|dm|here>",
+        value="Choose whether your price alerts go to the shared alerts channel, your DMs or the channel you run this in",
+        inline=False
+    )
     embed.add_field(
         name="!set_home <IATA>", 
         value= "Set your hometown airport so that you can see which deals are available to to you when running the deals today command",
@@ -425,4 +490,41 @@ async def help_command(ctx):
     await ctx.send(embed = embed)
 
 
-bot.run(DISCORD_TOKEN)
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def stop_command_timer(ctx):
+    started_at = getattr(ctx, "started_at", None)
+    if started_at is not None:
+        metrics.observe(f"command.{ctx.command.name}", (time.perf_counter() - started_at) * 1000)
+
+@bot.event
+async def on_command_error(ctx, error):
+    name = ctx.command.name if ctx.command else "unknown"
+    metrics.incr(f"errors.command.{name}")
+    if isinstance(error, commands.CommandNotFound):
+        return
+    if isinstance(error, commands.UserInputError):
+        await ctx.send(f"⚠️ {error} Try `!help` to see how to use this command.")
+        return
+    if isinstance(error, commands.CheckFailure):
+        await ctx.send("🚫 You don't have permission to use this command.")
+        return
+    log.error("command failed command=%s error=%s", name, error, exc_info=error)
+
+
+def main():
+    configure_logging()
+    # Everything the bot talks to, checked up front instead of on the first command that needs it
+    settings = services.settings
+    settings.require("discord_token", "alerts_channel_id", "serpapi_key", "supabase_url", "supabase_key")
+    bot.run(settings.discord_token, log_handler=None)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except ConfigError as e:
+        raise SystemExit(f"❌ {e}")
@@ -0,0 +1,209 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, UTC
+
+import db
+import history
+import metrics
+from config import env_int
+from models import SearchResult, parse_results
+from quota import INTERACTIVE, quota
+from search import search_flights
+
+log = logging.getLogger(__name__)
+
+# How many search responses we keep in memory before evicting the least recently used
+FARE_CACHE_SIZE = env_int("FARE_CACHE_SIZE", 512, minimum=1)
+
+# Seconds a cached response stays fresh, per query type. Override with FARE_TTL_<TYPE>
+FARE_TTLS = {
+    "roundtrip": env_int("FARE_TTL_ROUNDTRIP", 900, minimum=0),
+    "oneway": env_int("FARE_TTL_ONEWAY", 3600, minimum=0),
+}
+DEFAULT_TTL = env_int("FARE_TTL_DEFAULT", 900, minimum=0)
+# While upstream is failing, commands get results up to this old instead of an error
+FARE_STALE_SECONDS = env_int("FARE_STALE_SECONDS", 21600, minimum=0)
+
+# Params that don't change what SerpAPI returns and must never end up in a cache key
+IGNORED_PARAMS = {"api_key", "source", "serp_api_key"}
+
+
+def cache_key(params: dict) -> str:
+    # Same route + dates should hit the same entry no matter the key order or code casing
+    normalized = {}
+    for k, v in params.items():
+        if k in IGNORED_PARAMS or v is None:
+            continue
+        v = str(v)
+        if k in ("departure_id", "arrival_id"):
+            v = v.upper()
+        normalized[k] = v
+    return json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+
+'''
+Two tier cache for parsed search results: an in-process LRU of SearchResult objects in
+front of the durable FareCache table, which stores their compact JSON form.
+Concurrent lookups for the same key share one upstream call. Expired entries are kept
+for FARE_STALE_SECONDS so interactive lookups can fall back to them (marked stale) when
+the upstream search fails.
+'''
+class FareCache:
+    def __init__(self, max_entries: int = FARE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, SearchResult)
+        self._inflight = {}            # key -> Future for the search already running
+        self._waiters = {}             # key -> callers currently waiting on that future
+        self.hits = 0
+        self.misses = 0
+
+    def _get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, results = entry
+        if expires_at <= time.time():
+            if results.age_seconds() > FARE_STALE_SECONDS:
+                del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return results
+
+    async def _get_stale(self, key):
+        # Freshest copy we still have, however old, as long as it's within FARE_STALE_SECONDS
+        entry = self._entries.get(key)
+        if entry is not None and entry[1].age_seconds() <= FARE_STALE_SECONDS:
+            return dataclasses.replace(entry[1], stale=True)
+        try:
+            row = await db.get_cached_fare(key)
+        except Exception as e:
+            log.warning("fare cache read failed error=%s", e)
+            return None
+        if not row or "offers" not in (row["results"] or {}):
+            return None
+        results = SearchResult.from_dict(row["results"])
+        if not results.fetched_at or results.age_seconds() > FARE_STALE_SECONDS:
+            return None
+        return dataclasses.replace(results, stale=True)
+
+    def _put_local(self, key, results, expires_at):
+        self._entries[key] = (expires_at, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _get_durable(self, key):
+        try:
+            row = await db.get_cached_fare(key)
+        except Exception as e:
+            log.warning("fare cache read failed error=%s", e)
+            return None
+        if not row:
+            return None
+        expires_at = datetime.fromisoformat(row["expires_at"]).timestamp()
+        if expires_at <= time.time() or "offers" not in (row["results"] or {}):
+            return None
+        results = SearchResult.from_dict(row["results"])
+        self._put_local(key, results, expires_at)
+        return results
+
+    async def _put_durable(self, key, results, expires_at):
+        try:
+            await db.put_cached_fare(key, results.to_dict(), datetime.fromtimestamp(expires_at, UTC).isoformat())
+        except Exception as e:
+            log.warning("fare cache write failed error=%s", e)
+
+    async def _fetch(self, key, params, ttl, fetch, search_kwargs):
+        results = await self._get_durable(key)
+        if results is not None:
+            quota.record_cache_hit(search_kwargs.get("feature", "other"))
+            return results
+
+        results = parse_results(await fetch(params, **search_kwargs))
+        history.record_search(params, results)
+        # Don't keep SerpAPI error payloads around
+        if results.error is None:
+            expires_at = time.time() + ttl
+            self._put_local(key, results, expires_at)
+            await self._put_durable(key, results, expires_at)
+        return results
+
+    async def get_or_fetch(self, params: dict, query_type: str, fetch=search_flights, **search_kwargs) -> SearchResult:
+        # search_kwargs (user_id, priority, feature) are handed to fetch for quota accounting
+        key = cache_key(params)
+        feature = search_kwargs.get("feature", "other")
+
+        results = self._get_local(key)
+        if results is not None:
+            self.hits += 1
+            quota.record_cache_hit(feature)
+            return results
+
+        try:
+            return await self._get_shared(key, params, query_type, fetch, search_kwargs)
+        except Exception as e:
+            # Background checks must not act on old prices, so only commands get the stale copy
+            if search_kwargs.get("priority", INTERACTIVE) != INTERACTIVE:
+                raise
+            stale = await self._get_stale(key)
+            if stale is None:
+                raise
+            metrics.incr("fare_cache.stale_served")
+            log.warning("serving stale fares age=%ds feature=%s error=%s", stale.age_seconds(), feature, e)
+            return stale
+
+    async def _get_shared(self, key, params, query_type, fetch, search_kwargs) -> SearchResult:
+        feature = search_kwargs.get("feature", "other")
+
+        # Someone is already searching this exact thing, wait for their answer
+        future = self._inflight.get(key)
+        if future is not None and not future.done():
+            self.hits += 1
+            quota.record_cache_hit(feature)
+            return await self._wait(key, future)
+
+        self.misses += 1
+        ttl = FARE_TTLS.get(query_type, DEFAULT_TTL)
+        future = asyncio.ensure_future(self._fetch(key, params, ttl, fetch, search_kwargs))
+        self._inflight[key] = future
+        future.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        return await self._wait(key, future)
+
+    async def _wait(self, key, future):
+        # The search is shielded so one caller giving up doesn't cancel it for the others.
+        # Once the last waiter is cancelled nobody wants the answer, so stop the search too
+        # (a fan-out that already has enough results doesn't keep paying for the rest)
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not future.done():
+                future.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def peek(self, params: dict, feature: str = "other") -> SearchResult | None:
+        # Fresh in-memory entry for these params, or None without searching. A hit saved an
+        # upstream call just like one in get_or_fetch, so it is counted the same way. A miss
+        # isn't, the search that follows it counts that
+        results = self._get_local(cache_key(params))
+        if results is not None:
+            self.hits += 1
+            quota.record_cache_hit(feature)
+        return results
+
+    def clear(self):
+        self._entries.clear()
+
+
+fare_cache = FareCache()
+
+
+async def cached_search(params: dict, query_type: str, **search_kwargs) -> SearchResult:
+    return await fare_cache.get_or_fetch(params, query_type, **search_kwargs)
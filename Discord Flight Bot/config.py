@@ -0,0 +1,161 @@
+import logging
+import math
+import os
+from dataclasses import dataclass, fields
+
+_env_loaded = False
+
+
+def load_env():
+    # Reads .env into os.environ the first time any module asks, later calls are free.
+    # Variables already set in the environment win over .env
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+class ConfigError(Exception):
+    pass
+
+# ---------- tunables ----------
+
+# Malformed tunables seen while modules were imported. Importing never fails on them, the
+# module keeps its default and Settings.from_env reports them all from the entry point
+_tunable_problems = []
+
+
+def _tunable(name: str, default, parse, expected: str, minimum=None):
+    load_env()
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        value = parse(raw)
+    except ValueError:
+        _tunable_problems.append(f"{name} must be {expected}, got {raw!r}")
+        return default
+    if minimum is not None and value < minimum:
+        _tunable_problems.append(f"{name} must be at least {minimum}, got {raw!r}")
+        return default
+    return value
+
+
+def _finite_float(raw: str) -> float:
+    value = float(raw)
+    if not math.isfinite(value):
+        raise ValueError(raw)
+    return value
+
+
+def _flag(raw: str) -> bool:
+    lowered = raw.lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(raw)
+
+
+def env_int(name: str, default: int, minimum: int | None = None) -> int:
+    return _tunable(name, default, int, "a whole number", minimum)
+
+
+def env_float(name: str, default: float, minimum: float | None = None) -> float:
+    return _tunable(name, float(default), _finite_float, "a number", minimum)
+
+
+def env_flag(name: str, default: bool) -> bool:
+    return _tunable(name, default, _flag, "1 or 0")
+
+
+def env_str(name: str, default: str) -> str:
+    load_env()
+    return os.getenv(name, "").strip() or default
+
+
+def tunable_problems() -> list[str]:
+    return list(_tunable_problems)
+
+
+def _int_or_none(name: str, problems: list) -> int | None:
+    value = os.getenv(name, "").strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        problems.append(f"{name} must be a number, got {value!r}")
+        return None
+
+'''
+The settings every process needs, read from the environment (and .env) once and checked
+before anything connects. Tunables with sane defaults (rates, TTLs, concurrency) stay as
+constants next to the code that uses them, read with env_int/env_float/env_flag above;
+this is for credentials and ids we can't guess, and reports any tunable that didn't parse.
+Construction never fails on a missing value so modules and tooling can import freely,
+the entry points call require() for what they actually use.
+'''
+@dataclass(frozen=True, slots=True)
+class Settings:
+    discord_token: str | None
+    alerts_channel_id: int | None
+    serpapi_key: str | None
+    serpapi_backend: str | None
+    supabase_url: str | None
+    supabase_key: str | None
+    bot_mode: str
+
+    # Environment variable behind each field, for error messages
+    ENV_NAMES = {
+        "discord_token": "DISCORD_TOKEN",
+        "alerts_channel_id": "DISCORD_CHANNEL_ID",
+        "serpapi_key": "SERPA_AP_KEY",
+        "serpapi_backend": "SERPAPI_BACKEND",
+        "supabase_url": "SUPABASE_URL",
+        "supabase_key": "SUPABASE_KEY",
+        "bot_mode": "BOT_MODE",
+    }
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_env()
+        problems = tunable_problems()
+        bot_mode = os.getenv("BOT_MODE", "all").strip().lower()
+        if bot_mode not in ("all", "gateway"):
+            problems.append(f"BOT_MODE must be 'all' or 'gateway', got {bot_mode!r}")
+        settings = cls(
+            discord_token=os.getenv("DISCORD_TOKEN") or None,
+            alerts_channel_id=_int_or_none("DISCORD_CHANNEL_ID", problems),
+            serpapi_key=os.getenv("SERPA_AP_KEY") or None,
+            serpapi_backend=(os.getenv("SERPAPI_BACKEND") or "").rstrip("/") or None,
+            supabase_url=os.getenv("SUPABASE_URL") or None,
+            supabase_key=os.getenv("SUPABASE_KEY") or None,
+            bot_mode=bot_mode
+        )
+        if problems:
+            raise ConfigError("invalid configuration: " + "; ".join(problems))
+        return settings
+
+    def require(self, *names: str):
+        # Fails with every missing variable at once instead of one per restart
+        missing = [self.ENV_NAMES[name] for name in names if getattr(self, name) is None]
+        if missing:
+            raise ConfigError(f"missing configuration: {', '.join(missing)} (set them in the environment or .env)")
+
+    def __repr__(self) -> str:
+        # Never print credentials, only whether they are set
+        shown = {f.name: (getattr(self, f.name) if f.name in ("alerts_channel_id", "serpapi_backend", "bot_mode")
+                          else "set" if getattr(self, f.name) else None) for f in fields(self)}
+        return f"Settings({', '.join(f'{k}={v!r}' for k, v in shown.items())})"
+
+
+def configure_logging():
+    # Entry points only, importing a module never touches the root logger.
+    # LOG_LEVEL=DEBUG for the noisy stuff, discord.py logs through the same handler
+    load_env()
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s %(message)s"
+    )
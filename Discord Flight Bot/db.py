@@ -0,0 +1,234 @@
+from datetime import datetime, UTC
+
+from metrics import timed
+from services import services
+
+'''
+Shared data access for the FlightTracking, UserSetting, TodaysDeals, FareCache,
+ApiUsage, PriceHistory and AlertDelivery tables (see schema.sql for the columns and indexes we rely on).
+Every command and background job goes through these functions so there is one
+async Supabase client (and one pooled HTTP session) for the whole bot, built by
+services on first use. Point SUPABASE_URL at a local PostgREST to run against a stand-in database.
+'''
+
+
+async def get_client():
+    return await services.supabase()
+
+
+async def _table(name: str):
+    client = await get_client()
+    return client.table(name)
+
+# Rows per request when a whole table is read. PostgREST quietly cuts a single select
+# off at its max-rows setting (1000 by default), so bigger reads have to be paged
+PAGE_SIZE = 1000
+
+
+async def _read_all(build, key: str = "id", page_size: int = PAGE_SIZE) -> list[dict]:
+    # Keyset pages on key (never an offset), build() returns a fresh filtered select each time
+    rows, last = [], None
+    while True:
+        query = build()
+        if last is not None:
+            query = query.gt(key, last)
+        page = (await query.order(key).limit(page_size).execute()).data or []
+        rows += page
+        if len(page) < page_size:
+            return rows
+        last = page[-1][key]
+
+# ---------- UserSetting ----------
+
+# Columns a cached user settings entry holds, see user_settings.py
+USER_SETTING_COLUMNS = "user_id, home_airport, alert_delivery, alert_channel_id"
+
+
+@timed("db")
+async def list_user_settings(user_ids: list[str]) -> list[dict]:
+    # Users without a row don't show up. Ids go in the URL, so very large batches are chunked
+    table = await _table("UserSetting")
+    rows = []
+    for start in range(0, len(user_ids), 500):
+        chunk = user_ids[start:start + 500]
+        rows += (await table.select(USER_SETTING_COLUMNS).in_("user_id", chunk).execute()).data or []
+    return rows
+
+
+@timed("db")
+async def set_home_airport(user_id: str, home_airport: str) -> dict:
+    table = await _table("UserSetting")
+    rows = (await table.upsert({
+        "user_id": user_id,
+        "home_airport": home_airport
+    }, on_conflict="user_id").execute()).data
+    return rows[0] if rows else {}
+
+@timed("db")
+async def list_home_airports() -> list[str]:
+    table = await _table("UserSetting")
+    rows = await _read_all(lambda: table.select("user_id, home_airport"), key="user_id")
+    return sorted({row["home_airport"] for row in rows if row.get("home_airport")})
+
+@timed("db")
+async def set_alert_delivery(user_id: str, delivery: str, channel_id: str | None = None) -> dict:
+    table = await _table("UserSetting")
+    rows = (await table.upsert({
+        "user_id": user_id,
+        "alert_delivery": delivery,
+        "alert_channel_id": channel_id
+    }, on_conflict="user_id").execute()).data
+    return rows[0] if rows else {}
+
+# ---------- FlightTracking ----------
+
+@timed("db")
+async def insert_tracking(user_id: str, departure_id: str, arrival_id: str, outbound_date: str, return_date: str, max_price: int) -> dict:
+    table = await _table("FlightTracking")
+    rows = (await table.insert({
+        "user_id": user_id,
+        "departure_id": departure_id,
+        "arrival_id": arrival_id,
+        "outbound_date": outbound_date,
+        "return_date": return_date,
+        "max_price": max_price,
+        "alert_sent": False,
+        "last_checked": datetime.now(UTC).isoformat()
+    }).execute()).data
+    return rows[0] if rows else {}
+
+
+@timed("db")
+async def list_pending_alerts() -> list[dict]:
+    table = await _table("FlightTracking")
+    return await _read_all(lambda: table.select("*").eq("alert_sent", False))
+
+
+@timed("db")
+async def list_tracking_changed(since: str) -> list[dict]:
+    # Rows inserted or updated at or after since, alerted ones included so they can be
+    # dropped. updated_at is kept by a trigger, see schema.sql
+    table = await _table("FlightTracking")
+    return await _read_all(lambda: table.select("*").gte("updated_at", since))
+
+
+@timed("db")
+async def list_user_tracking_page(user_id: str, after_id=None, limit: int = 10) -> list[dict]:
+    # Active rows in id order starting after after_id (keyset pagination, uses
+    # flight_tracking_user_idx), so page 50 costs the same as page 1
+    table = await _table("FlightTracking")
+    query = table.select("*").eq("user_id", user_id).eq("alert_sent", False)
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    return (await query.order("id").limit(limit).execute()).data or []
+
+
+@timed("db")
+async def delete_tracking(user_id: str, departure_id: str, arrival_id: str) -> list[dict]:
+    table = await _table("FlightTracking")
+    return (
+        await table.delete()
+        .eq("user_id", user_id)
+        .eq("departure_id", departure_id)
+        .eq("arrival_id", arrival_id)
+        .execute()
+    ).data or []
+
+
+@timed("db")
+async def update_tracking_many(row_ids: list, fields: dict):
+    # Same values for many rows in one request. Ids go in the URL, so very large batches are chunked
+    table = await _table("FlightTracking")
+    for start in range(0, len(row_ids), 500):
+        await table.update(fields).in_("id", row_ids[start:start + 500]).execute()
+
+@timed("db")
+async def claim_due_routes(worker_id: str, max_routes: int, lease_seconds: int, shard: int = 0, shards: int = 1) -> list[dict]:
+    # See claim_due_routes in schema.sql, rows come back already leased to this worker
+    client = await get_client()
+    return (await client.rpc("claim_due_routes", {
+        "worker": worker_id,
+        "max_routes": max_routes,
+        "lease_seconds": lease_seconds,
+        "shard": shard,
+        "shards": shards
+    }).execute()).data or []
+
+# ---------- TodaysDeals ----------
+
+@timed("db")
+async def list_recent_deals(since: str) -> list[dict]:
+    table = await _table("TodaysDeals")
+    return await _read_all(lambda: table.select("*").gte("created_at", since))
+
+
+@timed("db")
+async def insert_deals(rows: list[dict]):
+    table = await _table("TodaysDeals")
+    await table.insert(rows).execute()
+
+# ---------- FareCache ----------
+
+@timed("db")
+async def get_cached_fare(cache_key: str) -> dict | None:
+    table = await _table("FareCache")
+    rows = (await table.select("results, expires_at").eq("cache_key", cache_key).limit(1).execute()).data
+    return rows[0] if rows else None
+
+
+@timed("db")
+async def put_cached_fare(cache_key: str, results: dict, expires_at: str):
+    table = await _table("FareCache")
+    await table.upsert({
+        "cache_key": cache_key,
+        "results": results,
+        "expires_at": expires_at
+    }, on_conflict="cache_key").execute()
+
+# ---------- ApiUsage ----------
+
+@timed("db")
+async def list_api_usage(since_day: str) -> list[dict]:
+    table = await _table("ApiUsage")
+    return (await table.select("*").gte("day", since_day).execute()).data or []
+
+
+@timed("db")
+async def upsert_api_usage(rows: list[dict]):
+    table = await _table("ApiUsage")
+    await table.upsert(rows, on_conflict="day,feature").execute()
+
+# ---------- AlertDelivery ----------
+
+@timed("db")
+async def insert_deliveries(rows: list[dict]):
+    table = await _table("AlertDelivery")
+    await table.insert(rows).execute()
+
+# ---------- PriceHistory ----------
+
+@timed("db")
+async def insert_price_history(rows: list[dict]):
+    table = await _table("PriceHistory")
+    await table.insert(rows).execute()
+
+
+@timed("db")
+async def list_price_history(departure_id: str, arrival_id: str, since: str, trip_length: int | None = None,
+                             before: str | None = None, limit: int = 5000) -> list[dict]:
+    # Served by the (departure_id, arrival_id, observed_at) index. Read newest first so a busy
+    # route loses its oldest observations to the limit, not its latest ones, returned oldest first
+    table = await _table("PriceHistory")
+    query = (
+        table.select("outbound_date, trip_length, min_price, observed_at")
+        .eq("departure_id", departure_id)
+        .eq("arrival_id", arrival_id)
+        .gte("observed_at", since)
+    )
+    if trip_length is not None:
+        query = query.eq("trip_length", trip_length)
+    if before is not None:
+        query = query.lt("observed_at", before)
+    rows = (await query.order("observed_at", desc=True).limit(limit).execute()).data or []
+    rows.reverse()
+    return rows
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, UTC
+from typing import NamedTuple
+
+import db
+from batching import writes
+from config import env_float, env_int, env_str
+from quota import BACKGROUND
+from utils import fetch_cheapest_oneway_flight, load_regions
+
+log = logging.getLogger(__name__)
+
+# How often the background job re-prices every (home airport, destination) pair
+DEALS_REFRESH_HOURS = env_float("DEALS_REFRESH_HOURS", 12, minimum=0.001)
+# How many pairs we price at the same time during a refresh
+DEALS_CONCURRENCY = env_int("DEALS_CONCURRENCY", 4, minimum=1)
+# Which regions the board covers and how many of each region's top destinations it prices.
+# Every extra destination is one more background search per home airport per refresh
+DEALS_REGIONS = [name.strip() for name in env_str("DEALS_REGIONS", "Asia,Europe,Americas").split(",") if name.strip()]
+DEALS_DESTINATIONS_PER_REGION = env_int("DEALS_DESTINATIONS_PER_REGION", 3, minimum=1)
+
+
+class Deal(NamedTuple):
+    region: str
+    airport_code: str
+    price: int
+    airline: str
+    flight_number: str
+    departure_time: str
+    duration: int | str
+    flight_url: str
+    created_at: str
+
+# home airport -> region -> deals sorted cheapest first
+_board = {}
+_refreshing = set()
+
+
+def _index(deals_by_home: dict):
+    board = {}
+    for home, deals in deals_by_home.items():
+        by_region = {}
+        for deal in deals:
+            by_region.setdefault(deal.region, []).append(deal)
+        for region_deals in by_region.values():
+            region_deals.sort(key=lambda d: d.price)
+        board[home] = by_region
+    return board
+
+
+def _deal_from_row(row: dict) -> Deal:
+    return Deal(
+        region=row["region"],
+        airport_code=row["airport_code"],
+        price=row["price"],
+        airline=row.get("airline") or "Unknown",
+        flight_number=row.get("flight_number") or "N/A",
+        departure_time=row.get("departure_time") or "N/A",
+        duration=row.get("duration") or "N/A",
+        flight_url=row.get("flight_url") or "https://www.google.com/travel/flights",
+        created_at=row["created_at"]
+    )
+
+
+def top_deals(home_airport: str, per_region: int = 3) -> dict:
+    # Pure in-memory read, this is all !todays_deals does on the request path
+    by_region = _board.get(home_airport, {})
+    return {region: deals[:per_region] for region, deals in by_region.items()}
+
+
+def has_deals(home_airport: str) -> bool:
+    return home_airport in _board
+
+'''
+Rebuilds the in-memory board from the last day's TodaysDeals rows so a restart
+doesn't leave !todays_deals empty until the next refresh
+'''
+async def load_deals_board():
+    global _board
+    cutoff = (datetime.now(UTC) - timedelta(hours=max(DEALS_REFRESH_HOURS * 2, 24))).isoformat()
+    rows = await db.list_recent_deals(cutoff)
+
+    # Keep only the newest row per (home, destination)
+    latest = {}
+    for row in rows:
+        if not row.get("home_airport") or row.get("price") is None:
+            continue
+        key = (row["home_airport"], row["airport_code"])
+        if key not in latest or row["created_at"] > latest[key]["created_at"]:
+            latest[key] = row
+
+    deals_by_home = {}
+    for (home, _), row in latest.items():
+        deals_by_home.setdefault(home, []).append(_deal_from_row(row))
+    _board = _index(deals_by_home)
+    log.info("loaded deals board home_airports=%d", len(_board))
+
+
+async def _price_pair(semaphore, home_airport, region_name, dest):
+    async with semaphore:
+        try:
+            offers, g_url = await fetch_cheapest_oneway_flight(home_airport, dest, 2, priority=BACKGROUND, feature="deals_board")
+        except Exception as e:
+            log.error("deal refresh failed route=%s-%s error=%s", home_airport, dest, e)
+            return None
+    if not offers or offers[0].price is None or not offers[0].legs:
+        return None
+
+    top = offers[0]
+    first_leg = top.legs[0]
+    return {
+        "home_airport": home_airport,
+        "region": region_name,
+        "airport_code": dest,
+        "price": top.price,
+        "airline": first_leg.airline,
+        "flight_number": first_leg.flight_number,
+        "departure_time": first_leg.departure_time,
+        "duration": top.total_duration,
+        "flight_url": g_url,
+        "created_at": datetime.now(UTC).isoformat()
+    }
+
+'''
+Prices the cheapest one-way fare for every (home airport, destination) pair and swaps
+the results into the board. Pass home_airports to refresh just those.
+'''
+async def refresh_deals_board(home_airports: list[str] | None = None):
+    if home_airports is None:
+        home_airports = await db.list_home_airports()
+    if not home_airports:
+        return
+
+    semaphore = asyncio.Semaphore(DEALS_CONCURRENCY)
+    tasks = [
+        _price_pair(semaphore, home, region_name, dest)
+        for home in home_airports
+        for region_name, destinations in load_regions().items()
+        if region_name in DEALS_REGIONS
+        for dest in destinations[:DEALS_DESTINATIONS_PER_REGION]
+        if dest != home
+    ]
+    rows = [row for row in await asyncio.gather(*tasks) if row]
+    if rows:
+        writes.add_deals(rows)
+
+    deals_by_home = {home: [] for home in home_airports}
+    for row in rows:
+        deals_by_home[row["home_airport"]].append(_deal_from_row(row))
+    _board.update(_index(deals_by_home))
+    log.info("refreshed deals board deals=%d home_airports=%d", len(rows), len(home_airports))
+
+
+def request_refresh(home_airport: str):
+    # Kick off a background refresh for a home airport we have nothing for yet
+    if home_airport in _refreshing:
+        return
+
+    async def run():
+        try:
+            await refresh_deals_board([home_airport])
+        finally:
+            _refreshing.discard(home_airport)
+
+    _refreshing.add(home_airport)
+    asyncio.ensure_future(run())
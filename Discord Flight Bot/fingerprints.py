@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from config import env_float, env_int
+from tracking_index import route_key
+
+# Routes we remember a fingerprint for, least recently checked are dropped first
+ROUTE_FINGERPRINT_CACHE_SIZE = env_int("ROUTE_FINGERPRINT_CACHE_SIZE", 50000, minimum=1)
+# A route counts as calm for a row while its cheapest fare is at least this far above
+# the row's max price (0.5 = 50% over)
+CALM_PRICE_MARGIN = env_float("CALM_PRICE_MARGIN", 0.5, minimum=0)
+# Each check of a calm route that finds the same offers doubles its interval, at most this many times
+MAX_BACKOFF_STEPS = env_int("MAX_BACKOFF_STEPS", 3, minimum=0)
+
+
+def offers_hash(offers) -> int:
+    # Order doesn't matter, a fare moving or an offer appearing/disappearing does
+    return hash(frozenset((offer.offer_id, offer.price) for offer in offers))
+
+
+@dataclass(slots=True)
+class RouteFingerprint:
+    min_price: int | None
+    offers_hash: int
+    changed_at: float           # when this set of offers was first seen
+    checked_at: float           # the last search that saw it
+    unchanged: int = 0          # searches in a row that found it again
+    evaluated: dict = field(default_factory=dict)   # row id -> max_price already checked against it
+
+'''
+What each route's last search found, reduced to its cheapest price and a hash of its
+offers. check_rows only filters and notifies a route's rows when the fingerprint changed
+(or for rows it hasn't checked against it yet), since the same offers against the same
+max price give the same answer. The scheduler backs off routes that keep coming back
+unchanged and far above every threshold. Per process and rebuilt by the first check
+of each route after a restart, which is then a full evaluation.
+'''
+class RouteFingerprints:
+    def __init__(self, max_entries: int = ROUTE_FINGERPRINT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()     # route key -> RouteFingerprint
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> RouteFingerprint | None:
+        return self._entries.get(key)
+
+    def observe(self, key: tuple, offers) -> tuple[RouteFingerprint, bool]:
+        # Records a search result for the route, returns its fingerprint and whether it changed
+        prices = [offer.price for offer in offers if offer.price is not None]
+        min_price = min(prices) if prices else None
+        digest = offers_hash(offers)
+        now = time.time()
+
+        fingerprint = self._entries.get(key)
+        if fingerprint is not None and fingerprint.min_price == min_price and fingerprint.offers_hash == digest:
+            fingerprint.unchanged += 1
+            fingerprint.checked_at = now
+            self._entries.move_to_end(key)
+            return fingerprint, False
+
+        fingerprint = RouteFingerprint(min_price, digest, changed_at=now, checked_at=now)
+        self._entries[key] = fingerprint
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return fingerprint, True
+
+    def backoff(self, row: dict) -> int:
+        # How many times longer than usual this row can wait for its next check
+        fingerprint = self._entries.get(route_key(row))
+        if fingerprint is None or not fingerprint.unchanged or fingerprint.min_price is None or not row.get("max_price"):
+            return 1
+        if fingerprint.min_price < row["max_price"] * (1 + CALM_PRICE_MARGIN):
+            return 1
+        return 2 ** min(fingerprint.unchanged, MAX_BACKOFF_STEPS)
+
+    def forget(self, key: tuple | None = None):
+        # One route, or every route when key is None
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+fingerprints = RouteFingerprints()
@@ -0,0 +1,1273 @@
+import argparse
+import asyncio
+import bisect
+import gc
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, UTC
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+log = logging.getLogger("harness")
+
+# Recorded google_flights response (JFK-LHR round trip) the fake SerpAPI replays for every route
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "fixtures", "google_flights_roundtrip.json")
+
+# Settings the harness applies before importing the bot, unless they are already set.
+# The real SerpAPI and Discord rate limits would turn every run into a test of the
+# token buckets, so they are opened up here; pass --env to put any of them back
+HARNESS_ENV = {
+    "DISCORD_CHANNEL_ID": "1000",
+    "SERPAPI_RATE_PER_SECOND": "1000",
+    "SERPAPI_BURST": "1000",
+    "SERPAPI_USER_RATE_PER_MINUTE": "600",
+    "SERPAPI_USER_BURST": "10",
+    "SERPAPI_DAILY_BUDGET": "0",
+    "SERPAPI_MONTHLY_BUDGET": "0",
+    "DISCORD_CHANNEL_RATE_PER_SECOND": "1000",
+    "DISCORD_CHANNEL_BURST": "100",
+    "DISCORD_GLOBAL_RATE_PER_SECOND": "1000",
+    "NOTIFY_ROUTE_SECONDS": "0.05",
+    "LOG_LEVEL": "WARNING",
+}
+
+# `python harness.py imports` fails when importing the bot spends longer than this in our own
+# modules (self time, third party packages aren't ours to fix), or when it loads any of the
+# DEFERRED_IMPORTS, which the bot only needs once it actually talks to Supabase or SerpAPI
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "40"))
+DEFERRED_IMPORTS = ("supabase", "postgrest", "serpapi", "requests")
+
+# US origins the scripted workloads fly out of, destinations come from data/regions.json
+ORIGINS = ("JFK", "LAX", "ORD", "SFO", "SEA", "BOS", "ATL", "DFW", "MIA", "DEN", "IAD", "AUS")
+
+
+def percentile(values: list[float], p: float) -> float:
+    # Nearest rank on the raw samples, the metrics histograms only know bucket bounds
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def latency_summary(values_ms: list[float]) -> dict:
+    return {
+        "count": len(values_ms),
+        "p50_ms": round(percentile(values_ms, 50), 1),
+        "p90_ms": round(percentile(values_ms, 90), 1),
+        "p99_ms": round(percentile(values_ms, 99), 1),
+        "max_ms": round(max(values_ms, default=0.0), 1),
+    }
+
+def import_profile(module: str) -> dict:
+    # Runs `python -X importtime -c "import <module>"` in a fresh interpreter and sums it up
+    here = os.path.dirname(os.path.abspath(__file__))
+    own = {name[:-3] for name in os.listdir(here) if name.endswith(".py")}
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=here, capture_output=True, text=True, check=True
+    ).stderr
+
+    own_ms, packages, loaded, total_ms = {}, {}, set(), 0.0
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Two spaces of indentation per nesting level, direct imports of the module are level 1
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        loaded.add(name.split(".")[0])
+        if name in own:
+            own_ms[name] = int(self_us) / 1000
+        elif depth == 1:
+            packages[name] = int(cumulative_us) / 1000
+        if name == module:
+            total_ms = int(cumulative_us) / 1000
+    return {
+        "module": module,
+        "import_ms": round(total_ms, 1),
+        "own_modules_ms": round(sum(own_ms.values()), 1),
+        "budget_ms": IMPORT_BUDGET_MS,
+        "deferred_loaded": sorted(loaded & set(DEFERRED_IMPORTS)),
+        "slowest_own": {k: round(v, 1) for k, v in sorted(own_ms.items(), key=lambda kv: -kv[1])[:5]},
+        "slowest_packages": {k: round(v, 1) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])[:5]},
+    }
+
+# ---------- SerpAPI ----------
+
+'''
+Local stand-in for serpapi.com. Every GET /search answers with the recorded fixture after
+`latency_ms` (plus up to `jitter_ms`), with the route's airport codes swapped in and its
+prices scaled by a factor derived from the query, so the same search always costs the
+same and different routes land on different sides of users' max prices. `error_rate`
+of the calls answer 503 to exercise retries, the breaker and stale fallbacks.
+'''
+class FakeSerpApi:
+    def __init__(self, fixture_path: str = FIXTURE_PATH, latency_ms: float = 200, jitter_ms: float = 50,
+                 error_rate: float = 0.0):
+        with open(fixture_path, encoding="utf-8") as f:
+            self.fixture = f.read()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self.routes = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = fake.respond(dict(parse_qsl(urlparse(self.path).query)))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-serpapi", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def respond(self, params: dict) -> tuple[int, bytes]:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.routes[(params.get("departure_id"), params.get("arrival_id"))] += 1
+        try:
+            time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+            if self.error_rate and random.random() < self.error_rate:
+                with self._lock:
+                    self.errors += 1
+                return 503, b'{"error": "fake upstream error"}'
+            return 200, json.dumps(self.results(params)).encode()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def results(self, params: dict) -> dict:
+        data = json.loads(self.fixture)
+        dep, arr = params.get("departure_id", "JFK"), params.get("arrival_id", "LHR")
+        key = "|".join(str(params.get(k)) for k in ("departure_id", "arrival_id", "outbound_date", "return_date", "type"))
+        factor = 0.55 + (zlib.crc32(key.encode()) % 1000) / 1000 * 0.9
+        for group in ("best_flights", "other_flights"):
+            for offer in data.get(group, []):
+                offer["price"] = round(offer["price"] * factor)
+                offer["flights"][0]["departure_airport"]["id"] = dep
+                offer["flights"][-1]["arrival_airport"]["id"] = arr
+        data["search_parameters"].update({k: v for k, v in params.items() if k in data["search_parameters"]})
+        return data
+
+# ---------- Supabase ----------
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    # The slice of the postgrest query builder db.py uses
+    def __init__(self, store, table: str):
+        self.store = store
+        self.table = table
+        self.op = "select"
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.order_by = None
+        self.descending = False
+        self.limit_rows = None
+
+    # Like postgrest's, each of these starts a new request, so db.py can reuse a table
+    # builder for several requests (chunks, keyset pages) without their filters piling up
+    def _start(self, op: str, payload=None, on_conflict=None):
+        query = FakeQuery(self.store, self.table)
+        query.op, query.payload, query.on_conflict = op, payload, on_conflict
+        return query
+
+    def select(self, columns: str = "*"):
+        return self._start("select")
+
+    def insert(self, payload):
+        return self._start("insert", payload)
+
+    def upsert(self, payload, on_conflict: str = ""):
+        return self._start("upsert", payload, on_conflict)
+
+    def update(self, payload: dict):
+        return self._start("update", payload)
+
+    def delete(self):
+        return self._start("delete")
+
+    def _filter(self, column, op, value):
+        self.filters.append((column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "in", set(values))
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def order(self, column, desc: bool = False):
+        self.order_by, self.descending = column, desc
+        return self
+
+    def limit(self, rows: int):
+        self.limit_rows = rows
+        return self
+
+    async def execute(self) -> FakeResponse:
+        return await self.store.execute(self)
+
+
+class FakeRpc:
+    def __init__(self, name: str):
+        self.name = name
+
+    async def execute(self):
+        raise NotImplementedError(f"{self.name} is plpgsql, `harness.py workers --database-url ...` runs it on a real Postgres")
+
+
+MATCHERS = {
+    "eq": lambda value, arg: value == arg,
+    "neq": lambda value, arg: value != arg,
+    "in": lambda value, arg: value in arg,
+    "gt": lambda value, arg: value is not None and value > arg,
+    "gte": lambda value, arg: value is not None and value >= arg,
+    "lt": lambda value, arg: value is not None and value < arg,
+    "lte": lambda value, arg: value is not None and value <= arg,
+}
+
+'''
+In-memory stand-in for the async Supabase client: every table is a dict of rows by a
+generated id, queries filter them in Python and hand back copies, the way PostgREST
+returns fresh JSON. Each request sleeps `latency_ms` first so round trips cost what they
+would over the network, and is counted per table and operation.
+'''
+class FakeSupabase:
+    def __init__(self, latency_ms: float = 5):
+        self.latency_ms = latency_ms
+        self.tables = defaultdict(dict)     # table -> id -> row
+        self.requests = Counter()           # "table.op" -> round trips
+        self.rows_read = 0
+        self.rows_written = 0
+        self._ids = itertools.count(1)
+        self._id_order = {}                 # table -> sorted ids, dropped on insert/delete
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict | None = None) -> FakeRpc:
+        return FakeRpc(name)
+
+    def seed(self, table: str, rows: list[dict]):
+        # Straight into the store, no latency and not counted
+        for row in rows:
+            self._insert(table, row)
+
+    def _insert(self, table: str, row: dict) -> dict:
+        row = dict(row)
+        row.setdefault("id", next(self._ids))
+        # What the updated_at trigger in schema.sql does, for every table here
+        row.setdefault("updated_at", datetime.now(UTC).isoformat())
+        self.tables[table][row["id"]] = row
+        self._id_order.pop(table, None)
+        return row
+
+    def _id_page(self, query: FakeQuery) -> list[dict]:
+        # A keyset page (order by id, limit n, maybe id > x) walks the ids from the bound and
+        # stops at the limit, like the primary key index would. Reading a big table page by
+        # page would otherwise scan and sort all of it for every page
+        ids = self._id_order.get(query.table)
+        if ids is None:
+            ids = self._id_order[query.table] = sorted(self.tables[query.table])
+        after = max((value for column, op, value in query.filters if column == "id" and op == "gt"), default=None)
+        rows, table = [], self.tables[query.table]
+        for row_id in itertools.islice(ids, 0 if after is None else bisect.bisect_right(ids, after), None):
+            row = table[row_id]
+            if all(MATCHERS[op](row.get(column), value) for column, op, value in query.filters):
+                rows.append(row)
+                if len(rows) == query.limit_rows:
+                    break
+        return rows
+
+    def _candidates(self, query: FakeQuery):
+        rows = self.tables[query.table]
+        for column, op, value in query.filters:
+            # Primary key lookups don't scan the table
+            if column == "id" and op == "eq":
+                return [rows[value]] if value in rows else []
+            if column == "id" and op == "in":
+                return [rows[v] for v in value if v in rows]
+        return rows.values()
+
+    def _matching(self, query: FakeQuery) -> list[dict]:
+        return [
+            row for row in self._candidates(query)
+            if all(MATCHERS[op](row.get(column), value) for column, op, value in query.filters)
+        ]
+
+    async def execute(self, query: FakeQuery) -> FakeResponse:
+        await asyncio.sleep(self.latency_ms / 1000)
+        self.requests[f"{query.table}.{query.op}"] += 1
+        payload = query.payload if isinstance(query.payload, list) else [query.payload] if query.payload else []
+
+        if query.op == "select":
+            if query.order_by == "id" and not query.descending and query.limit_rows is not None:
+                rows = self._id_page(query)
+            else:
+                rows = self._matching(query)
+            if query.order_by:
+                rows.sort(key=lambda row: (row.get(query.order_by) is None, row.get(query.order_by)), reverse=query.descending)
+            if query.limit_rows is not None:
+                rows = rows[:query.limit_rows]
+            self.rows_read += len(rows)
+            return FakeResponse([dict(row) for row in rows])
+
+        if query.op == "insert":
+            self.rows_written += len(payload)
+            return FakeResponse([dict(self._insert(query.table, row)) for row in payload])
+
+        if query.op == "upsert":
+            keys = [k.strip() for k in query.on_conflict.split(",") if k.strip()]
+            existing = {tuple(row.get(k) for k in keys): row for row in self.tables[query.table].values()}
+            written = []
+            for row in payload:
+                match = existing.get(tuple(row.get(k) for k in keys))
+                if match is not None:
+                    match.update(row, updated_at=datetime.now(UTC).isoformat())
+                else:
+                    match = self._insert(query.table, row)
+                written.append(dict(match))
+            self.rows_written += len(written)
+            return FakeResponse(written)
+
+        rows = self._matching(query)
+        if query.op == "update":
+            for row in rows:
+                row.update(query.payload, updated_at=datetime.now(UTC).isoformat())
+        else:
+            for row in rows:
+                del self.tables[query.table][row["id"]]
+            self._id_order.pop(query.table, None)
+        self.rows_written += len(rows)
+        return FakeResponse([dict(row) for row in rows])
+
+# ---------- Discord ----------
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, channel, content, embeds):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.content = content
+        self.embeds = embeds
+        self.view = None
+
+    async def edit(self, *, embed=None, view=None, **kwargs):
+        if embed is not None:
+            self.embeds = [embed]
+        self.view = view
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, latency_ms: float = 0):
+        self.id = channel_id
+        self.latency_ms = latency_ms
+        self.messages = []
+
+    async def send(self, content=None, *, embed=None, embeds=None, **kwargs) -> FakeMessage:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        message = FakeMessage(self, content, embeds or ([embed] if embed else []))
+        message.view = kwargs.get("view")
+        self.messages.append(message)
+        return message
+
+
+class FakeUser:
+    def __init__(self, user_id: int, latency_ms: float = 0):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.dm_channel = None
+        self.latency_ms = latency_ms
+
+    async def create_dm(self) -> FakeChannel:
+        self.dm_channel = FakeChannel(self.id, self.latency_ms)
+        return self.dm_channel
+
+
+class FakeContext:
+    # Enough of commands.Context for the command callbacks: who ran it and where replies go
+    def __init__(self, user: FakeUser, channel: FakeChannel):
+        self.author = user
+        self.channel = channel
+
+    async def send(self, content=None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeDiscord:
+    # What AlertDispatcher needs from the bot: channels and users by id
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.channels = {}
+        self.users = {}
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        if channel_id not in self.channels:
+            self.channels[channel_id] = FakeChannel(channel_id, self.latency_ms)
+        return self.channels[channel_id]
+
+    async def fetch_channel(self, channel_id: int) -> FakeChannel:
+        return self.get_channel(channel_id)
+
+    def get_user(self, user_id: int) -> FakeUser:
+        if user_id not in self.users:
+            self.users[user_id] = FakeUser(user_id, self.latency_ms)
+        return self.users[user_id]
+
+    async def fetch_user(self, user_id: int) -> FakeUser:
+        return self.get_user(user_id)
+
+    def messages(self) -> list[FakeMessage]:
+        channels = list(self.channels.values()) + [u.dm_channel for u in self.users.values() if u.dm_channel]
+        return [message for channel in channels for message in channel.messages]
+
+# ---------- Postgres ----------
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+
+def schema_statements(*tables: str) -> list[str]:
+    # The schema.sql statements that mention any of the tables, plus the trigger functions
+    # that mention none, so the Postgres workloads run the same DDL and functions as
+    # production. Splits on ; outside $$ bodies
+    with open(SCHEMA_PATH) as f:
+        text = "\n".join(line for line in f.read().splitlines() if not line.lstrip().startswith("--"))
+    statements, current = [], ""
+    for i, part in enumerate(text.split("$$")):
+        if i % 2:
+            current += "$$" + part + "$$"
+            continue
+        pieces = part.split(";")
+        pieces[0] = current + pieces[0]
+        statements += pieces[:-1]
+        current = pieces[-1]
+    statements.append(current)
+    return [s.strip() for s in statements if s.strip() and (
+        any(f'"{t}"' in s for t in tables) or ("returns trigger" in s and '"' not in s)
+    )]
+
+
+class PostgresSandbox:
+    # A throwaway schema in the database at --database-url (or DATABASE_URL), dropped again
+    # on exit. Needs psycopg2, which the bot itself never imports
+    def __init__(self, url: str):
+        if not url:
+            raise SystemExit("this workload needs a Postgres: pass --database-url or set DATABASE_URL")
+        try:
+            import psycopg2
+        except ImportError:
+            raise SystemExit("this workload needs psycopg2: pip install psycopg2-binary")
+        self.psycopg2 = psycopg2
+        self.url = url
+        self.schema = f"harness_{os.getpid()}"
+
+    def connect(self):
+        conn = self.psycopg2.connect(self.url, options=f"-c search_path={self.schema}")
+        conn.autocommit = True
+        return conn
+
+    def __enter__(self):
+        with self.psycopg2.connect(self.url) as conn, conn.cursor() as cur:
+            cur.execute(f"create schema {self.schema}")
+        return self
+
+    def __exit__(self, *exc):
+        conn = self.psycopg2.connect(self.url)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"drop schema {self.schema} cascade")
+        conn.close()
+
+# FlightTracking as it was before schema.sql, which only adds columns to it
+FLIGHT_TRACKING_BASE = """
+create table "FlightTracking" (
+    id bigint generated always as identity primary key,
+    user_id text not null,
+    departure_id text not null,
+    arrival_id text not null,
+    outbound_date date not null,
+    return_date date not null,
+    max_price integer not null,
+    alert_sent boolean not null default false,
+    last_checked timestamptz
+)
+"""
+
+
+def claim_loop(url: str, schema: str, worker: str, shard: int, shards: int, route_ms: float):
+    # One worker process: claim due routes like worker.py does, "search" each claimed route
+    # for route_ms, record what it got and release the rows. Exits once nothing is left
+    import psycopg2
+    conn = psycopg2.connect(url, options=f"-c search_path={schema}")
+    conn.autocommit = True
+    cur = conn.cursor()
+    while True:
+        cur.execute("select id, departure_id, arrival_id from claim_due_routes(%s, 8, 600, %s, %s)", (worker, shard, shards))
+        rows = cur.fetchall()
+        if not rows:
+            cur.execute('select count(*) from "FlightTracking" where next_check_at is null')
+            if cur.fetchone()[0] == 0:
+                break
+            time.sleep(0.005)   # the rest is claimed by someone else right now
+            continue
+        for _ in {(dep, arr) for _, dep, arr in rows}:
+            time.sleep(route_ms / 1000)
+        cur.executemany("insert into claims values (%s, %s, %s)", [(worker, row_id, dep + arr) for row_id, dep, arr in rows])
+        cur.execute(
+            'update "FlightTracking" set next_check_at = now() + interval \'1 day\', claimed_by = null, claimed_until = null where id = any(%s)',
+            ([row[0] for row in rows],)
+        )
+    conn.close()
+
+
+def workers_benchmark(args) -> dict:
+    # Drains the same backlog with 1, 2, 4... worker processes through claim_due_routes and
+    # checks that every row was claimed exactly once and no route was split between workers
+    import multiprocessing
+    report = {}
+    with PostgresSandbox(args.database_url) as sandbox:
+        conn = sandbox.connect()
+        cur = conn.cursor()
+        cur.execute(FLIGHT_TRACKING_BASE)
+        for statement in schema_statements("FlightTracking"):
+            cur.execute(statement)
+        cur.execute("create table claims (worker text, id bigint, route text)")
+        outbound = date.today() + timedelta(days=60)
+
+        for count in (int(n) for n in args.worker_counts.split(",")):
+            cur.execute('truncate "FlightTracking", claims')
+            cur.executemany(
+                'insert into "FlightTracking" (user_id, departure_id, arrival_id, outbound_date, return_date, max_price, last_checked) '
+                "values (%s, %s, %s, %s, %s, 500, now() - interval '7 days')",
+                [(str(user), f"A{route % 26:02d}", f"B{route // 26:02d}", outbound, outbound + timedelta(days=7))
+                 for route in range(args.worker_routes) for user in range(args.rows_per_route)]
+            )
+            shards = count if args.sharded else 1
+            processes = [
+                multiprocessing.Process(target=claim_loop, args=(sandbox.url, sandbox.schema, f"w{i}", i % shards, shards, args.route_ms))
+                for i in range(count)
+            ]
+            started = time.perf_counter()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            seconds = time.perf_counter() - started
+
+            cur.execute("select count(*), count(distinct id) from claims")
+            claimed, distinct = cur.fetchone()
+            cur.execute("select count(*) from (select route from claims group by route having count(distinct worker) > 1) split")
+            split = cur.fetchone()[0]
+            report[f"workers_{count}"] = {
+                "seconds": round(seconds, 2),
+                "speedup": round(report["workers_1"]["seconds"] / seconds, 2) if "workers_1" in report else 1.0,
+                "rows_claimed": claimed,
+                "rows_claimed_twice": claimed - distinct,
+                "routes_split": split,
+            }
+        conn.close()
+    return {
+        "config": {"routes": args.worker_routes, "rows_per_route": args.rows_per_route, "route_ms": args.route_ms, "sharded": args.sharded},
+        **report,
+    }
+
+# ---------- write batching ----------
+
+async def batching_check(sizes=(10, 100, 1000, 2500)) -> dict:
+    # Buffers the bookkeeping of one alert run of each size (last_checked for every row, a
+    # tenth alerted, one deal, price observation and delivery per row) in a WriteBehind, flushes it once and
+    # counts the requests FakeSupabase saw. Every size should cost the same number
+    from batching import WriteBehind
+    from services import services
+    report = {}
+    for size in sizes:
+        store = FakeSupabase(latency_ms=0)
+        services.override(supabase=store)
+        store.seed("FlightTracking", [{"id": i, "alert_sent": False} for i in range(size)])
+        buffer = WriteBehind(flush_size=size + 1, flush_seconds=3600)
+        for i in range(size):
+            # Rows on the same route share a price, five routes here
+            buffer.mark_checked(i, last_price=100 + i % 5)
+            if i % 10 == 0:
+                buffer.mark_alerted(i)
+            buffer.add_deals([{"region": "Europe", "airport_code": "LHR", "price": 300 + i}])
+            buffer.add_price_observation({"departure_id": "JFK", "arrival_id": "LHR", "min_price": 300 + i})
+            buffer.add_delivery({"tracking_id": i, "user_id": str(i), "status": "delivered"})
+        await buffer.flush()
+        rows = store.tables["FlightTracking"].values()
+        report[f"rows_{size}"] = {
+            "round_trips": buffer.round_trips,
+            "requests": sum(store.requests.values()),
+            "rows_written": store.rows_written,
+            "rows_checked": sum(1 for row in rows if row.get("last_price") is not None),
+        }
+    return report
+
+# ---------- micro-benchmarks ----------
+
+def mean_us(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return round((time.perf_counter() - started) / repeat * 1e6, 1)
+
+
+def retained_bytes(build, copies: int) -> int:
+    # Memory still held per copy once `copies` results of build() are kept alive together
+    gc.collect()
+    tracemalloc.start()
+    try:
+        kept = [build() for _ in range(copies)]
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return size // copies
+
+
+def models_benchmark(copies: int) -> dict:
+    # The recorded response kept as raw JSON (what the fare cache used to hold) against the
+    # parsed SearchResult: parse time, memory retained per cached response, FareCache row size
+    from models import SearchResult, parse_results
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        raw = f.read()
+    parsed = parse_results(json.loads(raw))
+    cache_row = json.dumps(parsed.to_dict())
+    return {
+        "offers": len(parsed.offers),
+        "copies": copies,
+        "json_loads_us": mean_us(lambda: json.loads(raw), copies),
+        "parse_results_us": mean_us(lambda: parse_results(json.loads(raw)), copies),
+        "from_cache_row_us": mean_us(lambda: SearchResult.from_dict(json.loads(cache_row)), copies),
+        "retained_bytes_dicts": retained_bytes(lambda: json.loads(raw), copies),
+        "retained_bytes_models": retained_bytes(lambda: parse_results(json.loads(raw)), copies),
+        "raw_bytes": len(raw),
+        "cache_row_bytes": len(cache_row),
+    }
+
+
+def render_benchmark(users: int) -> dict:
+    # One route's alert fan-out: the first user's embed formats every offer, the others
+    # reuse the memoized offer blocks and only pay for building the embed itself
+    import render
+    from models import parse_results
+    from tracking_index import route_key
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        results = parse_results(json.load(f))
+    offers = results.cheapest(3)
+    rows = [{"id": i, "user_id": str(i), "departure_id": "JFK", "arrival_id": "LHR", "max_price": offers[-1].price,
+             "outbound_date": "2026-12-01", "return_date": "2026-12-08"} for i in range(users)]
+    route = route_key(rows[0])
+
+    def format_offers(cold: bool):
+        if cold:
+            render._offer_blocks.clear()
+        for offer in offers:
+            render.offer_block(route, offer)
+
+    def alert(row: dict, cold: bool):
+        if cold:
+            render._offer_blocks.clear()
+        return render.alert_embed(row, route, offers, results.google_flights_url)
+
+    embed = alert(rows[0], cold=True)
+    return {
+        "offers_per_embed": len(offers),
+        "users": users,
+        "offer_blocks_cold_us": mean_us(lambda: format_offers(cold=True), users),
+        "offer_blocks_memoized_us": mean_us(lambda: format_offers(cold=False), users),
+        "first_user_embed_us": mean_us(lambda: alert(rows[0], cold=True), users),
+        "next_user_embed_us": mean_us(lambda: alert(rows[random.randrange(users)], cold=False), users),
+        "embed_chars": len(embed),
+        "embed_limit": render.MAX_EMBED_TOTAL,
+    }
+
+
+def airports_benchmark(lookups: int) -> dict:
+    # Loading the bundled airport list, then code checks and autocomplete queries of each kind
+    from airports import AirportIndex
+
+    def loaded() -> AirportIndex:
+        index = AirportIndex()
+        len(index)
+        return index
+
+    started = time.perf_counter()
+    index = loaded()
+    load_ms = (time.perf_counter() - started) * 1000
+    count = len(index)
+
+    codes = random.sample(index.codes, min(lookups, count))
+    queries = {
+        "code_prefix": ["J", "JF", "LH", "SF"],
+        "exact_code": ["JFK", "LHR", "NRT", "CDG"],
+        "city_or_name": ["london", "new york", "san fran", "heathrow"],
+        "code_typo": ["JKF", "LRH", "CGD", "NTR"],
+        "fuzzy_miss": ["kenedy", "hethrow", "frankfrut", "barcelna"],
+        # Only separators, no words to look up
+        "no_words": ["--", "- -", "-", " - "],
+    }
+    report = {
+        "airports": count,
+        "load_ms": round(load_ms, 1),
+        # Traced on a second load, tracemalloc slows loading down several times
+        "load_traced_kb": retained_bytes(loaded, 1) // 1024,
+        "is_valid_us": mean_us(lambda: index.is_valid(random.choice(codes)), lookups),
+        "unknown_codes": sum(1 for code in codes if not index.is_valid(code)),
+    }
+    for kind, texts in queries.items():
+        report[f"search_{kind}_us"] = round(mean_us(lambda: [index.search(text) for text in texts], max(1, lookups // len(texts))) / len(texts), 1)
+    return report
+
+# ---------- workloads ----------
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.serpapi = FakeSerpApi(latency_ms=args.serp_latency_ms, jitter_ms=args.serp_jitter_ms, error_rate=args.error_rate)
+        self.supabase = FakeSupabase(latency_ms=args.db_latency_ms)
+        self.discord = FakeDiscord(latency_ms=args.discord_latency_ms)
+        self.bot = None
+
+    def start(self):
+        # Configuration is read at import time, so the environment has to be in place first
+        for item in self.args.env:
+            key, _, value = item.partition("=")
+            os.environ[key] = value
+        for key, value in HARNESS_ENV.items():
+            os.environ.setdefault(key, value)
+        os.environ["SERPAPI_BACKEND"] = self.serpapi.start()
+
+        # Importing bot.py registers the real commands without connecting to Discord
+        import bot
+        from config import configure_logging
+        from notifications import dispatcher
+        from services import services
+        configure_logging()
+        self.bot = bot.bot
+        services.override(supabase=self.supabase)
+        dispatcher.start(self.discord)
+
+    def routes(self, count: int) -> list[tuple[str, str]]:
+        from utils import load_regions
+        destinations = list(dict.fromkeys(code for codes in load_regions().values() for code in codes))
+        pairs = [(o, d) for o, d in itertools.product(ORIGINS, destinations) if o != d]
+        random.shuffle(pairs)
+        return pairs[:count]
+
+    async def lookups(self) -> dict:
+        # N users run !lookup_flight at the same moment, over a smaller pool of routes
+        import metrics
+        from batching import writes
+        n, args = self.args.lookups, self.args
+        routes = self.routes(args.routes or max(1, n // 4))
+        outbound = date.today() + timedelta(days=30)
+        callback = self.bot.get_command("lookup_flight").callback
+        channel = self.discord.get_channel(2000)
+        semaphore = asyncio.Semaphore(args.concurrency or n)
+        latencies = []
+
+        async def one(i):
+            dep, arr = routes[i % len(routes)]
+            ret = outbound + timedelta(days=random.choice((3, 5, 7, 10, 14)))
+            async with semaphore:
+                started = time.perf_counter()
+                await callback(FakeContext(FakeUser(10_000 + i), channel), dep, arr, outbound.isoformat(), ret.isoformat(), random.randint(200, 900))
+                elapsed = (time.perf_counter() - started) * 1000
+            metrics.observe("command.lookup_flight", elapsed)
+            latencies.append(elapsed)
+
+        calls_before = self.serpapi.calls
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        elapsed = time.perf_counter() - started
+        await writes.flush()
+
+        # Grouped by the leading emoji, e.g. 🔍 searching, 🎯 under budget, 💡 saved, ⚠️ failed
+        replies = Counter()
+        for message in channel.messages:
+            text = message.embeds[0].title if message.embeds else message.content
+            replies[(text or "?").split(" ")[0]] += 1
+        return {
+            "lookups": n,
+            "routes": len(routes),
+            "concurrency": args.concurrency or n,
+            "seconds": round(elapsed, 3),
+            "lookups_per_second": round(n / elapsed, 1),
+            "latency": latency_summary(latencies),
+            "serpapi_calls": self.serpapi.calls - calls_before,
+            "tracked_rows": len(self.supabase.tables["FlightTracking"]),
+            "replies": dict(replies.most_common()),
+        }
+
+    def seed_tracking(self, rows: int, routes: int, users: int):
+        pairs = self.routes(routes)
+        today = date.today()
+        now = datetime.now(UTC).isoformat()
+        self.supabase.seed("FlightTracking", [
+            {
+                "user_id": str(10_000 + random.randrange(users)),
+                "departure_id": pairs[i % len(pairs)][0],
+                "arrival_id": pairs[i % len(pairs)][1],
+                "outbound_date": (today + timedelta(days=30)).isoformat(),
+                # Route key includes the trip length, keep it per route so routes stay routes
+                "return_date": (today + timedelta(days=30 + 3 + i % len(pairs) % 12)).isoformat(),
+                "max_price": random.randint(100, 400),
+                "alert_sent": False,
+                "last_checked": now,
+            }
+            for i in range(rows)
+        ])
+
+    async def alerts(self) -> dict:
+        # One full sweep over every pending row: load the route index, search, fan out, deliver
+        args = self.args
+        from alerts import run_alert_check
+        from batching import writes
+        from notifications import dispatcher
+        from tracking_index import tracking
+
+        self.seed_tracking(args.rows, args.alert_routes, args.users)
+        requests_before = sum(self.supabase.requests.values())
+        calls_before = self.serpapi.calls
+        messages_before = len(self.discord.messages())
+
+        started = time.perf_counter()
+        await tracking.load()
+        loaded = time.perf_counter()
+        stats = await run_alert_check(dispatcher.notify)
+        checked = time.perf_counter()
+        await dispatcher.drain(timeout=600)
+        await writes.flush()
+        finished = time.perf_counter()
+        first_sweep = {
+            "serpapi_calls": self.serpapi.calls - calls_before,
+            "db_requests": sum(self.supabase.requests.values()) - requests_before,
+        }
+        repeats = [await self.repeat_sweep() for _ in range(args.sweeps - 1)]
+
+        return {
+            "rows": args.rows,
+            "routes": stats["routes"],
+            "users": args.users,
+            "index_load_seconds": round(loaded - started, 3),
+            "check_seconds": round(checked - loaded, 3),
+            "delivery_seconds": round(finished - checked, 3),
+            "rows_per_second": round(args.rows / (checked - started), 1),
+            "serpapi_calls": first_sweep["serpapi_calls"],
+            "alerts_sent": stats["alerts_sent"],
+            "drops_sent": stats["drops_sent"],
+            "discord_messages": len(self.discord.messages()) - messages_before,
+            "embeds_delivered": dispatcher.sent,
+            "db_requests": first_sweep["db_requests"],
+            **{f"sweep_{i}": repeat for i, repeat in enumerate(repeats, start=2)},
+        }
+
+    async def repeat_sweep(self) -> dict:
+        # The same rows again with the fare cache emptied, so every route is searched upstream
+        # and comes back with the same offers, which is what most real re-checks look like
+        from alerts import run_alert_check
+        from batching import writes
+        from cache import fare_cache
+        from notifications import dispatcher
+        fare_cache.clear()
+        self.supabase.tables["FareCache"].clear()
+        requests_before = sum(self.supabase.requests.values())
+        calls_before = self.serpapi.calls
+        started = time.perf_counter()
+        stats = await run_alert_check(dispatcher.notify)
+        await dispatcher.drain(timeout=600)
+        await writes.flush()
+        return {
+            "seconds": round(time.perf_counter() - started, 3),
+            "serpapi_calls": self.serpapi.calls - calls_before,
+            "alerts_sent": stats["alerts_sent"],
+            "drops_sent": stats["drops_sent"],
+            "routes_unchanged": stats["routes_unchanged"],
+            "rows_skipped": stats["rows_skipped"],
+            "db_requests": sum(self.supabase.requests.values()) - requests_before,
+            "db_requests_avoided": stats["db_requests_avoided"],
+        }
+
+    async def history(self) -> dict:
+        # --observations price observations on --history-routes busy routes go through the
+        # write-behind buffer, then each route's window is read back the way !price_history
+        # and drop detection read it
+        import history
+        from batching import writes
+        args = self.args
+        pairs = self.routes(args.history_routes)
+        now = datetime.now(UTC)
+        # Spread over the last 20 days so every observation is inside HISTORY_WINDOW_DAYS
+        step = timedelta(days=20) / args.observations
+        newest = {}
+
+        inserts_before = self.supabase.requests["PriceHistory.insert"]
+        started = time.perf_counter()
+        for i in range(args.observations):
+            dep, arr = pairs[i % len(pairs)]
+            observed_at = (now - step * (args.observations - i)).isoformat()
+            writes.add_price_observation({
+                "departure_id": dep, "arrival_id": arr, "outbound_date": None, "trip_length": 7,
+                "min_price": random.randint(150, 900), "observed_at": observed_at,
+            })
+            newest[(dep, arr)] = observed_at
+            if i % 1000 == 0:
+                await asyncio.sleep(0)  # let size-triggered flushes run
+        await writes.flush()
+        insert_seconds = time.perf_counter() - started
+
+        latencies, returned, stale = [], [], 0
+        for i in range(args.history_queries):
+            dep, arr = pairs[i % len(pairs)]
+            started = time.perf_counter()
+            rows = await history.route_history(dep, arr)
+            latencies.append((time.perf_counter() - started) * 1000)
+            returned.append(len(rows))
+            if not rows or rows[-1]["observed_at"] != newest[(dep, arr)]:
+                stale += 1
+
+        result = {
+            "observations": args.observations,
+            "routes": len(pairs),
+            "insert_seconds": round(insert_seconds, 3),
+            "inserts_per_second": round(args.observations / insert_seconds, 1),
+            "insert_round_trips": self.supabase.requests["PriceHistory.insert"] - inserts_before,
+            "queries": args.history_queries,
+            "query_latency": latency_summary(latencies),
+            "rows_per_query": max(returned, default=0),
+            # Queries whose last row isn't the route's newest observation, should be 0
+            "queries_missing_newest": stale,
+        }
+        if args.database_url:
+            result["postgres"] = await asyncio.to_thread(self.history_postgres)
+        return result
+
+    def history_postgres(self) -> dict:
+        # The same table, index and query as production at --pg-observations rows
+        args = self.args
+        import io
+        pairs = self.routes(args.history_routes)
+        with PostgresSandbox(args.database_url) as sandbox:
+            conn = sandbox.connect()
+            cur = conn.cursor()
+            for statement in schema_statements("PriceHistory"):
+                cur.execute(statement)
+
+            now = datetime.now(UTC)
+            step = timedelta(days=20) / args.pg_observations
+            started = time.perf_counter()
+            for start in range(0, args.pg_observations, 100_000):
+                buffer = io.StringIO()
+                for i in range(start, min(args.pg_observations, start + 100_000)):
+                    dep, arr = pairs[i % len(pairs)]
+                    buffer.write(f"{dep}\t{arr}\t7\t{random.randint(150, 900)}\t{(now - step * (args.pg_observations - i)).isoformat()}\n")
+                buffer.seek(0)
+                cur.copy_expert('copy "PriceHistory" (departure_id, arrival_id, trip_length, min_price, observed_at) from stdin', buffer)
+            insert_seconds = time.perf_counter() - started
+            cur.execute('analyze "PriceHistory"')
+
+            # What PostgREST runs for db.list_price_history
+            query = (
+                'select outbound_date, trip_length, min_price, observed_at from "PriceHistory" '
+                "where departure_id = %s and arrival_id = %s and observed_at >= %s and trip_length = %s "
+                "order by observed_at desc limit 5000"
+            )
+            since = now - timedelta(days=30)
+            cur.execute("explain " + query, (*pairs[0], since, 7))
+            plan = " / ".join(row[0].strip() for row in cur.fetchall()[:2])
+            latencies = []
+            for i in range(args.history_queries):
+                started = time.perf_counter()
+                cur.execute(query, (*pairs[i % len(pairs)], since, 7))
+                cur.fetchall()
+                latencies.append((time.perf_counter() - started) * 1000)
+            conn.close()
+        return {
+            "observations": args.pg_observations,
+            "copy_seconds": round(insert_seconds, 3),
+            "rows_per_second": round(args.pg_observations / insert_seconds, 1),
+            "query_latency": latency_summary(latencies),
+            "queries_per_second": round(len(latencies) / (sum(latencies) / 1000), 1),
+            "plan": plan,
+        }
+
+    async def index(self) -> dict:
+        # The tracking index against the per-request queries it replaced, at --rows rows:
+        # a !my_flights page and a route's rows for the alert engine, plus the cost of an insert
+        import db
+        from tracking_index import route_key, tracking
+        args = self.args
+        self.seed_tracking(args.rows, args.alert_routes, args.users)
+        rows = list(self.supabase.tables["FlightTracking"].values())
+        samples = random.sample(rows, min(args.index_lookups, len(rows)))
+
+        async def timed(fn) -> dict:
+            requests_before = sum(self.supabase.requests.values())
+            latencies = []
+            for row in samples:
+                started = time.perf_counter()
+                await fn(row)
+                latencies.append((time.perf_counter() - started) * 1000)
+            return {
+                **latency_summary(latencies),
+                "mean_us": round(sum(latencies) / len(latencies) * 1000, 1),
+                "round_trips": sum(self.supabase.requests.values()) - requests_before,
+            }
+
+        async def route_query(row):
+            table = await db._table("FlightTracking")
+            found = (await table.select("*").eq("departure_id", row["departure_id"]).eq("arrival_id", row["arrival_id"])
+                     .eq("alert_sent", False).execute()).data
+            return [r for r in found if route_key(r) == route_key(row)]
+
+        async def index_route(row):
+            return tracking.for_route(route_key(row))
+
+        async def index_page(row):
+            return tracking.user_page(row["user_id"])
+
+        async def index_insert(row):
+            tracking.add({**row, "id": -row["id"]})
+
+        before = {
+            "my_flights_page": await timed(lambda row: db.list_user_tracking_page(row["user_id"])),
+            "route_rows": await timed(route_query),
+        }
+        started = time.perf_counter()
+        await tracking.load()
+        load_seconds = time.perf_counter() - started
+        after = {
+            "my_flights_page": await timed(index_page),
+            "route_rows": await timed(index_route),
+            "insert": await timed(index_insert),
+        }
+        return {
+            "rows": args.rows,
+            "lookups": len(samples),
+            "load_seconds": round(load_seconds, 3),
+            "queries": before,
+            "index": after,
+            # FakeSupabase filters in Python without indexes, so the query side is pessimistic
+            # for a real Postgres; the round trips are what carries over
+            "speedup": {name: round(before[name]["mean_us"] / after[name]["mean_us"]) for name in before},
+        }
+
+    def report(self, results: dict) -> dict:
+        from quota import quota
+        usage = defaultdict(lambda: {"calls": 0, "cache_hits": 0})
+        for (_, feature), counts in quota.usage.items():
+            usage[feature]["calls"] += counts["calls"]
+            usage[feature]["cache_hits"] += counts["cache_hits"]
+        return {
+            "config": {
+                "serp_latency_ms": self.args.serp_latency_ms,
+                "db_latency_ms": self.args.db_latency_ms,
+                "error_rate": self.args.error_rate,
+                "search_concurrency": int(os.environ.get("SEARCH_CONCURRENCY", "8")),
+            },
+            **results,
+            "serpapi": {
+                "calls": self.serpapi.calls,
+                "errors": self.serpapi.errors,
+                "max_in_flight": self.serpapi.max_in_flight,
+                "distinct_routes": len(self.serpapi.routes),
+            },
+            "api_usage": dict(usage),
+            "db": {
+                "requests": sum(self.supabase.requests.values()),
+                "rows_read": self.supabase.rows_read,
+                "rows_written": self.supabase.rows_written,
+                "by_table": dict(sorted(self.supabase.requests.items())),
+            },
+        }
+
+    async def measure(self, workload) -> dict:
+        # Each workload starts with empty stage metrics and a closed circuit, caches stay warm
+        import metrics
+        import search
+        metrics.reset()
+        search.breaker = search.CircuitBreaker()
+        result = await workload()
+        snapshot = metrics.snapshot()
+        return {**result, "stages": snapshot["latency"], "counters": snapshot["counters"]}
+
+    async def run(self) -> dict:
+        results = {}
+        if self.args.workload in ("lookups", "all"):
+            results["lookup_workload"] = await self.measure(self.lookups)
+        if self.args.workload in ("alerts", "all"):
+            results["alert_workload"] = await self.measure(self.alerts)
+        if self.args.workload == "index":
+            results["index_workload"] = await self.measure(self.index)
+        if self.args.workload == "history":
+            results["history_workload"] = await self.measure(self.history)
+        from quota import quota
+        await quota.flush_usage()
+        return self.report(results)
+
+
+def print_report(report: dict, indent: str = ""):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print(f"{indent}{key}:")
+            print_report(value, indent + "  ")
+        else:
+            print(f"{indent}{key}={value}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the bot's real commands and alert checks against a fake SerpAPI, Supabase and Discord."
+    )
+    parser.add_argument("workload", choices=("lookups", "alerts", "all", "index", "history", "workers", "batching", "imports", "models", "render", "airports"),
+                        help="scripted workload to run, `imports` to check the import time budget, or a micro-benchmark")
+    parser.add_argument("--lookups", type=int, default=1000, help="!lookup_flight calls, all started at once")
+    parser.add_argument("--routes", type=int, default=0, help="distinct lookup routes (default: lookups / 4)")
+    parser.add_argument("--concurrency", type=int, default=0, help="cap on lookups in flight (default: all of them)")
+    parser.add_argument("--rows", type=int, default=50_000, help="pending FlightTracking rows for the alert run")
+    parser.add_argument("--alert-routes", type=int, default=500, help="distinct routes those rows spread over")
+    parser.add_argument("--sweeps", type=int, default=1, help="alert runs over the same rows, later ones show what incremental evaluation skips")
+    parser.add_argument("--users", type=int, default=5000, help="distinct users owning the rows")
+    parser.add_argument("--index-lookups", type=int, default=200, help="lookups of each kind in the index workload")
+    parser.add_argument("--observations", type=int, default=200_000, help="price observations for the history workload")
+    parser.add_argument("--history-routes", type=int, default=20, help="routes those observations spread over")
+    parser.add_argument("--history-queries", type=int, default=50, help="route_history reads after the inserts")
+    parser.add_argument("--pg-observations", type=int, default=2_000_000, help="observations for the Postgres part of the history workload")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="Postgres for the workloads that need real SQL (history, workers), a throwaway schema is used")
+    parser.add_argument("--worker-counts", default="1,2,4,8", help="worker processes to try in the workers workload")
+    parser.add_argument("--worker-routes", type=int, default=400, help="due routes the workers drain")
+    parser.add_argument("--rows-per-route", type=int, default=5, help="tracked rows on each of those routes")
+    parser.add_argument("--route-ms", type=float, default=50, help="simulated search time per claimed route")
+    parser.add_argument("--sharded", action="store_true", help="give each worker its own WORKER_SHARD")
+    parser.add_argument("--copies", type=int, default=500, help="parsed copies of the recorded response in the models benchmark")
+    parser.add_argument("--render-users", type=int, default=2000, help="users on the one route the render benchmark alerts")
+    parser.add_argument("--airport-lookups", type=int, default=2000, help="code checks and autocomplete queries in the airports benchmark")
+    parser.add_argument("--serp-latency-ms", type=float, default=200, help="fake SerpAPI response time")
+    parser.add_argument("--serp-jitter-ms", type=float, default=50, help="random extra SerpAPI response time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of SerpAPI calls that answer 503")
+    parser.add_argument("--db-latency-ms", type=float, default=5, help="round trip to the fake Supabase")
+    parser.add_argument("--discord-latency-ms", type=float, default=30, help="round trip to the fake Discord")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="bot setting, e.g. SEARCH_CONCURRENCY=16")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the workloads")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+'''
+Offline benchmark: `python harness.py lookups --lookups 1000` or
+`python harness.py alerts --rows 50000`, and `python harness.py imports` for the
+import time budget. Nothing leaves the machine, SerpAPI, Supabase
+and Discord are all replaced by the fakes above, and the report has p50/p99 latencies,
+throughput, upstream call counts and DB round trips next to the bot's own stage metrics.
+`python harness.py batching` fails unless one flush of the write-behind buffer costs the
+same number of round trips whatever the number of rows in it.
+`python harness.py models` times parse_results on the recorded response and fails if
+the parsed models hold more memory than the raw JSON they replace.
+`python harness.py render` times one route's alert embeds, first user against the rest.
+`python harness.py airports` times loading the airport index, code checks and autocomplete.
+`history` and `workers` also run their SQL on a real Postgres when given --database-url
+(`workers` needs one), inside a throwaway schema.
+'''
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    if args.workload == "imports":
+        # Fresh interpreters, nothing from this process is reused
+        report = {module: import_profile(module) for module in ("bot", "worker")}
+        failed = [f"import budget exceeded: {m}" for m, p in report.items() if p["own_modules_ms"] > IMPORT_BUDGET_MS or p["deferred_loaded"]]
+    elif args.workload == "batching":
+        for item in args.env:
+            key, _, value = item.partition("=")
+            os.environ[key] = value
+        report = asyncio.run(batching_check())
+        costs = {(run["round_trips"], run["requests"]) for run in report.values()}
+        failed = [f"write batching cost grows with the number of rows: {report}"] if len(costs) > 1 else []
+        failed += [f"{name} lost writes" for name, run in report.items() if run["rows_checked"] != int(name.split("_")[1])]
+    elif args.workload == "workers":
+        report = workers_benchmark(args)
+        bad = [name for name, run in report.items() if name != "config" and (run["rows_claimed_twice"] or run["routes_split"])]
+        failed = [f"{name} claimed rows twice or split routes" for name in bad]
+    elif args.workload == "models":
+        report = models_benchmark(args.copies)
+        failed = ["parsed models hold more memory than the raw JSON"] if report["retained_bytes_models"] >= report["retained_bytes_dicts"] else []
+    elif args.workload == "render":
+        report = render_benchmark(args.render_users)
+        failed = ["memoized offer blocks are no cheaper than formatting them"] if report["offer_blocks_memoized_us"] >= report["offer_blocks_cold_us"] else []
+        failed += [f"alert embed over Discord's limit: {report['embed_chars']} chars"] if report["embed_chars"] > report["embed_limit"] else []
+    elif args.workload == "airports":
+        report = airports_benchmark(args.airport_lookups)
+        failed = [f"{report['unknown_codes']} bundled codes fail is_valid"] if report["unknown_codes"] else []
+    else:
+        harness = Harness(args)
+        harness.start()
+        try:
+            report = asyncio.run(harness.run())
+        finally:
+            harness.serpapi.stop()
+        failed = []
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if failed:
+        raise SystemExit("; ".join(failed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import logging
+import statistics
+from datetime import date, datetime, timedelta, UTC
+
+import db
+from batching import writes
+from config import env_float, env_int
+
+log = logging.getLogger(__name__)
+
+# How far back the rolling min / median look when deciding if a price is a real drop
+HISTORY_WINDOW_DAYS = env_int("HISTORY_WINDOW_DAYS", 30, minimum=1)
+# A price counts as a drop once it is this far under the rolling median...
+DROP_FROM_MEDIAN = env_float("DROP_FROM_MEDIAN", 0.15, minimum=0)
+# ...or this far under the lowest price we have seen in the window
+DROP_FROM_MIN = env_float("DROP_FROM_MIN", 0.05, minimum=0)
+# Need at least this many earlier observations before we trust the median
+DROP_MIN_OBSERVATIONS = env_int("DROP_MIN_OBSERVATIONS", 5, minimum=1)
+
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+def trip_length(outbound_date: str, return_date: str | None) -> int | None:
+    if not return_date:
+        return None
+    return (date.fromisoformat(str(return_date)[:10]) - date.fromisoformat(str(outbound_date)[:10])).days
+
+'''
+Append-only PriceHistory. Every real upstream search (from any command or job) adds one
+compact row: route, outbound date, trip length (null for one-way), the cheapest price
+seen and when. Rows go through the write-behind buffer so recording never adds a
+round trip to the command that triggered the search.
+'''
+def record_search(params: dict, result):
+    min_price = result.min_price()
+    if min_price is None or not params.get("departure_id") or not params.get("arrival_id"):
+        return
+    writes.add_price_observation({
+        "departure_id": str(params["departure_id"]).upper(),
+        "arrival_id": str(params["arrival_id"]).upper(),
+        "outbound_date": params.get("outbound_date"),
+        "trip_length": trip_length(params.get("outbound_date"), params.get("return_date")),
+        "min_price": int(min_price),
+        "observed_at": datetime.now(UTC).isoformat()
+    })
+
+
+async def route_history(departure_id: str, arrival_id: str, days: int = HISTORY_WINDOW_DAYS,
+                        trip_length: int | None = None, before: str | None = None) -> list[dict]:
+    since = (datetime.now(UTC) - timedelta(days=days)).isoformat()
+    return await db.list_price_history(departure_id.upper(), arrival_id.upper(), since, trip_length=trip_length, before=before)
+
+
+def detect_drop(observations: list[dict], new_price: int) -> str | None:
+    # Returns a short reason if new_price is a meaningful drop against the earlier observations
+    prices = [row["min_price"] for row in observations]
+    if not prices:
+        return None
+
+    lowest = min(prices)
+    if new_price < lowest * (1 - DROP_FROM_MIN):
+        return f"lowest price in {HISTORY_WINDOW_DAYS} days (was ${lowest})"
+
+    if len(prices) >= DROP_MIN_OBSERVATIONS:
+        median = statistics.median(prices)
+        threshold = median * (1 - DROP_FROM_MEDIAN)
+        # Only on the way down, so a price that stays low doesn't alert on every check
+        if new_price <= threshold < prices[-1]:
+            return f"{round((1 - new_price / median) * 100)}% under the usual ${round(median)}"
+    return None
+
+
+def daily_lows(observations: list[dict]) -> list[tuple[str, int]]:
+    lows = {}
+    for row in observations:
+        day = str(row["observed_at"])[:10]
+        lows[day] = min(lows.get(day, row["min_price"]), row["min_price"])
+    return sorted(lows.items())
+
+
+def sparkline(values: list[int]) -> str:
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    return "".join(SPARK[round((v - low) / span * (len(SPARK) - 1))] for v in values)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import math
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from cache import cached_search, fare_cache
+from config import env_float, env_int
+from quota import quota
+from utils import roundtrip_params
+
+log = logging.getLogger(__name__)
+
+# Upstream searches one date-window lookup may spend. Cells already in the fare cache are free
+MATRIX_MAX_SEARCHES = env_int("MATRIX_MAX_SEARCHES", 16, minimum=1)
+MATRIX_CONCURRENCY = env_int("MATRIX_CONCURRENCY", 4, minimum=1)
+# Hard cap on how long one date-window lookup waits for upstream searches
+MATRIX_TIMEOUT = env_float("MATRIX_TIMEOUT", 45, minimum=0)
+# A probed date is only explored further if it is within this fraction of the best price so far
+MATRIX_PRUNE_MARGIN = env_float("MATRIX_PRUNE_MARGIN", 0.15, minimum=0)
+MATRIX_MAX_DAYS = 31
+MATRIX_MAX_LENGTHS = 7
+
+
+class DateWindowError(ValueError):
+    pass
+
+
+def parse_date_window(text: str) -> tuple[date, date] | None:
+    # "2026-11-01..2026-11-14" -> (start, end), or None if this isn't a window at all
+    if ".." not in text:
+        return None
+    try:
+        start, end = (date.fromisoformat(part.strip()) for part in text.split("..", 1))
+    except ValueError:
+        raise DateWindowError("Dates in a window need to look like `2026-11-01..2026-11-14`.")
+    if start < date.today():
+        raise DateWindowError("The window has to start today or later.")
+    if end < start:
+        raise DateWindowError("The window ends before it starts.")
+    if (end - start).days + 1 > MATRIX_MAX_DAYS:
+        raise DateWindowError(f"Date windows can be at most {MATRIX_MAX_DAYS} days long.")
+    return start, end
+
+
+def parse_trip_lengths(text: str) -> list[int]:
+    # "7", "5-9" or "5,7,9" nights
+    try:
+        if "-" in text:
+            low, high = (int(part) for part in text.split("-", 1))
+        else:
+            lengths = [int(part) for part in text.split(",")]
+    except ValueError:
+        raise DateWindowError("Trip length should be a number of days like `7`, `5-9` or `5,7,9`.")
+    if "-" in text:
+        # Checked on the two ends, a span like 1-20000000 must not be built first
+        if high < low:
+            raise DateWindowError("The trip length range ends before it starts.")
+        low = max(low, 1)
+        if high - low + 1 > MATRIX_MAX_LENGTHS:
+            raise DateWindowError(f"Pick at most {MATRIX_MAX_LENGTHS} trip lengths.")
+        lengths = range(low, high + 1)
+    lengths = sorted({n for n in lengths if n > 0})
+    if not lengths:
+        raise DateWindowError("Trip length has to be at least 1 day.")
+    if len(lengths) > MATRIX_MAX_LENGTHS:
+        raise DateWindowError(f"Pick at most {MATRIX_MAX_LENGTHS} trip lengths.")
+    return lengths
+
+
+@dataclass(slots=True)
+class MatrixResult:
+    departure_id: str
+    arrival_id: str
+    dates: list[date]
+    lengths: list[int]
+    cells: dict = field(default_factory=dict)    # (outbound date, trip length) -> min price or None
+    searches: int = 0
+    cached: int = 0
+    stale: int = 0
+    cancelled: int = 0     # searches dropped when MATRIX_TIMEOUT ran out
+
+    def best(self, n: int = 3) -> list[tuple[date, int, int]]:
+        priced = [(price, d, length) for (d, length), price in self.cells.items() if price is not None]
+        priced.sort()
+        return [(d, length, price) for price, d, length in priced[:n]]
+
+    def best_price(self) -> int | None:
+        prices = [price for price in self.cells.values() if price is not None]
+        return min(prices) if prices else None
+
+
+def _cell_params(departure_id, arrival_id, outbound: date, length: int) -> dict:
+    return roundtrip_params(departure_id, arrival_id, outbound.isoformat(), (outbound + timedelta(days=length)).isoformat())
+
+'''
+Searches a departure date x trip length matrix for the cheapest round trip without
+searching every cell:
+1. probe one trip length across the window (spaced out if the window is big)
+2. around the probes that come within MATRIX_PRUNE_MARGIN of the best price, fill in the
+   other trip lengths and the skipped neighbour dates, cheapest probe first
+Cells already in the fare cache are used for free; everything else stops at MATRIX_MAX_SEARCHES
+or MATRIX_TIMEOUT. The user's rate limit is charged once for the whole lookup, the cells
+themselves are only paced by the key-wide limit.
+'''
+async def search_matrix(departure_id: str, arrival_id: str, start: date, end: date, lengths: list[int], user_id: str | None = None) -> MatrixResult:
+    dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    result = MatrixResult(departure_id.upper(), arrival_id.upper(), dates, lengths)
+    semaphore = asyncio.Semaphore(MATRIX_CONCURRENCY)
+    if user_id is not None:
+        await quota.charge_user(user_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MATRIX_TIMEOUT
+
+    async def search_cell(cell, params):
+        async with semaphore:
+            try:
+                found = await cached_search(params, "roundtrip", feature="lookup_matrix")
+                result.cells[cell] = found.min_price()
+                result.stale += found.stale
+            except Exception as e:
+                log.warning("matrix cell failed route=%s-%s cell=%s error=%s", departure_id, arrival_id, cell, e)
+                result.cells[cell] = None
+
+    async def run_cells(cells):
+        pending = []
+        for cell in cells:
+            if cell in result.cells:
+                continue
+            params = _cell_params(departure_id, arrival_id, *cell)
+            cached = fare_cache.peek(params, feature="lookup_matrix")
+            if cached is not None:
+                result.cells[cell] = cached.min_price()
+                result.cached += 1
+            elif result.searches < MATRIX_MAX_SEARCHES and loop.time() < deadline:
+                result.searches += 1
+                pending.append(asyncio.ensure_future(search_cell(cell, params)))
+        if not pending:
+            return
+        _, remaining = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()))
+        if remaining:
+            # Out of time: those cells stay unsearched and show up as such in the calendar
+            log.info("matrix search timed out route=%s-%s cancelled=%d", departure_id, arrival_id, len(remaining))
+            for task in remaining:
+                task.cancel()
+            await asyncio.gather(*remaining, return_exceptions=True)
+            result.searches -= len(remaining)
+            result.cancelled += len(remaining)
+
+    # 1. Probe the middle trip length, spending at most half the budget
+    anchor = lengths[len(lengths) // 2]
+    step = max(1, math.ceil(len(dates) / max(1, MATRIX_MAX_SEARCHES // 2)))
+    probes = dates[::step]
+    await run_cells([(d, anchor) for d in probes])
+
+    # 2. Expand around the probes that can still beat (or come close to) the best price
+    best = result.best_price()
+    if best is not None:
+        promising = sorted(
+            (result.cells[(d, anchor)], d) for d in probes
+            if result.cells.get((d, anchor)) is not None and result.cells[(d, anchor)] <= best * (1 + MATRIX_PRUNE_MARGIN)
+        )
+        expand = []
+        for _, d in promising:
+            expand += [(d, length) for length in lengths if length != anchor]
+            expand += [(d + timedelta(days=i), anchor) for i in range(1, step) if d + timedelta(days=i) <= end]
+        await run_cells(expand)
+
+    log.info(
+        "matrix search route=%s-%s cells=%d searches=%d cached=%d",
+        result.departure_id, result.arrival_id, len(result.cells), result.searches, result.cached
+    )
+    return result
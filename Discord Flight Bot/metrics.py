@@ -0,0 +1,99 @@
+import bisect
+import functools
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p: float) -> float:
+        # Upper bound of the bucket the p-th observation falls in
+        if not self.count:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def mean(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+'''
+Process wide latency histograms and counters. Stages are plain strings such as
+"search", "db", "render", "send", "command.lookup_flight" or "job.run_weekly_alerts".
+'''
+histograms = defaultdict(Histogram)
+counters = defaultdict(int)
+
+
+def observe(stage: str, ms: float):
+    histograms[stage].observe(ms)
+
+
+def incr(name: str, amount: int = 1):
+    counters[name] += amount
+
+
+@contextmanager
+def timer(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        incr(f"errors.{stage}")
+        raise
+    finally:
+        observe(stage, (time.perf_counter() - started) * 1000)
+
+
+def timed(stage: str):
+    # Decorator version of timer() for coroutines
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timer(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    return {
+        "latency": {
+            stage: {
+                "count": h.count,
+                "mean_ms": round(h.mean(), 1),
+                "p50_ms": h.percentile(50),
+                "p99_ms": h.percentile(99),
+                "max_ms": round(h.max_ms, 1),
+            }
+            for stage, h in sorted(histograms.items())
+        },
+        "counters": dict(sorted(counters.items())),
+    }
+
+
+def reset():
+    histograms.clear()
+    counters.clear()
@@ -0,0 +1,142 @@
+import sys
+import time
+from dataclasses import dataclass
+
+'''
+Normalized flight results. SerpAPI responses are parsed into these once, right at the
+search boundary, and everything downstream (price filtering, sorting, embeds, caching)
+works with them instead of re-walking the raw JSON with .get() chains.
+Airport codes and airline names repeat constantly, so they are interned.
+'''
+
+
+def _intern(value, default: str) -> str:
+    if not value:
+        return default
+    return sys.intern(str(value))
+
+
+@dataclass(slots=True, frozen=True)
+class Leg:
+    airline: str
+    flight_number: str
+    departure_id: str
+    departure_name: str
+    departure_time: str
+    arrival_id: str
+    arrival_name: str
+    arrival_time: str
+    duration: int | None = None
+
+    @classmethod
+    def from_serpapi(cls, leg: dict) -> "Leg":
+        dep = leg.get("departure_airport") or {}
+        arr = leg.get("arrival_airport") or {}
+        return cls(
+            airline=_intern(leg.get("airline"), "Unknown Airline"),
+            flight_number=leg.get("flight_number") or "N/A",
+            departure_id=_intern(dep.get("id"), "Unknown"),
+            departure_name=_intern(dep.get("name"), "Unknown"),
+            departure_time=dep.get("time") or "N/A",
+            arrival_id=_intern(arr.get("id"), "Unknown"),
+            arrival_name=_intern(arr.get("name"), "Unknown"),
+            arrival_time=arr.get("time") or "N/A",
+            duration=leg.get("duration")
+        )
+
+    def to_list(self) -> list:
+        return [self.airline, self.flight_number, self.departure_id, self.departure_name, self.departure_time,
+                self.arrival_id, self.arrival_name, self.arrival_time, self.duration]
+
+    @classmethod
+    def from_list(cls, values: list) -> "Leg":
+        # Re-intern the repeated strings after a round trip through JSON
+        airline, flight_number, dep_id, dep_name, dep_time, arr_id, arr_name, arr_time, duration = values
+        return cls(sys.intern(airline), flight_number, sys.intern(dep_id), sys.intern(dep_name), dep_time,
+                   sys.intern(arr_id), sys.intern(arr_name), arr_time, duration)
+
+
+@dataclass(slots=True, frozen=True)
+class Offer:
+    offer_id: str
+    price: int | None
+    total_duration: int | None
+    legs: tuple[Leg, ...]
+
+    @classmethod
+    def from_serpapi(cls, entry: dict) -> "Offer":
+        legs = tuple(Leg.from_serpapi(leg) for leg in entry.get("flights") or [])
+        price = entry.get("price")
+        # Prefer SerpAPI's own token, otherwise the flight numbers + departure times identify the offer
+        offer_id = entry.get("departure_token") or entry.get("booking_token") or "|".join(
+            f"{leg.flight_number}@{leg.departure_time}" for leg in legs
+        )
+        return cls(
+            offer_id=offer_id,
+            price=price if isinstance(price, (int, float)) else None,
+            total_duration=entry.get("total_duration"),
+            legs=legs
+        )
+
+    def under(self, max_price) -> bool:
+        return self.price is not None and self.price <= max_price
+
+    def to_list(self) -> list:
+        return [self.offer_id, self.price, self.total_duration, [leg.to_list() for leg in self.legs]]
+
+    @classmethod
+    def from_list(cls, values: list) -> "Offer":
+        offer_id, price, total_duration, legs = values
+        return cls(offer_id, price, total_duration, tuple(Leg.from_list(leg) for leg in legs))
+
+
+@dataclass(slots=True)
+class SearchResult:
+    offers: list[Offer]
+    google_flights_url: str = ""
+    error: str | None = None
+    fetched_at: float = 0.0
+    # Set on results the fare cache serves past their TTL because upstream is failing
+    stale: bool = False
+
+    def age_seconds(self) -> float:
+        # Rows cached before fetched_at existed have an unknown age
+        return max(0.0, time.time() - self.fetched_at) if self.fetched_at else float("inf")
+
+    def matching(self, max_price) -> list[Offer]:
+        if max_price is None:
+            return list(self.offers)
+        return [offer for offer in self.offers if offer.under(max_price)]
+
+    def cheapest(self, n: int | None = None) -> list[Offer]:
+        # Offers without a price go last
+        ranked = sorted(self.offers, key=lambda o: (o.price is None, o.price or 0))
+        return ranked if n is None else ranked[:n]
+
+    def min_price(self) -> int | None:
+        prices = [offer.price for offer in self.offers if offer.price is not None]
+        return min(prices) if prices else None
+
+    # Compact JSON form used by the durable FareCache table
+    def to_dict(self) -> dict:
+        return {"offers": [offer.to_list() for offer in self.offers], "url": self.google_flights_url, "at": self.fetched_at}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SearchResult":
+        return cls(
+            offers=[Offer.from_list(o) for o in data["offers"]],
+            google_flights_url=data.get("url", ""),
+            fetched_at=data.get("at") or 0.0
+        )
+
+
+def parse_results(results: dict) -> SearchResult:
+    # Turn a raw google_flights response into a SearchResult, the only place that reads SerpAPI JSON
+    if results.get("error"):
+        return SearchResult(offers=[], error=str(results["error"]), fetched_at=time.time())
+    entries = (results.get("best_flights") or []) + (results.get("other_flights") or [])
+    return SearchResult(
+        offers=[Offer.from_serpapi(entry) for entry in entries],
+        google_flights_url=(results.get("search_metadata") or {}).get("google_flights_url", ""),
+        fetched_at=time.time()
+    )
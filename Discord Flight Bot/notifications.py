@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import random
+from collections import defaultdict, deque
+from datetime import datetime, UTC
+from typing import NamedTuple
+
+import aiohttp
+import discord
+import metrics
+import render
+from batching import writes
+from config import env_float, env_int
+from quota import TokenBucket
+from services import services
+from tracking_index import tracking
+from user_settings import user_settings
+
+log = logging.getLogger(__name__)
+
+# Discord allows 5 messages per 5 seconds in a channel and about 50 requests a second overall.
+# We stay just under both so the library never has to sit out a 429
+DISCORD_CHANNEL_RATE_PER_SECOND = env_float("DISCORD_CHANNEL_RATE_PER_SECOND", 0.9, minimum=0.001)
+DISCORD_CHANNEL_BURST = env_int("DISCORD_CHANNEL_BURST", 4, minimum=1)
+DISCORD_GLOBAL_RATE_PER_SECOND = env_float("DISCORD_GLOBAL_RATE_PER_SECOND", 40, minimum=0.001)
+# Retries for a message that failed with a 5xx or a network error
+NOTIFY_RETRIES = env_int("NOTIFY_RETRIES", 3, minimum=0)
+# Alerts queued within this window have their delivery preferences looked up in one query
+NOTIFY_ROUTE_SECONDS = env_float("NOTIFY_ROUTE_SECONDS", 0.5, minimum=0)
+
+# Discord message limits
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_CONTENT = 2000
+
+DELIVERY_CHANNEL = "channel"
+DELIVERY_DM = "dm"
+DELIVERY_HERE = "here"
+
+
+def alerts_channel() -> tuple:
+    # The shared alerts channel (DISCORD_CHANNEL_ID), looked up when the first alert goes out
+    return DELIVERY_CHANNEL, services.settings.alerts_channel_id
+
+
+class Notification(NamedTuple):
+    tracking_id: int | None
+    user_id: str
+    kind: str
+    embed: discord.Embed
+    row: dict | None = None     # the FlightTracking row a price alert closes, see _record
+
+
+def pack(queue: deque) -> list[Notification]:
+    # Pops as many queued notifications as fit in one message
+    batch, size = [], 0
+    while queue and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+        embed_size = len(queue[0].embed)
+        if batch and size + embed_size > MAX_EMBED_CHARS_PER_MESSAGE:
+            break
+        batch.append(queue.popleft())
+        size += embed_size
+    return batch
+
+'''
+Outbound alert pipeline. check_rows hands alerts to notify(), which only renders the embed
+and queues it, so the search side never waits on Discord. A router looks up where each
+user wants alerts (shared channel, DM, or a channel of their choosing) for a whole batch
+at once, and every destination then drains on its own task: up to 10 embeds per message,
+paced by a per-channel and a global token bucket, retried on 5xx/network errors, and
+falling back to the shared channel when a DM is refused. Every attempt is recorded in
+AlertDelivery through the write-behind buffer. A price alert's row is only marked
+alert_sent in FlightTracking once the alert is delivered; if delivery fails for good it
+goes back into the tracking index and gets checked (and alerted) again. Alerts still
+queued at shutdown never reach the table either, so they go out after the restart.
+'''
+class AlertDispatcher:
+    def __init__(self):
+        self.client = None
+        self._incoming = []
+        self._router = None
+        self._queues = defaultdict(deque)     # destination -> deque[Notification]
+        self._drainers = {}                   # destination -> task draining its queue
+        self._buckets = {}                    # destination -> TokenBucket
+        self._channels = {}                   # destination -> resolved channel
+        self.global_bucket = TokenBucket(DISCORD_GLOBAL_RATE_PER_SECOND, int(DISCORD_GLOBAL_RATE_PER_SECOND))
+        self.sent = 0
+        self.failed = 0
+        self.messages = 0
+
+    def start(self, client: discord.Client):
+        self.client = client
+
+    def pending(self) -> int:
+        return len(self._incoming) + sum(len(queue) for queue in self._queues.values())
+
+    async def notify(self, row, route, offers, g_url, drop=None):
+        # Same signature as the old send_alert, so it drops straight into check_rows
+        embed = render.alert_embed(row, route, offers, g_url, drop=drop)
+        kind = "drop" if drop else "alert"
+        self._incoming.append(Notification(row.get("id"), str(row["user_id"]), kind, embed, row if kind == "alert" else None))
+        if self._router is None or self._router.done():
+            self._router = asyncio.ensure_future(self._route())
+
+    async def _route(self):
+        await asyncio.sleep(NOTIFY_ROUTE_SECONDS)
+        while self._incoming:
+            batch, self._incoming = self._incoming, []
+            preferences = await self._preferences({n.user_id for n in batch})
+            for notification in batch:
+                self._enqueue(preferences.get(notification.user_id, (DELIVERY_CHANNEL, None)), notification)
+
+    async def _preferences(self, user_ids: set) -> dict:
+        try:
+            settings = await user_settings.get_many(sorted(user_ids))
+        except Exception as e:
+            log.warning("could not load alert delivery settings, using the alerts channel error=%s", e)
+            return {}
+        return {user_id: (s["alert_delivery"] or DELIVERY_CHANNEL, s["alert_channel_id"]) for user_id, s in settings.items()}
+
+    def _enqueue(self, preference, notification: Notification):
+        delivery, channel_id = preference
+        if delivery == DELIVERY_DM:
+            destination = (DELIVERY_DM, notification.user_id)
+        elif delivery == DELIVERY_HERE and channel_id:
+            destination = (DELIVERY_CHANNEL, int(channel_id))
+        else:
+            destination = alerts_channel()
+        self._queues[destination].append(notification)
+        if destination not in self._drainers:
+            self._drainers[destination] = asyncio.ensure_future(self._drain(destination))
+
+    async def _resolve(self, destination):
+        channel = self._channels.get(destination)
+        if channel is not None:
+            return channel
+        kind, target = destination
+        if kind == DELIVERY_DM:
+            user = self.client.get_user(int(target)) or await self.client.fetch_user(int(target))
+            channel = user.dm_channel or await user.create_dm()
+        else:
+            channel = self.client.get_channel(target) or await self.client.fetch_channel(target)
+        self._channels[destination] = channel
+        return channel
+
+    async def _drain(self, destination):
+        queue = self._queues[destination]
+        bucket = self._buckets.setdefault(destination, TokenBucket(DISCORD_CHANNEL_RATE_PER_SECOND, DISCORD_CHANNEL_BURST))
+        try:
+            while queue:
+                batch = pack(queue)
+                await bucket.take()
+                await self.global_bucket.take()
+                await self._send(destination, batch)
+        finally:
+            del self._drainers[destination]
+            if not queue:
+                del self._queues[destination]
+
+    async def _send(self, destination, batch: list[Notification]):
+        kind, target = destination
+        content = None
+        if kind == DELIVERY_CHANNEL:
+            # The shared channel pings everyone whose alert is in this message
+            mentions = " ".join(dict.fromkeys(f"<@{n.user_id}>" for n in batch))
+            content = render.clip(mentions, MAX_CONTENT) or None
+
+        for attempt in range(1, NOTIFY_RETRIES + 2):
+            try:
+                channel = await self._resolve(destination)
+                with metrics.timer("send"):
+                    message = await channel.send(
+                        content=content,
+                        embeds=[n.embed for n in batch],
+                        allowed_mentions=discord.AllowedMentions(users=True, roles=False, everyone=False)
+                    )
+                self._record(destination, batch, "delivered", attempt, message.id)
+                return
+            except (discord.Forbidden, discord.NotFound) as e:
+                if destination != alerts_channel():
+                    # DMs closed or the user's channel is gone, use the shared channel instead
+                    log.info("alert destination refused, falling back to the alerts channel destination=%s error=%s", destination, e)
+                    self._channels.pop(destination, None)
+                    self._record(destination, batch, "refused", attempt)
+                    for notification in batch:
+                        self._enqueue((DELIVERY_CHANNEL, None), notification)
+                    return
+                log.error("cannot post to the alerts channel channel_id=%s error=%s", target, e)
+                break
+            except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = getattr(e, "status", None)
+                if status is not None and status < 500:
+                    log.error("alert rejected by Discord destination=%s status=%s error=%s", destination, status, e)
+                    break
+                if attempt > NOTIFY_RETRIES:
+                    log.error("alert delivery failed destination=%s error=%s", destination, e)
+                    break
+                delay = random.uniform(0, min(30, 2 ** attempt))
+                log.warning("alert delivery failed, retrying attempt=%d delay=%.1fs error=%s", attempt, delay, e)
+                await asyncio.sleep(delay)
+        self._record(destination, batch, "failed", attempt)
+
+    def _record(self, destination, batch: list[Notification], status: str, attempts: int, message_id=None):
+        kind, target = destination
+        if status == "delivered":
+            self.sent += len(batch)
+            self.messages += 1
+        elif status == "failed":
+            self.failed += len(batch)
+        metrics.incr(f"notify.{status}", len(batch))
+        now = datetime.now(UTC).isoformat()
+        for notification in batch:
+            if notification.row is not None and notification.tracking_id is not None:
+                if status == "delivered":
+                    writes.mark_alerted(notification.tracking_id)
+                elif status == "failed":
+                    # Nobody got it, so the row is still open
+                    tracking.reopen(notification.row)
+                    metrics.incr("notify.reopened")
+            writes.add_delivery({
+                "tracking_id": notification.tracking_id,
+                "user_id": notification.user_id,
+                "kind": notification.kind,
+                "destination": f"{kind}:{target}",
+                "status": status,
+                "message_id": str(message_id) if message_id else None,
+                "attempts": attempts,
+                "created_at": now
+            })
+
+    async def drain(self, timeout: float = 30):
+        # Give queued alerts a chance to go out, e.g. before shutting down
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.pending() or self._drainers or (self._router and not self._router.done()):
+            if loop.time() > deadline:
+                log.warning("shutting down with undelivered alerts pending=%d", self.pending())
+                return
+            await asyncio.sleep(0.1)
+
+
+dispatcher = AlertDispatcher()
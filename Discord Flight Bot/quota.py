@@ -0,0 +1,201 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, UTC
+
+import db
+from config import env_float, env_int
+
+log = logging.getLogger(__name__)
+
+# Priority classes, lower number goes first when calls are queued
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# SerpAPI key wide rate limit, plus a smaller per-user one so one person can't hog it
+KEY_RATE_PER_SECOND = env_float("SERPAPI_RATE_PER_SECOND", 2, minimum=0.001)
+KEY_BURST = env_int("SERPAPI_BURST", 5, minimum=1)
+USER_RATE_PER_MINUTE = env_float("SERPAPI_USER_RATE_PER_MINUTE", 6, minimum=0.001)
+USER_BURST = env_int("SERPAPI_USER_BURST", 3, minimum=1)
+
+# Call budgets, 0 means unlimited. Background jobs stop at BACKGROUND_SHARE of a budget
+# so there is always something left for people running commands
+DAILY_BUDGET = env_int("SERPAPI_DAILY_BUDGET", 0, minimum=0)
+MONTHLY_BUDGET = env_int("SERPAPI_MONTHLY_BUDGET", 0, minimum=0)
+BACKGROUND_SHARE = env_float("SERPAPI_BACKGROUND_SHARE", 0.8, minimum=0)
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> float:
+        # Takes a token and returns 0, or returns how many seconds until one is available
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def take(self):
+        while (wait := self.try_take()) > 0:
+            await asyncio.sleep(wait)
+
+
+def _today() -> str:
+    return datetime.now(UTC).date().isoformat()
+
+
+def _seconds_until_tomorrow() -> float:
+    now = datetime.now(UTC)
+    tomorrow = datetime(now.year, now.month, now.day, tzinfo=UTC) + timedelta(days=1)
+    return (tomorrow - now).total_seconds()
+
+'''
+Gatekeeper in front of every real SerpAPI call. Callers wait in a priority queue for
+a token from the key bucket (interactive commands ahead of background alerts) instead
+of failing, and every call or cache hit is counted per feature and persisted to ApiUsage.
+'''
+class QuotaManager:
+    def __init__(self):
+        self.key_bucket = TokenBucket(KEY_RATE_PER_SECOND, KEY_BURST)
+        self.user_buckets = {}
+        self._queue = []                  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        # (day, feature) -> {"calls": n, "cache_hits": n}
+        self.usage = defaultdict(lambda: {"calls": 0, "cache_hits": 0})
+        self._dirty = set()
+        self._loaded = False
+
+    # ---------- accounting ----------
+
+    async def _load_usage(self):
+        # Pick up where we left off so budgets survive restarts
+        if self._loaded:
+            return
+        self._loaded = True
+        month_start = datetime.now(UTC).date().replace(day=1).isoformat()
+        try:
+            rows = await db.list_api_usage(month_start)
+        except Exception as e:
+            log.warning("could not load API usage error=%s", e)
+            return
+        for row in rows:
+            counts = self.usage[(row["day"], row["feature"])]
+            counts["calls"] = max(counts["calls"], row.get("calls") or 0)
+            counts["cache_hits"] = max(counts["cache_hits"], row.get("cache_hits") or 0)
+
+    def calls_today(self) -> int:
+        today = _today()
+        return sum(c["calls"] for (day, _), c in self.usage.items() if day == today)
+
+    def calls_this_month(self) -> int:
+        month = _today()[:7]
+        return sum(c["calls"] for (day, _), c in self.usage.items() if day.startswith(month))
+
+    def record_call(self, feature: str):
+        key = (_today(), feature)
+        self.usage[key]["calls"] += 1
+        self._dirty.add(key)
+
+    def record_cache_hit(self, feature: str):
+        key = (_today(), feature)
+        self.usage[key]["cache_hits"] += 1
+        self._dirty.add(key)
+
+    async def flush_usage(self):
+        dirty, self._dirty = self._dirty, set()
+        rows = [{"day": day, "feature": feature, **self.usage[(day, feature)]} for day, feature in dirty]
+        if not rows:
+            return
+        try:
+            await db.upsert_api_usage(rows)
+        except Exception as e:
+            self._dirty |= dirty
+            log.warning("could not save API usage error=%s", e)
+
+    # ---------- budgets ----------
+
+    def over_budget(self, priority: int) -> bool:
+        share = 1.0 if priority == INTERACTIVE else BACKGROUND_SHARE
+        if DAILY_BUDGET and self.calls_today() >= DAILY_BUDGET * share:
+            return True
+        if MONTHLY_BUDGET and self.calls_this_month() >= MONTHLY_BUDGET * share:
+            return True
+        return False
+
+    # ---------- queueing ----------
+
+    async def _dispatch(self):
+        while self._queue:
+            priority, _, future = self._queue[0]
+            if future.cancelled():
+                heapq.heappop(self._queue)
+                continue
+
+            if self.over_budget(priority):
+                if priority == INTERACTIVE:
+                    heapq.heappop(self._queue)
+                    future.set_exception(QuotaExceeded("SerpAPI budget used up, try again later"))
+                    continue
+                # Only background work is left and its share is spent, park it until the
+                # budget resets or something more important shows up
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=_seconds_until_tomorrow())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = self.key_bucket.try_take()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            heapq.heappop(self._queue)
+            if not future.cancelled():
+                future.set_result(None)
+        self._dispatcher = None
+
+    async def charge_user(self, user_id: str):
+        # One token from the user's bucket. Commands that fan out into many searches call
+        # this once and then search with user_id=None, so only the key bucket paces the fan-out
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            bucket = self.user_buckets[user_id] = TokenBucket(USER_RATE_PER_MINUTE / 60, USER_BURST)
+        await bucket.take()
+
+    async def acquire(self, user_id: str | None = None, priority: int = INTERACTIVE, feature: str = "other"):
+        await self._load_usage()
+
+        if user_id is not None:
+            await self.charge_user(user_id)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._wakeup.set()
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        await future
+        self.record_call(feature)
+
+
+quota = QuotaManager()
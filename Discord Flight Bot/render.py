@@ -0,0 +1,270 @@
+import statistics
+from collections import OrderedDict
+from datetime import timedelta
+
+import discord
+import history
+import metrics
+from models import Offer
+
+# Discord embed limits
+MAX_TITLE = 256
+MAX_DESCRIPTION = 4096
+MAX_FIELDS = 25
+MAX_FIELD_NAME = 256
+MAX_FIELD_VALUE = 1024
+MAX_FOOTER = 2048
+MAX_EMBED_TOTAL = 6000
+
+FLIGHTS_FOOTER = "Powered by SerpAPI + Google Flights"
+DEALS_FOOTER = "Built by Lindzi • Powered by SerpAPI + Google Flights"
+
+# Formatted (name, value) per (route, offer id, price). During an alert fan-out every user
+# on a route gets the same offers, so each one is only formatted once
+OFFER_BLOCK_CACHE_SIZE = 2048
+_offer_blocks = OrderedDict()
+
+
+def age_label(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "less than a minute"
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60}h {minutes % 60}m"
+
+
+def stale_note(results) -> str:
+    # Shown whenever the fare cache had to fall back to old prices
+    if not results.stale:
+        return ""
+    return f"\n⚠️ Live prices are unavailable right now, these are from {age_label(results.age_seconds())} ago."
+
+
+def clip(text: str, limit: int) -> str:
+    text = str(text)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def offer_block(route, offer: Offer) -> tuple[str, str]:
+    key = (route, offer.offer_id, offer.price)
+    block = _offer_blocks.get(key)
+    if block is not None:
+        _offer_blocks.move_to_end(key)
+        return block
+
+    flight_segments = []
+    for leg in offer.legs:
+        flight_segments.append(
+            f"✈️ **{leg.airline} {leg.flight_number}**\n"
+            f"{leg.departure_name} ({leg.departure_id}) → {leg.arrival_name} ({leg.arrival_id})\n"
+            f"🕒 {leg.departure_time} → {leg.arrival_time}"
+        )
+
+    price = offer.price if offer.price is not None else "?"
+    block = (
+        clip(f"💵 ${price} | 🧭 Duration: {offer.total_duration} min", MAX_FIELD_NAME),
+        clip("\n\n".join(flight_segments) or "No flight details", MAX_FIELD_VALUE)
+    )
+    _offer_blocks[key] = block
+    if len(_offer_blocks) > OFFER_BLOCK_CACHE_SIZE:
+        _offer_blocks.popitem(last=False)
+    return block
+
+
+class EmbedBuilder:
+    # Wraps discord.Embed and quietly stops adding fields once a Discord limit would be hit
+
+    def __init__(self, title: str, description: str, color: discord.Color):
+        title = clip(title, MAX_TITLE)
+        description = clip(description, MAX_DESCRIPTION)
+        self.embed = discord.Embed(title=title, description=description, color=color)
+        self.size = len(title) + len(description)
+
+    def add_field(self, name: str, value: str, reserve: int = 0) -> bool:
+        # reserve keeps room for fields we still want to add at the end (e.g. the link)
+        name = clip(name, MAX_FIELD_NAME)
+        value = clip(value, MAX_FIELD_VALUE)
+        if len(self.embed.fields) >= MAX_FIELDS - (1 if reserve else 0):
+            return False
+        if self.size + len(name) + len(value) + reserve > MAX_EMBED_TOTAL:
+            return False
+        self.embed.add_field(name=name, value=value, inline=False)
+        self.size += len(name) + len(value)
+        return True
+
+    def finish(self, footer: str) -> discord.Embed:
+        footer = clip(footer, MAX_FOOTER)
+        if self.size + len(footer) <= MAX_EMBED_TOTAL:
+            self.embed.set_footer(text=footer)
+        return self.embed
+
+
+def flights_embed(title: str, description: str, color: discord.Color, route, offers: list[Offer], g_url: str = "", limit: int = 3, footer: str = FLIGHTS_FOOTER) -> discord.Embed:
+    with metrics.timer("render"):
+        builder = EmbedBuilder(title, description, color)
+        link_value = f"[Open Link]({g_url})" if g_url else ""
+        link_name = "🔗 View on Google Flights"
+        reserve = len(link_name) + len(link_value) if g_url else 0
+
+        for offer in offers[:limit]:
+            name, value = offer_block(route, offer)
+            if not builder.add_field(name, value, reserve=reserve):
+                break
+
+        if g_url:
+            builder.add_field(link_name, link_value)
+        return builder.finish(footer)
+
+
+def page_footer(index: int, pages: int | None, footer: str = "") -> str:
+    # pages is None when the source can't count them without reading everything
+    label = f"Page {index + 1}/{pages}" if pages else f"Page {index + 1}"
+    return f"{label} • {footer}" if footer else label
+
+
+def tracking_embed(rows: list[dict], index: int, has_next: bool) -> discord.Embed:
+    # One page of !my_flights
+    with metrics.timer("render"):
+        builder = EmbedBuilder(
+            "Your Tracked Flight Alerts",
+            "These are the flights we keep checking for price drops.",
+            discord.Color.blue()
+        )
+        for row in rows:
+            builder.add_field(
+                f"{row['departure_id']} -> {row['arrival_id']}",
+                f"{row['outbound_date']} -> {row['return_date']}\nMax Price: {row['max_price']}"
+            )
+        if not (index or has_next):
+            return builder.embed
+        return builder.finish(page_footer(index, None))
+
+
+def alert_embed(row: dict, route, offers: list[Offer], g_url: str, drop: str | None = None) -> discord.Embed:
+    if drop:
+        return flights_embed(
+            title=f"📉 Price drop {row['departure_id']} → {row['arrival_id']}: now ${offers[0].price}",
+            description=f"{drop[0].upper()}{drop[1:]}. Still above your ${row['max_price']} limit, but worth a look:",
+            color=discord.Color.gold(),
+            route=route,
+            offers=offers,
+            g_url=g_url
+        )
+    return flights_embed(
+        title=f"🎯 Great news we found flights within your price of ${row['max_price']} from {row['departure_id']} → {row['arrival_id']}",
+        description=f"Found {len(offers)} flights under your threshold:",
+        color=discord.Color.green(),
+        route=route,
+        offers=offers,
+        g_url=g_url
+    )
+
+
+def deals_embed(home_airport: str, board: dict) -> discord.Embed:
+    with metrics.timer("render"):
+        builder = EmbedBuilder(
+            f"🔥 Best Flight Deals Today from {home_airport}",
+            "Here are some one-way options to popular destinations!",
+            discord.Color.blue()
+        )
+        for region_name, region_deals in board.items():
+            for deal in region_deals:
+                builder.add_field(
+                    f"{region_name} → {deal.airport_code} | 💵 ${deal.price}",
+                    f"**{deal.airline} {deal.flight_number}**\n"
+                    f"🕒 Departs {deal.departure_time} ({deal.duration} min)\n"
+                    f"🔗 [View on Google Flights]({deal.flight_url})"
+                )
+        return builder.finish(DEALS_FOOTER)
+
+
+def history_embed(departure_id: str, arrival_id: str, observations: list[dict], days: int) -> discord.Embed:
+    with metrics.timer("render"):
+        prices = [row["min_price"] for row in observations]
+        lows = history.daily_lows(observations)
+        builder = EmbedBuilder(
+            f"📈 Price history {departure_id} → {arrival_id}",
+            f"Cheapest fare seen each day over the last {days} days ({len(prices)} searches):\n"
+            f"`{history.sparkline([low for _, low in lows])}`",
+            discord.Color.blue()
+        )
+        builder.add_field(
+            "Summary",
+            f"Lowest: **${min(prices)}** • Median: **${round(statistics.median(prices))}** • "
+            f"Latest: **${prices[-1]}** • Highest: ${max(prices)}"
+        )
+        cheapest = sorted(observations, key=lambda row: row["min_price"])[:3]
+        builder.add_field(
+            "Cheapest trips seen",
+            "\n".join(
+                f"${row['min_price']} • leaving {row['outbound_date']}"
+                + (f" for {row['trip_length']} days" if row.get("trip_length") is not None else " (one-way)")
+                + f" • seen {str(row['observed_at'])[:10]}"
+                for row in cheapest
+            )
+        )
+        return builder.finish(FLIGHTS_FOOTER)
+
+
+def matrix_embed(result, max_price: int) -> discord.Embed:
+    # Price calendar: one row per departure date, one column per trip length
+    with metrics.timer("render"):
+        header = "Depart   " + "".join(f"{f'{n}d':>7}" for n in result.lengths)
+        lines = [header]
+        for d in result.dates:
+            row = f"{d.strftime('%b %d'):<9}"
+            for length in result.lengths:
+                if (d, length) not in result.cells:
+                    cell = "·"
+                elif result.cells[(d, length)] is None:
+                    cell = "—"
+                else:
+                    cell = f"${result.cells[(d, length)]}"
+                row += f"{cell:>7}"
+            lines.append(row)
+        calendar = "```\n" + "\n".join(lines) + "\n```"
+
+        best = result.best()
+        under = [cell for cell in best if cell[2] <= max_price]
+        builder = EmbedBuilder(
+            f"📅 Cheapest dates {result.departure_id} → {result.arrival_id}",
+            clip(calendar, MAX_DESCRIPTION - 200) + "\n· not searched • — no flights",
+            discord.Color.green() if under else discord.Color.orange()
+        )
+        for outbound, length, price in best:
+            return_date = outbound + timedelta(days=length)
+            builder.add_field(
+                f"💵 ${price} | {outbound.isoformat()} → {return_date.isoformat()} ({length} days)",
+                f"`!lookup_flight {result.departure_id} {result.arrival_id} {outbound.isoformat()} {return_date.isoformat()} {max_price}`"
+            )
+        stale = f" • {result.stale} older prices (live search unavailable)" if result.stale else ""
+        skipped = f" • {result.cancelled} skipped, out of time" if result.cancelled else ""
+        return builder.finish(f"{result.searches} live searches • {result.cached} from cache{stale}{skipped} • {FLIGHTS_FOOTER}")
+
+
+def anywhere_embed(result, limit: int = 10) -> discord.Embed:
+    # Ranked cheapest destinations for one !anywhere search
+    with metrics.timer("render"):
+        trip = f"{result.outbound_date} → {result.return_date}" if result.return_date else f"one-way on {result.outbound_date}"
+        builder = EmbedBuilder(
+            f"🌍 Cheapest from {result.origin} to {result.group}",
+            f"Ranked by price, {trip}:",
+            discord.Color.green()
+        )
+        for rank, fare in enumerate(result.fares[:limit], start=1):
+            offer = fare.offer
+            first_leg = offer.legs[0] if offer.legs else None
+            airline = f"**{first_leg.airline} {first_leg.flight_number}** • " if first_leg else ""
+            stops = max(0, len(offer.legs) - 1)
+            builder.add_field(
+                f"{rank}. {result.origin} → {fare.destination} | 💵 ${fare.price}",
+                f"{airline}{offer.total_duration} min • {stops} stop{'s' if stops != 1 else ''}\n"
+                f"🔗 [View on Google Flights]({fare.google_flights_url or 'https://www.google.com/travel/flights'})"
+            )
+        footer = f"{result.searched} live searches • {result.cached} from cache"
+        if result.cancelled:
+            footer += f" • {result.cancelled} skipped once we had enough"
+        if result.stale:
+            footer += f" • {result.stale} older prices (live search unavailable)"
+        return builder.finish(f"{footer} • {FLIGHTS_FOOTER}")
@@ -0,0 +1,169 @@
+import heapq
+import logging
+import time
+from datetime import date, datetime
+
+import metrics
+from alerts import check_rows
+from config import env_float, env_int
+from fingerprints import fingerprints
+from quota import BACKGROUND, quota
+from tracking_index import route_key, tracking
+
+log = logging.getLogger(__name__)
+
+# How many unique routes we check per minute, the steady background load on SerpAPI
+CHECKS_PER_MINUTE = env_int("CHECKS_PER_MINUTE", 2, minimum=1)
+# A calm route (far away, far from anyone's price) is re-checked this often...
+MAX_CHECK_INTERVAL_HOURS = env_float("MAX_CHECK_INTERVAL_HOURS", 168, minimum=0)
+# ...and an urgent one (close departure, price right at the threshold) this often
+MIN_CHECK_INTERVAL_HOURS = env_float("MIN_CHECK_INTERVAL_HOURS", 6, minimum=0)
+
+
+def _parse_time(value) -> float:
+    if not value:
+        return 0.0
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def check_interval_hours(row: dict, today: date | None = None, backoff: bool = True) -> float:
+    # Departures in the next couple of months get checked more often
+    today = today or date.today()
+    days_left = (date.fromisoformat(str(row["outbound_date"])[:10]) - today).days
+    departure_factor = min(1.0, max(0.1, days_left / 60))
+
+    # So does a route whose last price was close to (or under) the user's max price
+    closeness_factor = 1.0
+    last_price = row.get("last_price")
+    if last_price is not None and row.get("max_price"):
+        over = last_price / row["max_price"] - 1
+        closeness_factor = min(1.0, max(0.2, over / 0.5))
+
+    hours = max(MIN_CHECK_INTERVAL_HOURS, MAX_CHECK_INTERVAL_HOURS * departure_factor * closeness_factor)
+
+    # A route that keeps returning the same offers far above this row's price can wait
+    # longer, up to MAX_CHECK_INTERVAL_HOURS or a quarter of the time left before departure
+    factor = fingerprints.backoff(row) if backoff else 1
+    if factor > 1:
+        hours = max(hours, min(hours * factor, MAX_CHECK_INTERVAL_HOURS, days_left * 24 / 4))
+    return hours
+
+
+def next_check_at(row: dict) -> float:
+    # Never-checked rows come first, everything else is due one interval after its last check
+    return _parse_time(row.get("last_checked")) + check_interval_hours(row) * 3600
+
+
+def searches_deferred(rows: list[dict]) -> int:
+    # Rough count of searches the backoff saves before these rows' routes come due again.
+    # A route is searched at the pace of its most urgent row, with and without the backoff
+    plain, backed_off = {}, {}
+    for row in rows:
+        key = route_key(row)
+        plain[key] = min(plain.get(key, float("inf")), check_interval_hours(row, backoff=False))
+        backed_off[key] = min(backed_off.get(key, float("inf")), check_interval_hours(row))
+    saved = sum(round(backed_off[key] / plain[key]) - 1 for key in plain)
+    metrics.incr("alerts.searches_deferred", saved)
+    return saved
+
+'''
+Continuous price monitoring. Every pending FlightTracking row sits in a min-heap keyed on
+when it is next due, and each tick checks the most overdue routes at a steady
+CHECKS_PER_MINUTE. Due times are derived from columns we persist (last_checked,
+last_price, outbound_date, max_price), so the queue rebuilds itself after a restart.
+The heap is built from the tracking index on the first tick, and sync() adds the rows
+other processes created since.
+'''
+class PriceCheckScheduler:
+    def __init__(self):
+        self._heap = []        # (due_at, row id), may hold stale entries
+        self._due = {}         # row id -> current due_at, the source of truth for the heap
+        self._built = False
+
+    def _push(self, row: dict, due_at: float | None = None):
+        due_at = next_check_at(row) if due_at is None else due_at
+        self._due[row["id"]] = due_at
+        heapq.heappush(self._heap, (due_at, row["id"]))
+
+    @property
+    def rows(self) -> dict:
+        # The tracking index owns the rows, we only keep the due times
+        return tracking.by_id
+
+    def _schedule(self, rows):
+        today = date.today().isoformat()
+        for row in rows:
+            if str(row["outbound_date"])[:10] >= today:
+                self._push(row)
+
+    async def rebuild(self):
+        if not tracking.loaded:
+            await tracking.load()
+        self._heap = []
+        self._due = {}
+        self._schedule(self.rows.values())
+        self._built = True
+        log.info("scheduler loaded rows=%d", len(self._due))
+
+    async def sync(self):
+        # New rows get a due time, alerted ones drop out. Rows already scheduled keep theirs,
+        # this process's own checks are what moves them
+        added, removed = await tracking.sync()
+        if not self._built:
+            return
+        for row_id in removed:
+            self._due.pop(row_id, None)
+        self._schedule(added)
+
+    def _pop_due(self, now: float) -> list[dict]:
+        # Most overdue first, stop once we have CHECKS_PER_MINUTE unique routes
+        routes = set()
+        due = []
+        while self._heap and len(routes) < CHECKS_PER_MINUTE:
+            due_at, row_id = self._heap[0]
+            if due_at > now:
+                break
+            heapq.heappop(self._heap)
+            row = self.rows.get(row_id)
+            if row is None or row.get("alert_sent") or self._due.get(row_id) != due_at:
+                continue  # deleted, alerted or rescheduled since this entry was pushed
+            routes.add(route_key(row))
+            due.append(row)
+
+        # Everyone else on those routes gets checked by the same search for free
+        picked = {row["id"] for row in due}
+        for key in routes:
+            due += [row for row in tracking.for_route(key) if row["id"] not in picked and not row.get("alert_sent")]
+        return due
+
+    async def tick(self, notify) -> dict | None:
+        if not self._built:
+            await self.rebuild()
+
+        if quota.over_budget(BACKGROUND):
+            log.info("scheduler paused, background API budget used up")
+            return None
+
+        due = self._pop_due(time.time())
+        if not due:
+            return None
+
+        checked_before = {row["id"]: row.get("last_checked") for row in due}
+        stats = await check_rows(due, notify)
+        rescheduled = []
+        for row in due:
+            if row.get("alert_sent"):
+                self._due.pop(row["id"], None)
+            elif row["id"] not in self.rows:
+                continue
+            elif row.get("last_checked") == checked_before[row["id"]]:
+                # The search failed, try this route again in an hour instead of every tick
+                self._push(row, time.time() + 3600)
+            else:
+                self._push(row)
+                rescheduled.append(row)
+        stats["searches_deferred"] = searches_deferred(rescheduled)
+        return stats
+
+
+scheduler = PriceCheckScheduler()
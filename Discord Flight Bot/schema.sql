@@ -0,0 +1,139 @@
+-- Tables and columns the bot relies on beyond the original FlightTracking,
+-- UserSetting and TodaysDeals tables. Run once in the Supabase SQL editor.
+
+alter table "FlightTracking" add column if not exists last_price integer;
+
+alter table "TodaysDeals" add column if not exists home_airport text;
+alter table "TodaysDeals" add column if not exists airline text;
+alter table "TodaysDeals" add column if not exists flight_number text;
+alter table "TodaysDeals" add column if not exists departure_time text;
+alter table "TodaysDeals" add column if not exists duration integer;
+create index if not exists todays_deals_created_at_idx on "TodaysDeals" (created_at);
+
+-- Durable tier of the fare cache
+create table if not exists "FareCache" (
+    cache_key text primary key,
+    results jsonb not null,
+    expires_at timestamptz not null
+);
+
+-- SerpAPI calls and cache hits per day and feature
+create table if not exists "ApiUsage" (
+    day date not null,
+    feature text not null,
+    calls integer not null default 0,
+    cache_hits integer not null default 0,
+    primary key (day, feature)
+);
+
+-- Append-only price observations, one row per upstream search
+create table if not exists "PriceHistory" (
+    id bigint generated always as identity primary key,
+    departure_id char(3) not null,
+    arrival_id char(3) not null,
+    outbound_date date,
+    trip_length smallint,
+    min_price integer not null,
+    observed_at timestamptz not null default now()
+);
+create index if not exists price_history_route_idx on "PriceHistory" (departure_id, arrival_id, observed_at);
+
+-- Where a user's alerts go: null/'channel' for the shared alerts channel, 'dm', or
+-- 'here' for the channel in alert_channel_id
+alter table "UserSetting" add column if not exists alert_delivery text;
+alter table "UserSetting" add column if not exists alert_channel_id text;
+
+-- Every bot process caches UserSetting rows and listens for changes through Supabase
+-- realtime (our LISTEN/NOTIFY), which only sees tables in this publication
+do $$
+begin
+    if not exists (
+        select 1 from pg_publication_tables
+        where pubname = 'supabase_realtime' and schemaname = 'public' and tablename = 'UserSetting'
+    ) then
+        alter publication supabase_realtime add table "UserSetting";
+    end if;
+end $$;
+
+-- One row per alert the dispatcher tried to deliver
+create table if not exists "AlertDelivery" (
+    id bigint generated always as identity primary key,
+    tracking_id bigint,
+    user_id text not null,
+    kind text not null,
+    destination text not null,
+    status text not null,
+    message_id text,
+    attempts smallint not null default 1,
+    created_at timestamptz not null default now()
+);
+
+-- Worker mode (worker.py): claims and due times so several processes can check
+-- disjoint routes. A claim is a lease, rows of a crashed worker free up once it expires
+alter table "FlightTracking" add column if not exists next_check_at timestamptz;
+alter table "FlightTracking" add column if not exists claimed_by text;
+alter table "FlightTracking" add column if not exists claimed_until timestamptz;
+create index if not exists flight_tracking_route_idx on "FlightTracking" (departure_id, arrival_id) where alert_sent = false;
+-- !my_flights pages through a user's active rows by id
+create index if not exists flight_tracking_user_idx on "FlightTracking" (user_id, id) where alert_sent = false;
+
+-- The tracking index in each bot process only re-reads rows changed since its last sync
+alter table "FlightTracking" add column if not exists updated_at timestamptz not null default now();
+create index if not exists flight_tracking_updated_idx on "FlightTracking" (updated_at);
+create or replace function touch_updated_at() returns trigger
+language plpgsql as $$
+begin
+    new.updated_at = now();
+    return new;
+end $$;
+drop trigger if exists flight_tracking_touch on "FlightTracking";
+create trigger flight_tracking_touch before update on "FlightTracking"
+    for each row execute function touch_updated_at();
+
+-- Claims up to max_routes due routes (departure, arrival, trip length) with every active
+-- row on them, so the whole route is checked by one search in one worker. A route is
+-- taken with a transaction level advisory lock and its rows with FOR UPDATE SKIP LOCKED,
+-- so concurrent claims never wait on each other or split a route between workers.
+-- With shards > 1 a worker only sees routes that hash to its shard, so a route keeps
+-- landing in the same process. Rows no worker has released yet are due 6 hours
+-- (MIN_CHECK_INTERVAL_HOURS) after last_checked
+create or replace function claim_due_routes(worker text, max_routes int, lease_seconds int, shard int default 0, shards int default 1)
+returns setof "FlightTracking"
+language plpgsql as $$
+begin
+    return query
+    with due_routes as materialized (
+        select departure_id, arrival_id, return_date::date - outbound_date::date as trip_length,
+               min(coalesce(next_check_at, last_checked + interval '6 hours', '-infinity')) as due_at
+        from "FlightTracking"
+        where alert_sent = false
+          and outbound_date::date >= current_date
+          and coalesce(next_check_at, last_checked + interval '6 hours', '-infinity') <= now()
+          and (claimed_until is null or claimed_until < now())
+        group by 1, 2, 3
+        order by due_at
+    ), chosen as (
+        select departure_id, arrival_id, trip_length
+        from due_routes
+        where (shards <= 1 or abs(hashtext(departure_id || arrival_id || trip_length::text)) % shards = shard)
+          and pg_try_advisory_xact_lock(hashtext(departure_id || arrival_id || trip_length::text))
+        limit max_routes
+    ), picked as (
+        -- Rows claimed by a worker that committed after this statement started are re-checked
+        -- against claimed_until here and dropped
+        select t.id
+        from "FlightTracking" t
+        join chosen r
+          on t.departure_id = r.departure_id
+         and t.arrival_id = r.arrival_id
+         and t.return_date::date - t.outbound_date::date = r.trip_length
+        where t.alert_sent = false
+          and (t.claimed_until is null or t.claimed_until < now())
+        for update of t skip locked
+    )
+    update "FlightTracking" t
+    set claimed_by = worker, claimed_until = now() + make_interval(secs => lease_seconds)
+    from picked
+    where t.id = picked.id
+    returning t.*;
+end $$;
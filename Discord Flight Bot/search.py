@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import random
+import time
+
+import metrics
+from config import env_float, env_int
+from quota import BACKGROUND, INTERACTIVE, quota
+from services import services
+
+log = logging.getLogger(__name__)
+
+# Seconds per attempt and retries after a failed attempt, per priority class. Commands give
+# up sooner so nobody waits long on a struggling upstream, background checks can wait
+SEARCH_POLICY = {
+    INTERACTIVE: (env_float("SEARCH_TIMEOUT_INTERACTIVE", 12, minimum=0), env_int("SEARCH_RETRIES_INTERACTIVE", 1, minimum=0)),
+    BACKGROUND: (env_float("SEARCH_TIMEOUT_BACKGROUND", 40, minimum=0), env_int("SEARCH_RETRIES_BACKGROUND", 3, minimum=0)),
+}
+# Backoff before retry n is SEARCH_BACKOFF_SECONDS * 2^n with full jitter, capped
+SEARCH_BACKOFF_SECONDS = env_float("SEARCH_BACKOFF_SECONDS", 0.5, minimum=0)
+SEARCH_BACKOFF_MAX_SECONDS = env_float("SEARCH_BACKOFF_MAX_SECONDS", 8, minimum=0)
+# This many failures in a row opens the circuit, calls then fail fast for BREAKER_RESET_SECONDS
+BREAKER_FAILURES = env_int("BREAKER_FAILURES", 5, minimum=1)
+BREAKER_RESET_SECONDS = env_float("BREAKER_RESET_SECONDS", 60, minimum=0)
+
+
+class UpstreamError(Exception):
+    # A failure worth retrying: timeout, connection error, 429 or 5xx
+    pass
+
+
+class UpstreamUnavailable(UpstreamError):
+    # The circuit is open, SerpAPI wasn't called at all
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def _probing(self) -> bool:
+        # A probe that never reported back (e.g. it was cancelled) stops counting after a while
+        return self._probe_started is not None and time.monotonic() - self._probe_started < self.reset_seconds
+
+    def check(self):
+        # Raises while open. Once the reset time has passed a single probe call is let through
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing()):
+            metrics.incr("search.breaker_rejected")
+            raise UpstreamUnavailable("flight search is temporarily unavailable")
+        if state == "half_open":
+            self._probe_started = time.monotonic()
+
+    def record_success(self):
+        if self.opened_at is not None:
+            log.info("circuit closed, upstream recovered")
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._probe_started is not None or (self.opened_at is None and self.consecutive_failures >= self.failures):
+            log.warning("circuit opened failures=%d reset_seconds=%s", self.consecutive_failures, self.reset_seconds)
+            metrics.incr("search.breaker_opened")
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+
+breaker = CircuitBreaker()
+
+
+def _blocking_search(params: dict, timeout: float) -> dict:
+    # Runs on a search_executor thread. serpapi pulls in requests, so it is only imported
+    # once the first search actually happens
+    import requests
+    from serpapi import GoogleSearch
+
+    # GoogleSearch writes extra keys into the dict it gets, so hand it a copy. Its default
+    # timeout is effectively none, and it never looks at the status code
+    client = GoogleSearch(dict(params))
+    client.timeout = timeout
+    if services.settings.serpapi_backend:
+        # SERPAPI_BACKEND points the bot at another host, e.g. the harness's fake server
+        client.BACKEND = services.settings.serpapi_backend
+    client.params_dict["output"] = "json"
+    try:
+        response = client.get_response()
+    except requests.RequestException as e:
+        raise UpstreamError(f"{type(e).__name__}: {e}") from e
+    if response.status_code == 429 or response.status_code >= 500:
+        raise UpstreamError(f"SerpAPI returned HTTP {response.status_code}")
+    try:
+        return response.json()
+    except ValueError as e:
+        raise UpstreamError(f"SerpAPI returned a non JSON response (HTTP {response.status_code})") from e
+
+
+def backoff_seconds(attempt: int) -> float:
+    return random.uniform(0, min(SEARCH_BACKOFF_MAX_SECONDS, SEARCH_BACKOFF_SECONDS * 2 ** attempt))
+
+'''
+Awaitable SerpAPI search. Each attempt first waits its turn with the quota manager (the
+user's own rate limit is charged once, by the first attempt), then
+the HTTP round trip happens on a worker thread so the bot keeps answering heartbeats
+and other users' commands while it waits. Timeouts, connection errors, 429s and 5xx are
+retried with backoff; once they keep happening the circuit breaker opens and calls fail
+fast with UpstreamUnavailable (the fare cache then falls back to stale results).
+SerpAPI answers like "no results" or a bad parameter come back as a normal dict.
+'''
+async def search_flights(params: dict, user_id: str | None = None, priority: int = INTERACTIVE, feature: str = "other") -> dict:
+    timeout, retries = SEARCH_POLICY.get(priority, SEARCH_POLICY[BACKGROUND])
+    loop = asyncio.get_running_loop()
+    for attempt in range(retries + 1):
+        breaker.check()
+        with metrics.timer("quota_wait"):
+            # Retries take key and global tokens only, an upstream failure shouldn't eat into the user's own limit
+            await quota.acquire(user_id=user_id if attempt == 0 else None, priority=priority, feature=feature)
+        slots = services.search_slots
+        with metrics.timer("search_queue"):
+            await slots.acquire()
+        try:
+            with metrics.timer("search"):
+                # A thread is free now, so the timeout only covers the request itself. The thread
+                # times out on its own too, wait_for just makes sure we don't wait longer
+                results = await asyncio.wait_for(loop.run_in_executor(services.search_executor, _blocking_search, params, timeout), timeout + 1)
+        except (UpstreamError, asyncio.TimeoutError) as e:
+            error = e
+        else:
+            breaker.record_success()
+            return results
+        finally:
+            # Free the thread before any backoff sleep
+            slots.release()
+
+        breaker.record_failure()
+        if attempt == retries:
+            raise UpstreamError(str(error) or "SerpAPI timed out") from error
+        delay = backoff_seconds(attempt)
+        metrics.incr("search.retries")
+        log.warning("search failed, retrying attempt=%d delay=%.2fs feature=%s error=%s", attempt + 1, delay, feature, error)
+        await asyncio.sleep(delay)
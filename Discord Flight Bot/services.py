@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Settings, env_int
+
+log = logging.getLogger(__name__)
+
+# Max number of SerpAPI requests in flight at once, shared by every command and job
+SEARCH_CONCURRENCY = env_int("SEARCH_CONCURRENCY", 8, minimum=1)
+
+'''
+Lazily built process-wide singletons: the validated settings, the SerpAPI worker pool and
+the async Supabase client. Nothing here is created (or even imported, in the case of the
+supabase package) until first use, so importing any bot module stays cheap and works
+without credentials. The harness and other tooling swap in stand-ins with override().
+'''
+class Services:
+    def __init__(self):
+        self._settings = None
+        self._search_executor = None
+        self._search_slots = None
+        self._supabase = None
+        self._supabase_lock = None
+
+    @property
+    def settings(self) -> Settings:
+        if self._settings is None:
+            self._settings = Settings.from_env()
+        return self._settings
+
+    @property
+    def search_executor(self) -> ThreadPoolExecutor:
+        # GoogleSearch uses blocking requests under the hood, so every call runs on this
+        # bounded pool instead of on the Discord event loop
+        if self._search_executor is None:
+            self._search_executor = ThreadPoolExecutor(max_workers=SEARCH_CONCURRENCY, thread_name_prefix="serpapi")
+        return self._search_executor
+
+    @property
+    def search_slots(self) -> asyncio.Semaphore:
+        # One slot per executor thread. Searches take a slot before their timeout starts, so
+        # time spent queued behind other searches is never mistaken for a slow upstream
+        if self._search_slots is None:
+            self._search_slots = asyncio.Semaphore(SEARCH_CONCURRENCY)
+        return self._search_slots
+
+    async def supabase(self):
+        # The async client has to be built inside a running loop, so create it on first use
+        if self._supabase is None:
+            if self._supabase_lock is None:
+                self._supabase_lock = asyncio.Lock()
+            async with self._supabase_lock:
+                if self._supabase is None:
+                    settings = self.settings
+                    settings.require("supabase_url", "supabase_key")
+                    from supabase import acreate_client
+                    self._supabase = await acreate_client(settings.supabase_url, settings.supabase_key)
+                    log.info("supabase client created")
+        return self._supabase
+
+    def override(self, settings: Settings | None = None, supabase=None, search_executor: ThreadPoolExecutor | None = None):
+        if settings is not None:
+            self._settings = settings
+        if supabase is not None:
+            self._supabase = supabase
+        if search_executor is not None:
+            self._search_executor = search_executor
+            self._search_slots = None
+
+    def close(self):
+        if self._search_executor is not None:
+            self._search_executor.shutdown(wait=False, cancel_futures=True)
+            self._search_executor = None
+            self._search_slots = None
+
+
+services = Services()
@@ -0,0 +1,136 @@
+import bisect
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, UTC
+
+import db
+from config import env_float, env_int
+
+log = logging.getLogger(__name__)
+
+# Rows other processes added or changed (e.g. alerts sent by workers) are read back this often
+TRACKING_SYNC_MINUTES = env_float("TRACKING_SYNC_MINUTES", 2, minimum=0.001)
+# Each sync reaches back this far before the previous one, for transactions that committed
+# late and for clock drift between this host and the database
+TRACKING_SYNC_OVERLAP_SECONDS = env_int("TRACKING_SYNC_OVERLAP_SECONDS", 300, minimum=0)
+
+
+def trip_length(row: dict) -> int:
+    outbound = datetime.fromisoformat(row["outbound_date"])
+    return_ = datetime.fromisoformat(row["return_date"])
+    return (return_ - outbound).days
+
+
+def route_key(row: dict) -> tuple:
+    # Users on the same route with the same trip length share one API call
+    return (row["departure_id"], row["arrival_id"], trip_length(row))
+
+'''
+In-process index of active (not yet alerted) FlightTracking rows by id, user and route
+key. It is loaded once at startup and kept in sync by the code paths that insert,
+alert or delete rows, so !my_flights and the alert engine don't have to read the
+whole table on every request. Changes made by other processes are picked up by sync(),
+which only reads the rows whose updated_at moved since the last one. Rows are only ever
+deleted through !delete_flight in the gateway, which removes them here directly.
+A row whose alert is queued or delivered but whose alert_sent isn't stored yet is kept
+out of the index, by load() and sync() too, until the database has it or delivery fails.
+The row dicts are shared with the scheduler, so in-place updates show up everywhere.
+'''
+class TrackingIndex:
+    def __init__(self):
+        self.by_id = {}
+        self.by_user = defaultdict(set)
+        self.by_route = defaultdict(set)
+        self.loaded = False
+        self._synced_at = None
+        self._alerting = set()      # ids with an alert on its way, see alerting()
+
+    async def load(self):
+        started = datetime.now(UTC)
+        rows = await db.list_pending_alerts()
+        self.by_id = {}
+        self.by_user = defaultdict(set)
+        self.by_route = defaultdict(set)
+        for row in rows:
+            if row["id"] not in self._alerting:
+                self._add(row)
+        self.loaded = True
+        self._synced_at = started
+        log.info("tracking index loaded rows=%d", len(self.by_id))
+
+    async def sync(self) -> tuple[list[dict], list]:
+        # Applies rows changed since the last load or sync, returns (new rows, removed ids)
+        if not self.loaded:
+            await self.load()
+            return self.pending(), []
+        started = datetime.now(UTC)
+        since = self._synced_at - timedelta(seconds=TRACKING_SYNC_OVERLAP_SECONDS)
+        changed = await db.list_tracking_changed(since.isoformat())
+        added, removed = [], []
+        for fresh in changed:
+            row = self.by_id.get(fresh["id"])
+            if fresh.get("alert_sent"):
+                self._alerting.discard(fresh["id"])
+                if row is not None:
+                    self.remove(fresh["id"])
+                    removed.append(fresh["id"])
+            elif fresh["id"] in self._alerting:
+                continue    # alerted here, alert_sent isn't written yet
+            elif row is None:
+                self._add(fresh)
+                added.append(fresh)
+            else:
+                row.update(fresh)
+        self._synced_at = started
+        log.info("tracking index synced changed=%d added=%d removed=%d", len(changed), len(added), len(removed))
+        return added, removed
+
+    def _add(self, row: dict):
+        self.by_id[row["id"]] = row
+        self.by_user[str(row["user_id"])].add(row["id"])
+        self.by_route[route_key(row)].add(row["id"])
+
+    def add(self, row: dict):
+        if not row or row.get("alert_sent") or row.get("id") is None:
+            return
+        self.remove(row["id"])
+        self._add(row)
+
+    def alerting(self, row_id):
+        # The row's alert is queued: it leaves the index and stays out until a sync reads
+        # alert_sent back from the database, or reopen() puts it back after a failed delivery
+        self.remove(row_id)
+        self._alerting.add(row_id)
+
+    def reopen(self, row: dict):
+        self._alerting.discard(row["id"])
+        row["alert_sent"] = False
+        self.add(row)
+
+    def remove(self, row_id):
+        self._alerting.discard(row_id)
+        row = self.by_id.pop(row_id, None)
+        if row is None:
+            return
+        self.by_user[str(row["user_id"])].discard(row_id)
+        if not self.by_user[str(row["user_id"])]:
+            del self.by_user[str(row["user_id"])]
+        key = route_key(row)
+        self.by_route[key].discard(row_id)
+        if not self.by_route[key]:
+            del self.by_route[key]
+
+    def user_page(self, user_id: str, after_id=None, limit: int = 10) -> list[dict]:
+        # Same keyset order as db.list_user_tracking_page
+        ids = sorted(self.by_user.get(str(user_id), ()))
+        start = 0 if after_id is None else bisect.bisect_right(ids, after_id)
+        return [self.by_id[row_id] for row_id in ids[start:start + limit]]
+
+    def for_route(self, key: tuple) -> list[dict]:
+        return [self.by_id[row_id] for row_id in self.by_route.get(key, ())]
+
+    def pending(self) -> list[dict]:
+        return list(self.by_id.values())
+
+
+tracking = TrackingIndex()
@@ -0,0 +1,161 @@
+import logging
+import time
+from collections import OrderedDict
+
+import db
+import metrics
+from config import env_int
+from services import services
+
+log = logging.getLogger(__name__)
+
+# How many users' settings we keep in memory before evicting the least recently used
+USER_SETTINGS_CACHE_SIZE = env_int("USER_SETTINGS_CACHE_SIZE", 10000, minimum=1)
+# Seconds an entry is trusted. Changes from other processes normally arrive within a second
+# through realtime, this only bounds how stale an entry gets while that feed is down
+USER_SETTINGS_TTL = env_int("USER_SETTINGS_TTL", 3600, minimum=0)
+
+# What a user who never ran !set_home or !alerts_to gets. Cached too, so asking again is free
+DEFAULT_SETTINGS = {"home_airport": None, "alert_delivery": None, "alert_channel_id": None}
+
+'''
+In-process cache of UserSetting rows. Reads fill it (one query for any number of missing
+users), !set_home and !alerts_to write through it, and every process subscribes to
+Supabase realtime changes on UserSetting (the hosted stand-in for Postgres LISTEN/NOTIFY,
+see schema.sql) so a change made by the gateway shows up in the workers right away.
+Whenever the feed (re)connects everything cached is dropped, since changes made while it
+was down were missed. Entries are plain dicts shared with callers, treat them as read-only.
+'''
+class UserSettingsCache:
+    def __init__(self, max_entries: int = USER_SETTINGS_CACHE_SIZE, ttl: int = USER_SETTINGS_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # user_id -> (expires_at, settings)
+        self._version = 0               # bumped on every invalidation, see get_many
+        self._channel = None
+        self.live = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _peek(self, user_id: str) -> dict | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, settings = entry
+        if expires_at <= time.time():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return settings
+
+    def _store(self, user_id: str, row: dict) -> dict:
+        settings = {key: row.get(key) for key in DEFAULT_SETTINGS}
+        self._entries[user_id] = (time.time() + self.ttl, settings)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return settings
+
+    def invalidate(self, user_id: str | None = None):
+        # One user, or everyone when user_id is None
+        self._version += 1
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(str(user_id), None)
+
+    async def get_many(self, user_ids) -> dict[str, dict]:
+        found, missing = {}, []
+        for user_id in dict.fromkeys(str(u) for u in user_ids):
+            settings = self._peek(user_id)
+            if settings is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = settings
+        metrics.incr("user_settings.hits", len(found))
+        if not missing:
+            return found
+
+        metrics.incr("user_settings.misses", len(missing))
+        version = self._version
+        rows = {row["user_id"]: row for row in await db.list_user_settings(missing)}
+        # Anything invalidated while the query ran may be older than the change, don't cache it
+        keep = version == self._version
+        for user_id in missing:
+            row = rows.get(user_id, DEFAULT_SETTINGS)
+            found[user_id] = self._store(user_id, row) if keep else {key: row.get(key) for key in DEFAULT_SETTINGS}
+        return found
+
+    async def get(self, user_id) -> dict:
+        user_id = str(user_id)
+        settings = self._peek(user_id)
+        if settings is not None:
+            metrics.incr("user_settings.hits")
+            return settings
+        return (await self.get_many([user_id]))[user_id]
+
+    async def home_airport(self, user_id) -> str | None:
+        return (await self.get(user_id))["home_airport"]
+
+    # ---------- write-through ----------
+
+    async def _write(self, user_id: str, write):
+        # The upsert returns the whole row, which becomes the cached entry. Reads that
+        # overlapped the write may have seen the old row, invalidating keeps them out of the cache
+        self.invalidate(user_id)
+        row = await write
+        self.invalidate(user_id)
+        if row:
+            self._store(user_id, row)
+
+    async def set_home_airport(self, user_id, home_airport: str):
+        user_id = str(user_id)
+        await self._write(user_id, db.set_home_airport(user_id, home_airport))
+
+    async def set_alert_delivery(self, user_id, delivery: str, channel_id: str | None = None):
+        user_id = str(user_id)
+        await self._write(user_id, db.set_alert_delivery(user_id, delivery, channel_id))
+
+    # ---------- cross-process invalidation ----------
+
+    def _on_change(self, payload: dict):
+        data = payload.get("data") or {}
+        record = data.get("record") or {}
+        user_id = record.get("user_id") or (data.get("old_record") or {}).get("user_id")
+        if not user_id:
+            # Can't tell whose row changed, start over
+            self.invalidate()
+        elif data.get("type") in ("INSERT", "UPDATE") and record:
+            # The change carries the whole row, no need to read it back
+            self._version += 1
+            self._store(str(user_id), record)
+        else:
+            self.invalidate(user_id)
+        metrics.incr("user_settings.remote_changes")
+
+    def _on_state(self, state, error=None):
+        state = getattr(state, "value", state)
+        if state == "SUBSCRIBED":
+            self.invalidate()
+            self.live = True
+            log.info("user settings changes feed connected")
+        else:
+            self.live = False
+            log.warning("user settings changes feed lost, relying on the TTL state=%s error=%s", state, error)
+
+    async def listen(self):
+        # Call once per process after the loop is running. Without realtime (a local
+        # PostgREST, the harness) entries simply expire after USER_SETTINGS_TTL
+        if self._channel is not None:
+            return
+        try:
+            client = await services.supabase()
+            channel = client.channel("user-settings")
+            channel.on_postgres_changes("*", callback=self._on_change, table="UserSetting", schema="public")
+            self._channel = await channel.subscribe(self._on_state)
+        except Exception as e:
+            log.warning("could not subscribe to user settings changes, relying on the TTL error=%s", e)
+
+
+user_settings = UserSettingsCache()
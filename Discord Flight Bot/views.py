@@ -0,0 +1,148 @@
+import logging
+import math
+
+import db
+import discord
+import metrics
+import render
+from config import env_float, env_int
+from models import Offer
+from tracking_index import tracking
+
+log = logging.getLogger(__name__)
+
+# Seconds a paged message keeps its buttons after the last click
+PAGE_TIMEOUT_SECONDS = env_float("PAGE_TIMEOUT_SECONDS", 180, minimum=0)
+# Rows per !my_flights page, comfortably under Discord's 25 fields per embed
+TRACKING_PER_PAGE = env_int("TRACKING_PER_PAGE", 10, minimum=1)
+# Offers per !lookup_flight page
+OFFERS_PER_PAGE = env_int("OFFERS_PER_PAGE", 3, minimum=1)
+
+'''
+A page source builds one embed at a time, only when that page is shown. page(index)
+returns the embed (None when there is nothing on that page) and whether a next page exists.
+'''
+class PageSource:
+    async def page(self, index: int) -> tuple[discord.Embed | None, bool]:
+        raise NotImplementedError
+
+
+class OfferPages(PageSource):
+    # Offers we already have in memory (from the fare cache), formatted a page at a time
+    def __init__(self, title: str, description: str, color: discord.Color, route, offers: list[Offer], g_url: str = "", per_page: int = OFFERS_PER_PAGE):
+        self.title = title
+        self.description = description
+        self.color = color
+        self.route = route
+        self.offers = offers
+        self.g_url = g_url
+        self.per_page = per_page
+        self.pages = max(1, math.ceil(len(offers) / per_page))
+
+    async def page(self, index: int) -> tuple[discord.Embed | None, bool]:
+        start = index * self.per_page
+        chunk = self.offers[start:start + self.per_page]
+        if not chunk:
+            return None, False
+        footer = render.page_footer(index, self.pages, render.FLIGHTS_FOOTER) if self.pages > 1 else render.FLIGHTS_FOOTER
+        embed = render.flights_embed(self.title, self.description, self.color, self.route, chunk, self.g_url,
+                                     limit=self.per_page, footer=footer)
+        return embed, index + 1 < self.pages
+
+
+class TrackingPages(PageSource):
+    # A user's active FlightTracking rows in id order, read one page at a time by keyset
+    # (never with an offset) from the tracking index, or from Supabase before it is loaded
+    def __init__(self, user_id: str, per_page: int = TRACKING_PER_PAGE):
+        self.user_id = user_id
+        self.per_page = per_page
+        self._after = [None]    # last id before each page reached so far
+
+    async def _rows(self, after_id, limit: int) -> list[dict]:
+        if tracking.loaded:
+            return tracking.user_page(self.user_id, after_id, limit)
+        return await db.list_user_tracking_page(self.user_id, after_id, limit)
+
+    async def page(self, index: int) -> tuple[discord.Embed | None, bool]:
+        if index >= len(self._after):
+            return None, False
+        # One extra row tells us whether there is a next page without counting
+        rows = await self._rows(self._after[index], self.per_page + 1)
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not rows:
+            return None, False
+        del self._after[index + 1:]
+        if has_next:
+            self._after.append(rows[-1]["id"])
+        return render.tracking_embed(rows, index, has_next), has_next
+
+'''
+Prev/Next buttons over a PageSource. Only whoever ran the command can flip pages, and
+the buttons are disabled once nobody has clicked for PAGE_TIMEOUT_SECONDS. Nothing but
+the current page index is kept between clicks, so a long list costs no more memory than
+a short one. Single-page results are sent as a plain embed without buttons.
+'''
+class Paginator(discord.ui.View):
+    def __init__(self, source: PageSource, author_id: int, timeout: float = PAGE_TIMEOUT_SECONDS):
+        super().__init__(timeout=timeout)
+        self.source = source
+        self.author_id = author_id
+        self.index = 0
+        self.message = None
+
+    async def start(self, ctx) -> bool:
+        # Sends the first page, False when there isn't one
+        embed, has_next = await self.source.page(0)
+        if embed is None:
+            return False
+        if not has_next:
+            self.stop()
+            await ctx.send(embed=embed)
+            return True
+        self._sync_buttons(has_next)
+        self.message = await ctx.send(embed=embed, view=self)
+        return True
+
+    def _sync_buttons(self, has_next: bool):
+        self.previous_page.disabled = self.index == 0
+        self.next_page.disabled = not has_next
+
+    async def _show(self, interaction: discord.Interaction, index: int):
+        metrics.incr("pages.flips")
+        embed, has_next = await self.source.page(index)
+        if embed is None and index:
+            # Rows were removed since the last page was drawn, start over
+            index = 0
+            embed, has_next = await self.source.page(0)
+        if embed is None:
+            self.stop()
+            await interaction.response.edit_message(content="Nothing left to show here.", embed=None, view=None)
+            return
+        self.index = index
+        self._sync_buttons(has_next)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, max(0, self.index - 1))
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.primary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.index + 1)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id == self.author_id:
+            return True
+        await interaction.response.send_message("🔒 Only the person who ran this command can change pages.", ephemeral=True)
+        return False
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message is None:
+            return
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException as e:
+            log.debug("could not disable page buttons message_id=%s error=%s", self.message.id, e)
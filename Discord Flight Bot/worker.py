@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+
+import db
+import discord
+import metrics
+from alerts import check_rows
+from batching import writes
+from config import ConfigError, configure_logging, env_float, env_int, env_str
+from notifications import dispatcher
+from quota import BACKGROUND, quota
+from scheduler import next_check_at, searches_deferred
+from services import services
+from user_settings import user_settings
+
+# Identifies this process in FlightTracking.claimed_by
+WORKER_ID = env_str("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+# How many routes one claim takes. Each is one search, run ALERT_CONCURRENCY at a time
+WORKER_ROUTES_PER_CLAIM = env_int("WORKER_ROUTES_PER_CLAIM", 8, minimum=1)
+# Claimed rows go back to the pool if this worker hasn't released them by then
+WORKER_LEASE_SECONDS = env_int("WORKER_LEASE_SECONDS", 600, minimum=1)
+# Sleep between claims when nothing is due
+WORKER_IDLE_SECONDS = env_float("WORKER_IDLE_SECONDS", 30, minimum=0)
+# Optional fixed partitioning: this worker only claims routes with hash % WORKER_SHARDS == WORKER_SHARD
+WORKER_SHARD = env_int("WORKER_SHARD", 0, minimum=0)
+WORKER_SHARDS = env_int("WORKER_SHARDS", 1, minimum=1)
+
+log = logging.getLogger("worker")
+
+'''
+Price check worker for running the bot as several processes: one `BOT_MODE=gateway python bot.py`
+for the Discord commands plus any number of `python worker.py`. Workers take due routes
+from FlightTracking with claim_due_routes (FOR UPDATE SKIP LOCKED, see schema.sql), so they
+never check the same route twice, then write the next due time back and release the rows.
+Alerts are posted through Discord's REST API, a worker never opens a gateway connection.
+Each process has its own SerpAPI token bucket, so split SERPAPI_RATE_PER_SECOND between them.
+'''
+class PriceCheckWorker:
+    def __init__(self, notify):
+        self.notify = notify
+        self.routes_checked = 0
+        self.rows_checked = 0
+
+    async def claim(self) -> list[dict]:
+        return await db.claim_due_routes(WORKER_ID, WORKER_ROUTES_PER_CLAIM, WORKER_LEASE_SECONDS, WORKER_SHARD, WORKER_SHARDS)
+
+    async def run_once(self) -> dict | None:
+        with metrics.timer("worker.claim"):
+            rows = await self.claim()
+        if not rows:
+            return None
+
+        checked_before = {row["id"]: row.get("last_checked") for row in rows}
+        stats = await check_rows(rows, self.notify)
+        released = []
+        for row in rows:
+            if row.get("alert_sent"):
+                continue
+            if row.get("last_checked") == checked_before[row["id"]]:
+                # The search failed, let anyone try this route again in an hour
+                writes.release(row["id"], time.time() + 3600)
+            else:
+                writes.release(row["id"], next_check_at(row))
+                released.append(row)
+        stats["searches_deferred"] = searches_deferred(released)
+        await writes.flush()
+
+        self.routes_checked += stats["routes"]
+        self.rows_checked += stats["rows"]
+        return stats
+
+    async def run(self):
+        log.info("worker started worker_id=%s shard=%d/%d", WORKER_ID, WORKER_SHARD, WORKER_SHARDS)
+        while True:
+            if quota.over_budget(BACKGROUND):
+                log.info("worker paused, background API budget used up")
+                await asyncio.sleep(WORKER_IDLE_SECONDS)
+                continue
+            try:
+                stats = await self.run_once()
+            except Exception as e:
+                log.error("worker run failed error=%s", e, exc_info=e)
+                stats = None
+            if stats is None:
+                await quota.flush_usage()
+                await asyncio.sleep(WORKER_IDLE_SECONDS)
+
+
+async def main():
+    settings = services.settings
+    client = discord.Client(intents=discord.Intents.none())
+    await client.login(settings.discord_token)
+    dispatcher.start(client)
+    # Alert delivery preferences come from the user settings cache, changes arrive through realtime
+    await user_settings.listen()
+
+    try:
+        await PriceCheckWorker(dispatcher.notify).run()
+    finally:
+        await dispatcher.drain()
+        await writes.flush()
+        await quota.flush_usage()
+        await client.close()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    try:
+        services.settings.require("discord_token", "alerts_channel_id", "serpapi_key", "supabase_url", "supabase_key")
+    except ConfigError as e:
+        raise SystemExit(f"❌ {e}")
+    asyncio.run(main())